@@ -0,0 +1,190 @@
+# std lib imports
+import time
+import random
+import argparse
+
+# local imports
+import constants
+import pieces
+import movetables
+import games
+
+# ------------------------ Attack Tables -------------------------------------#
+
+# Square (x, y) is x + 8 * y, the same numbering as Game's square index.
+# Directions are indices into movetables.DIRECTIONS, so the opposite of
+# direction i is i + 4 (mod 8), even ones being straight and odd ones
+# diagonal.
+
+# Sliders that move along straight (even) and diagonal (odd) directions
+_SLIDERS = [(pieces.Rook, pieces.Queen), (pieces.Bishop, pieces.Queen)]
+
+# Directions each slider moves in
+_SLIDER_DIRECTIONS = {pieces.Rook: movetables.STRAIGHT,
+                      pieces.Bishop: movetables.DIAGONAL,
+                      pieces.Queen: range(8)}
+
+RAYS = movetables.RAYS
+KNIGHT_TARGETS = movetables.KNIGHT_TARGETS
+KING_TARGETS = movetables.KING_TARGETS
+PAWN_TARGETS = movetables.PAWN_CAPTURES
+
+
+def get_targets(board, piece, square):
+    """
+
+    Squares the piece on square attacks, whoever is on them, given the
+    game's 64 square index.
+
+    """
+    piece_class = piece.__class__
+    if piece_class == pieces.Pawn:
+        return PAWN_TARGETS[piece.color][square]
+    if piece_class == pieces.Knight:
+        return KNIGHT_TARGETS[square]
+    if piece_class == pieces.King:
+        return KING_TARGETS[square]
+    targets = []
+    rays = RAYS[square]
+    for direction in _SLIDER_DIRECTIONS[piece_class]:
+        for target in rays[direction]:
+            targets.append(target)
+            if board[target]:
+                break
+    return targets
+
+
+def count_attacks(board):
+    """
+
+    Attack counts for both colors worked out from scratch from a game's 64
+    square index, in the same form as AttackMaps.counts.
+
+    """
+    counts = {constants.WHITE: [0] * 64, constants.BLACK: [0] * 64}
+    for square, piece in enumerate(board):
+        if piece:
+            color_counts = counts[piece.color]
+            for target in get_targets(board, piece, square):
+                color_counts[target] += 1
+    return counts
+
+
+# ------------------------ Attack Maps ---------------------------------------#
+
+
+class AttackMaps(object):
+    """
+
+    How many pieces of each color attack each square, as a list of 64
+    counts per color. Pins are ignored, and a square a color's own piece
+    stands on counts as attacked when it's defended.
+
+    The maps are kept in sync with the game's pieces through Game's
+    placement helpers. Only the moving piece and the slider rays that pass
+    through a square that empties or fills are recounted.
+
+    board is the game's 64 square index, which is read but never changed.
+
+    """
+    def __init__(self, board):
+        self.board = board
+        self.counts = count_attacks(board)
+
+    def _update_piece(self, piece, square, change):
+        """
+
+        Add (change 1) or take away (change -1) the piece's own attacks.
+
+        """
+        counts = self.counts[piece.color]
+        for target in get_targets(self.board, piece, square):
+            counts[target] += change
+
+    def _update_rays(self, square, change):
+        """
+
+        Give the sliders aiming at square the squares beyond it (change 1,
+        when it has just emptied) or take them away (change -1, when it has
+        just filled), up to and including the next piece.
+
+        """
+        board = self.board
+        rays = RAYS[square]
+        for direction in xrange(8):
+            for behind in rays[(direction + 4) & 7]:
+                piece = board[behind]
+                if piece:
+                    break
+            else:
+                continue
+            if not piece.__class__ in _SLIDERS[direction & 1]:
+                continue
+            counts = self.counts[piece.color]
+            for target in rays[direction]:
+                counts[target] += change
+                if board[target]:
+                    break
+
+    def add(self, piece, square):
+        """
+
+        Count a piece that has just been put on square.
+
+        """
+        self._update_rays(square, -1)
+        self._update_piece(piece, square, 1)
+
+    def remove(self, piece, square):
+        """
+
+        Stop counting a piece that has just been taken off square.
+
+        """
+        self._update_piece(piece, square, -1)
+        self._update_rays(square, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Play random games checking the attack maps against "
+                    "counts made from scratch, and time their upkeep.")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    number_of_moves = 0
+    times = {True: 0.0, False: 0.0}
+    for _ in xrange(args.games):
+        # the same moves on a game with the maps and one without
+        mapped = games.Game()
+        mapped.enable_attack_maps()
+        plain = games.Game()
+        while True:
+            moves = mapped.get_valid_moves(mapped.color_to_move)
+            if not moves or mapped.idle_move_count >= 50:
+                break
+            piece, pos = random.choice(moves)
+            from_pos = piece.pos
+            for game, has_maps in (mapped, True), (plain, False):
+                start = time.time()
+                game.unmake_move(game.make_move(game.get_piece_at(from_pos),
+                                                pos))
+                times[has_maps] += time.time() - start
+                game.make_move(game.get_piece_at(from_pos), pos)
+                game.color_to_move = not game.color_to_move
+            number_of_moves += 1
+
+            fresh = games.Game.from_fen(mapped.to_fen())
+            if mapped.get_attack_counts() != fresh.get_attack_counts():
+                raise RuntimeError("Attack maps out of sync after move %i" %
+                                   number_of_moves)
+    number_of_moves = max(number_of_moves, 1)
+    print ("%i moves checked. Making and taking back a move: %.1fus with "
+           "attack maps, %.1fus without" % (
+               number_of_moves, times[True] / number_of_moves * 1e6,
+               times[False] / number_of_moves * 1e6))
+
+if __name__ == "__main__":
+    main()
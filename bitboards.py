@@ -0,0 +1,691 @@
+# std lib imports
+# local imports
+import constants
+import pieces
+import zobrist
+
+# ------------------------ Bitboard Tables -----------------------------------#
+
+# Square (x, y) is bit x + 8 * y, the same numbering as Game's square index.
+
+# Piece type indices
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+PIECE_TYPES = {pieces.Pawn: PAWN,
+               pieces.Knight: KNIGHT,
+               pieces.Bishop: BISHOP,
+               pieces.Rook: ROOK,
+               pieces.Queen: QUEEN,
+               pieces.King: KING}
+
+SQUARE_POS = [(square & 7, square >> 3) for square in xrange(64)]
+SQUARE_BIT = [1 << square for square in xrange(64)]
+
+
+def _leaper_table(offsets):
+    """
+
+    Bitboard of the squares reachable with one of the offsets, per square.
+
+    """
+    table = []
+    for square in xrange(64):
+        x, y = SQUARE_POS[square]
+        targets = 0
+        for offset in offsets:
+            tx, ty = x + offset[0], y + offset[1]
+            if 0 <= tx <= 7 and 0 <= ty <= 7:
+                targets |= SQUARE_BIT[tx + 8 * ty]
+        table.append(targets)
+    return table
+
+
+def _ray_table(direction):
+    """
+
+    Bitboard of every square in the given direction, per square.
+
+    """
+    table = []
+    for square in xrange(64):
+        x, y = SQUARE_POS[square]
+        ray = 0
+        while True:
+            x, y = x + direction[0], y + direction[1]
+            if x < 0 or x > 7 or y < 0 or y > 7:
+                break
+            ray |= SQUARE_BIT[x + 8 * y]
+        table.append(ray)
+    return table
+
+KNIGHT_ATTACKS = _leaper_table(constants.KNIGHT_OFFSETS)
+KING_ATTACKS = _leaper_table([constants.UP, constants.UP_RIGHT,
+                              constants.RIGHT, constants.DOWN_RIGHT,
+                              constants.DOWN, constants.DOWN_LEFT,
+                              constants.LEFT, constants.UP_LEFT])
+# Squares attacked by a pawn, indexed by color then square
+PAWN_ATTACKS = {constants.WHITE: _leaper_table([(-1, 1), (1, 1)]),
+                constants.BLACK: _leaper_table([(-1, -1), (1, -1)])}
+
+# Rays are split by whether the square numbers increase along them, which
+# decides if the nearest blocker is the lowest or the highest set bit.
+ROOK_RAYS = [(_ray_table(constants.UP), True),
+             (_ray_table(constants.RIGHT), True),
+             (_ray_table(constants.DOWN), False),
+             (_ray_table(constants.LEFT), False)]
+BISHOP_RAYS = [(_ray_table(constants.UP_RIGHT), True),
+               (_ray_table(constants.UP_LEFT), True),
+               (_ray_table(constants.DOWN_RIGHT), False),
+               (_ray_table(constants.DOWN_LEFT), False)]
+
+ALL_SQUARES = (1 << 64) - 1
+
+
+def _nearest(bitboard, increasing):
+    """
+
+    Square of the set bit nearest the start of a ray.
+
+    """
+    if increasing:
+        return (bitboard & -bitboard).bit_length() - 1
+    return bitboard.bit_length() - 1
+
+
+def slider_attacks(square, occupied, rays):
+    """
+
+    Squares attacked from the square along the given rays, stopping at (and
+    including) the first occupied square on each ray.
+
+    """
+    attacks = 0
+    for table, increasing in rays:
+        ray = table[square]
+        blockers = ray & occupied
+        if blockers:
+            if increasing:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= table[blocker]
+        attacks |= ray
+    return attacks
+
+
+def iter_squares(bitboard):
+    """
+
+    Yield the square of each set bit, lowest first.
+
+    """
+    while bitboard:
+        lowest = bitboard & -bitboard
+        yield lowest.bit_length() - 1
+        bitboard ^= lowest
+
+# ------------------------ Bitboard Position ---------------------------------#
+
+
+class Bitboards(object):
+    """
+
+    Bitboard move generator for a Game. One 64-bit int per color and piece
+    type is kept in sync with the game's pieces through Game's placement
+    helpers, so make_move and unmake_move need no special handling.
+
+    Moves are returned as (piece, pos) tuples exactly like the piece list
+    backend, so the two can be used interchangeably and cross-checked.
+
+    """
+    def __init__(self, game):
+        self.game = game
+        self.boards = {constants.WHITE: [0] * 6, constants.BLACK: [0] * 6}
+        self.occupied = {constants.WHITE: 0, constants.BLACK: 0}
+        for piece in game.get_pieces():
+            self.add(piece)
+
+    def add(self, piece):
+        bit = SQUARE_BIT[piece.pos[0] + 8 * piece.pos[1]]
+        self.boards[piece.color][PIECE_TYPES[piece.__class__]] |= bit
+        self.occupied[piece.color] |= bit
+
+    def remove(self, piece):
+        bit = SQUARE_BIT[piece.pos[0] + 8 * piece.pos[1]]
+        self.boards[piece.color][PIECE_TYPES[piece.__class__]] ^= bit
+        self.occupied[piece.color] ^= bit
+
+    def relocate(self, piece, old_pos, new_pos):
+        bits = (SQUARE_BIT[old_pos[0] + 8 * old_pos[1]] |
+                SQUARE_BIT[new_pos[0] + 8 * new_pos[1]])
+        self.boards[piece.color][PIECE_TYPES[piece.__class__]] ^= bits
+        self.occupied[piece.color] ^= bits
+
+    def is_square_attacked(self, square, by_color, occupied=None,
+                           ignore=0):
+        """
+
+        True if a piece of by_color attacks the square. Pass occupied and
+        ignore (bits of captured pieces) to ask about a position after a
+        move without making it.
+
+        """
+        if occupied is None:
+            occupied = (self.occupied[constants.WHITE] |
+                        self.occupied[constants.BLACK])
+        boards = self.boards[by_color]
+        keep = ~ignore
+        if KNIGHT_ATTACKS[square] & boards[KNIGHT] & keep:
+            return True
+        if KING_ATTACKS[square] & boards[KING]:
+            return True
+        if PAWN_ATTACKS[not by_color][square] & boards[PAWN] & keep:
+            return True
+        diagonal = (boards[BISHOP] | boards[QUEEN]) & keep
+        if (diagonal and
+           slider_attacks(square, occupied, BISHOP_RAYS) & diagonal):
+            return True
+        straight = (boards[ROOK] | boards[QUEEN]) & keep
+        if (straight and
+           slider_attacks(square, occupied, ROOK_RAYS) & straight):
+            return True
+        return False
+
+    def king_square(self, color):
+        return self.boards[color][KING].bit_length() - 1
+
+    def get_checks_and_pins(self, color):
+        """
+
+        Same as Game._get_checks_and_pins, with bitboards for the squares:
+        returns (check_mask, pins) where check_mask is None when not in
+        check, and pins maps the square of each pinned piece to the squares
+        it can move to. Both include the square of the checking or pinning
+        piece, which can be taken.
+
+        """
+        king_square = self.king_square(color)
+        own = self.occupied[color]
+        occupied = own | self.occupied[not color]
+        enemy = self.boards[not color]
+        checkers = 0
+        check_mask = 0
+        pins = {}
+
+        for rays, sliders in ((ROOK_RAYS, enemy[ROOK] | enemy[QUEEN]),
+                              (BISHOP_RAYS, enemy[BISHOP] | enemy[QUEEN])):
+            if not sliders:
+                continue
+            for table, increasing in rays:
+                ray = table[king_square]
+                blockers = ray & occupied
+                if not blockers:
+                    continue
+                blocker = _nearest(blockers, increasing)
+                bit = SQUARE_BIT[blocker]
+                if bit & sliders:
+                    checkers += 1
+                    check_mask |= ray ^ table[blocker]
+                elif bit & own:
+                    beyond = table[blocker] & occupied
+                    if not beyond:
+                        continue
+                    pinner = _nearest(beyond, increasing)
+                    if SQUARE_BIT[pinner] & sliders:
+                        pins[blocker] = ray ^ table[pinner]
+
+        leapers = ((KNIGHT_ATTACKS[king_square] & enemy[KNIGHT]) |
+                   (PAWN_ATTACKS[color][king_square] & enemy[PAWN]))
+        if leapers:
+            checkers += bin(leapers).count("1")
+            check_mask |= leapers
+
+        if not checkers:
+            return None, pins
+        if checkers > 1:
+            return 0, pins
+        return check_mask, pins
+
+    def get_targets(self, piece, testing_check=False):
+        """
+
+        Pseudo-legal target squares for the piece as a bitboard, plus the
+        en passant square (or None) when the pawn can take en passant.
+
+        """
+        color = piece.color
+        square = piece.pos[0] + 8 * piece.pos[1]
+        own = self.occupied[color]
+        enemy = self.occupied[not color]
+        occupied = own | enemy
+        piece_type = PIECE_TYPES[piece.__class__]
+        en_passant = None
+
+        if piece_type == PAWN:
+            x, y = piece.pos
+            if color == constants.WHITE:
+                step, start_rank, en_passant_rank = 8, 1, 5
+            else:
+                step, start_rank, en_passant_rank = -8, 6, 2
+            targets = PAWN_ATTACKS[color][square] & enemy
+            one = square + step
+            if not occupied & SQUARE_BIT[one]:
+                targets |= SQUARE_BIT[one]
+                two = one + step
+                if y == start_rank and not occupied & SQUARE_BIT[two]:
+                    targets |= SQUARE_BIT[two]
+            en_passant_pos = self.game.en_passant_pos
+            if en_passant_pos and en_passant_pos[1] == en_passant_rank:
+                en_passant = en_passant_pos[0] + 8 * en_passant_pos[1]
+                if PAWN_ATTACKS[color][square] & SQUARE_BIT[en_passant]:
+                    targets |= SQUARE_BIT[en_passant]
+                else:
+                    en_passant = None
+        elif piece_type == KNIGHT:
+            targets = KNIGHT_ATTACKS[square] & ~own
+        elif piece_type == BISHOP:
+            targets = slider_attacks(square, occupied, BISHOP_RAYS) & ~own
+        elif piece_type == ROOK:
+            targets = slider_attacks(square, occupied, ROOK_RAYS) & ~own
+        elif piece_type == QUEEN:
+            targets = (slider_attacks(square, occupied, BISHOP_RAYS) |
+                       slider_attacks(square, occupied, ROOK_RAYS)) & ~own
+        else:
+            targets = KING_ATTACKS[square] & ~own
+            if not testing_check and not piece.has_moved:
+                targets |= self.get_castling_targets(piece, occupied)
+
+        return targets, en_passant
+
+    def get_castling_targets(self, king, occupied):
+        """
+
+        Castling destinations for a king that hasn't moved. The destination
+        square itself is left to the normal legality filter.
+
+        """
+        targets = 0
+        x, y = king.pos
+        enemy_color = not king.color
+        if self.is_square_attacked(x + 8 * y, enemy_color, occupied):
+            return targets
+        # (rook file, squares that must be empty, square the king crosses,
+        # king destination)
+        sides = [(0, [1, 2, 3], 3, 2), (7, [5, 6], 5, 6)]
+        for rook_x, between, crossed, destination in sides:
+            rook = self.game.get_piece_at((rook_x, y))
+            if (not rook or rook.__class__ != pieces.Rook or
+               rook.color != king.color or rook.has_moved):
+                continue
+            if any(occupied & SQUARE_BIT[file_x + 8 * y]
+                   for file_x in between):
+                continue
+            if self.is_square_attacked(crossed + 8 * y, enemy_color,
+                                       occupied):
+                continue
+            targets |= SQUARE_BIT[destination + 8 * y]
+        return targets
+
+    def get_valid_moves_for_piece(self, piece, testing_check=False):
+        """
+
+        Same as Game.get_valid_moves_for_piece. Legality is tested by
+        probing the king's square against the position after the move, with
+        no need to make it.
+
+        """
+        piece = self.game.get_piece_at(piece.pos)
+        if testing_check:
+            targets, en_passant = self.get_targets(piece, testing_check)
+            return [(piece, SQUARE_POS[target])
+                    for target in iter_squares(targets)]
+        return list(self.iter_valid_moves_for_piece(piece))
+
+    def iter_valid_moves_for_piece(self, piece, checks=None):
+        """
+
+        Generator version of get_valid_moves_for_piece, for legal moves
+        only. checks is the color's (check_mask, pins) from
+        get_checks_and_pins, worked out here if not given.
+
+        Other pieces' targets are masked by the check and pin masks. Only
+        king moves and en passant (which takes a pawn off a square it
+        doesn't move to) are tried against the position after the move.
+
+        """
+        piece = self.game.get_piece_at(piece.pos)
+        color = piece.color
+        if checks is None:
+            checks = self.get_checks_and_pins(color)
+        check_mask, pins = checks
+        targets, en_passant = self.get_targets(piece)
+
+        square = piece.pos[0] + 8 * piece.pos[1]
+        enemy_color = not color
+        if piece.__class__ != pieces.King:
+            legal = targets & pins.get(square, ALL_SQUARES)
+            if check_mask is not None:
+                legal &= check_mask
+            for target in iter_squares(legal):
+                if target != en_passant:
+                    yield (piece, SQUARE_POS[target])
+            if en_passant is None or not targets & SQUARE_BIT[en_passant]:
+                return
+            # The taken pawn is beside us, not on the target square
+            if color == constants.WHITE:
+                captured = SQUARE_BIT[en_passant - 8]
+            else:
+                captured = SQUARE_BIT[en_passant + 8]
+            after = ((self.occupied[color] | self.occupied[enemy_color]) ^
+                     SQUARE_BIT[square] ^ captured | SQUARE_BIT[en_passant])
+            if not self.is_square_attacked(self.king_square(color),
+                                           enemy_color, after, captured):
+                yield (piece, SQUARE_POS[en_passant])
+            return
+
+        # The king can't hide behind itself, so look with it lifted off
+        occupied = ((self.occupied[color] | self.occupied[enemy_color]) ^
+                    SQUARE_BIT[square])
+        for target in iter_squares(targets):
+            to_bit = SQUARE_BIT[target]
+            if not self.is_square_attacked(target, enemy_color,
+                                           occupied | to_bit, to_bit):
+                yield (piece, SQUARE_POS[target])
+
+    def get_valid_moves(self, color, testing_check=False):
+        """
+
+        Same as Game.get_valid_moves.
+
+        """
+        if testing_check:
+            moves = []
+            for piece in self.game.get_pieces(color):
+                moves.extend(self.get_valid_moves_for_piece(piece, True))
+            return moves
+        return list(self.iter_valid_moves(color))
+
+    def iter_valid_moves(self, color):
+        """
+
+        Same as Game.iter_legal_moves.
+
+        """
+        checks = self.get_checks_and_pins(color)
+        for piece in self.game.get_pieces(color):
+            for move in self.iter_valid_moves_for_piece(piece, checks):
+                yield move
+
+# ------------------------ Standalone Position -------------------------------#
+
+# Castling rights kept when a move starts or ends on each square: moving the
+# king or a rook, or taking a rook, loses the rights that go with it.
+CASTLING_KEPT = [15] * 64
+CASTLING_KEPT[0] ^= zobrist.WHITE_QUEEN_SIDE
+CASTLING_KEPT[4] ^= zobrist.WHITE_QUEEN_SIDE | zobrist.WHITE_KING_SIDE
+CASTLING_KEPT[7] ^= zobrist.WHITE_KING_SIDE
+CASTLING_KEPT[56] ^= zobrist.BLACK_QUEEN_SIDE
+CASTLING_KEPT[60] ^= zobrist.BLACK_QUEEN_SIDE | zobrist.BLACK_KING_SIDE
+CASTLING_KEPT[63] ^= zobrist.BLACK_KING_SIDE
+
+# (right, squares that must be empty, squares the king crosses and lands on,
+# king destination) per color
+CASTLING_MOVES = {
+    constants.WHITE: [(zobrist.WHITE_QUEEN_SIDE, 0xe, [3, 2], 2),
+                      (zobrist.WHITE_KING_SIDE, 0x60, [5, 6], 6)],
+    constants.BLACK: [(zobrist.BLACK_QUEEN_SIDE, 0xe << 56, [59, 58], 58),
+                      (zobrist.BLACK_KING_SIDE, 0x60 << 56, [61, 62], 62)]}
+
+
+class Position(Bitboards):
+    """
+
+    A copy of a game's position held in bitboards alone, with its own
+    make_move and unmake_move. Moves are (from square, to square) tuples and
+    nothing but ints is updated, where Game also keeps its piece objects,
+    piece list, board, hash and scores in step. It's what the bitboards
+    manage by themselves, for perft; the game itself is left untouched.
+
+    Pawns promote to queens, as in Game.
+
+    """
+    def __init__(self, game):
+        Bitboards.__init__(self, game)
+        self.game = None
+        self.color_to_move = game.color_to_move
+        self.castling = zobrist.get_castling_rights(game)
+        self.en_passant = None
+        if game.en_passant_pos:
+            self.en_passant = (game.en_passant_pos[0] +
+                               8 * game.en_passant_pos[1])
+        # piece type on each square, or None
+        self.mailbox = [None] * 64
+        for piece in game.get_pieces():
+            self.mailbox[piece.pos[0] + 8 * piece.pos[1]] = PIECE_TYPES[
+                piece.__class__]
+
+    def get_targets_by_square(self):
+        """
+
+        Legal moves for the side to move as a list of (from square, target
+        squares bitboard). Pins and checks mask the targets, so only king
+        moves and en passant are tried against the position after the move.
+
+        """
+        color = self.color_to_move
+        enemy_color = not color
+        boards = self.boards[color]
+        own = self.occupied[color]
+        enemy = self.occupied[enemy_color]
+        occupied = own | enemy
+        king_square = self.king_square(color)
+        check_mask, pins = self.get_checks_and_pins(color)
+        allowed = ALL_SQUARES ^ own
+        if check_mask is not None:
+            allowed &= check_mask
+        moves = []
+        append = moves.append
+
+        if allowed:
+            for piece_type, all_rays in ((BISHOP, [BISHOP_RAYS]),
+                                         (ROOK, [ROOK_RAYS]),
+                                         (QUEEN, [BISHOP_RAYS, ROOK_RAYS])):
+                for square in iter_squares(boards[piece_type]):
+                    targets = 0
+                    for rays in all_rays:
+                        targets |= slider_attacks(square, occupied, rays)
+                    targets &= pins.get(square, allowed) & allowed
+                    if targets:
+                        append((square, targets))
+            for square in iter_squares(boards[KNIGHT]):
+                if square in pins:
+                    continue
+                targets = KNIGHT_ATTACKS[square] & allowed
+                if targets:
+                    append((square, targets))
+
+            if color == constants.WHITE:
+                step, start_rank = 8, 1
+            else:
+                step, start_rank = -8, 6
+            en_passant = self.en_passant
+            if en_passant is not None:
+                captured = SQUARE_BIT[en_passant - step]
+                takers = PAWN_ATTACKS[enemy_color][en_passant] & boards[PAWN]
+            else:
+                takers = 0
+            for square in iter_squares(boards[PAWN]):
+                targets = PAWN_ATTACKS[color][square] & enemy
+                one = square + step
+                if not occupied & SQUARE_BIT[one]:
+                    targets |= SQUARE_BIT[one]
+                    if (square >> 3 == start_rank and
+                       not occupied & SQUARE_BIT[one + step]):
+                        targets |= SQUARE_BIT[one + step]
+                targets &= pins.get(square, allowed) & allowed
+                # en passant takes a pawn off a square it doesn't move to
+                if takers & SQUARE_BIT[square]:
+                    after = (occupied ^ SQUARE_BIT[square] ^ captured |
+                             SQUARE_BIT[en_passant])
+                    if not self.is_square_attacked(king_square, enemy_color,
+                                                   after, captured):
+                        targets |= SQUARE_BIT[en_passant]
+                if targets:
+                    append((square, targets))
+
+        # The king can't hide behind itself, so look with it lifted off
+        lifted = occupied ^ SQUARE_BIT[king_square]
+        targets = 0
+        for target in iter_squares(KING_ATTACKS[king_square] & ~own):
+            to_bit = SQUARE_BIT[target]
+            if not self.is_square_attacked(target, enemy_color,
+                                           lifted | to_bit, to_bit):
+                targets |= to_bit
+        if self.castling and check_mask is None:
+            for right, between, crossed, destination in CASTLING_MOVES[color]:
+                if (self.castling & right and not occupied & between and
+                   not any(self.is_square_attacked(square, enemy_color,
+                                                   occupied)
+                           for square in crossed)):
+                    targets |= SQUARE_BIT[destination]
+        if targets:
+            append((king_square, targets))
+        return moves
+
+    def get_moves(self):
+        """
+
+        Legal moves for the side to move, as (from square, to square).
+
+        """
+        return [(square, target) for square, targets in
+                self.get_targets_by_square() for target in
+                iter_squares(targets)]
+
+    def count_moves(self):
+        """
+
+        Number of legal moves for the side to move.
+
+        """
+        return sum(bin(targets).count("1") for square, targets in
+                   self.get_targets_by_square())
+
+    def make_move(self, move):
+        """
+
+        Make a move from get_moves and return what unmake_move needs to take
+        it back.
+
+        """
+        from_square, to_square = move
+        color = self.color_to_move
+        enemy_color = not color
+        boards = self.boards[color]
+        mailbox = self.mailbox
+        piece_type = mailbox[from_square]
+        captured = mailbox[to_square]
+        captured_square = to_square
+        from_bit = SQUARE_BIT[from_square]
+        to_bit = SQUARE_BIT[to_square]
+        undo = (move, piece_type, captured, captured_square, self.en_passant,
+                self.castling)
+
+        if captured is not None:
+            self.boards[enemy_color][captured] ^= to_bit
+            self.occupied[enemy_color] ^= to_bit
+        elif piece_type == PAWN and to_square == self.en_passant:
+            captured = PAWN
+            if color == constants.WHITE:
+                captured_square = to_square - 8
+            else:
+                captured_square = to_square + 8
+            bit = SQUARE_BIT[captured_square]
+            self.boards[enemy_color][PAWN] ^= bit
+            self.occupied[enemy_color] ^= bit
+            mailbox[captured_square] = None
+            undo = (move, piece_type, captured, captured_square,
+                    self.en_passant, self.castling)
+
+        boards[piece_type] ^= from_bit
+        if piece_type == PAWN and to_square >> 3 in (0, 7):
+            boards[QUEEN] |= to_bit
+            mailbox[to_square] = QUEEN
+        else:
+            boards[piece_type] |= to_bit
+            mailbox[to_square] = piece_type
+        mailbox[from_square] = None
+        self.occupied[color] ^= from_bit | to_bit
+
+        if piece_type == KING and abs(to_square - from_square) == 2:
+            if to_square > from_square:
+                rook_from, rook_to = to_square + 1, to_square - 1
+            else:
+                rook_from, rook_to = to_square - 2, to_square + 1
+            bits = SQUARE_BIT[rook_from] | SQUARE_BIT[rook_to]
+            boards[ROOK] ^= bits
+            self.occupied[color] ^= bits
+            mailbox[rook_from] = None
+            mailbox[rook_to] = ROOK
+
+        self.castling &= CASTLING_KEPT[from_square] & CASTLING_KEPT[to_square]
+        if piece_type == PAWN and abs(to_square - from_square) == 16:
+            self.en_passant = (from_square + to_square) >> 1
+        else:
+            self.en_passant = None
+        self.color_to_move = enemy_color
+        return undo
+
+    def unmake_move(self, undo):
+        """
+
+        Take back a move made with make_move.
+
+        """
+        ((from_square, to_square), piece_type, captured, captured_square,
+         self.en_passant, self.castling) = undo
+        color = not self.color_to_move
+        self.color_to_move = color
+        boards = self.boards[color]
+        mailbox = self.mailbox
+        from_bit = SQUARE_BIT[from_square]
+        to_bit = SQUARE_BIT[to_square]
+
+        boards[mailbox[to_square]] ^= to_bit
+        boards[piece_type] |= from_bit
+        mailbox[from_square] = piece_type
+        mailbox[to_square] = None
+        self.occupied[color] ^= from_bit | to_bit
+
+        if captured is not None:
+            bit = SQUARE_BIT[captured_square]
+            self.boards[not color][captured] |= bit
+            self.occupied[not color] |= bit
+            mailbox[captured_square] = captured
+
+        if piece_type == KING and abs(to_square - from_square) == 2:
+            if to_square > from_square:
+                rook_from, rook_to = to_square + 1, to_square - 1
+            else:
+                rook_from, rook_to = to_square - 2, to_square + 1
+            bits = SQUARE_BIT[rook_from] | SQUARE_BIT[rook_to]
+            boards[ROOK] ^= bits
+            self.occupied[color] ^= bits
+            mailbox[rook_to] = None
+            mailbox[rook_from] = ROOK
+
+    def perft(self, depth):
+        """
+
+        Count the leaf nodes of the legal move tree to the given depth.
+
+        """
+        if depth == 0:
+            return 1
+        if depth == 1:
+            return self.count_moves()
+        nodes = 0
+        for move in self.get_moves():
+            undo = self.make_move(move)
+            nodes += self.perft(depth - 1)
+            self.unmake_move(undo)
+        return nodes
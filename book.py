@@ -0,0 +1,224 @@
+# std lib imports
+import os
+import mmap
+import json
+import time
+import random
+import struct
+import argparse
+
+# local imports
+import constants
+import games
+import pgn
+import utility
+
+# Each record is the position hash, the move (from square | to square << 6)
+# and its weight, little-endian. Records are sorted by hash, then by weight
+# with the heaviest first.
+RECORD = struct.Struct("<QHH")
+KEY = struct.Struct("<Q")
+MAX_WEIGHT = 0xffff
+
+# Weight a move gets from each game it was played in, by whether the side
+# that played it won, drew or lost
+WIN_WEIGHT = 2
+DRAW_WEIGHT = 1
+LOSS_WEIGHT = 0
+
+
+class OpeningBook(object):
+    """
+
+    Opening book read from a file of sorted fixed-width records.
+
+    The file is memory-mapped rather than read, and positions are found by
+    binary search on their hash, so opening even a large book is instant and
+    only the pages probed are ever read from disk.
+
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size % RECORD.size:
+            self._file.close()
+            raise ValueError('Not a valid opening book')
+        self.size = size // RECORD.size
+        self._map = None
+        if self.size:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+
+    def close(self):
+        """
+
+        Unmap and close the book file.
+
+        """
+        if self._map:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def get_entries(self, key):
+        """
+
+        The book moves for the position hash as a list of (from_pos, to_pos,
+        weight) tuples, heaviest first.
+
+        """
+        low = 0
+        high = self.size
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(self._map, middle * RECORD.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        entries = []
+        while low < self.size:
+            entry_key, move, weight = RECORD.unpack_from(
+                self._map, low * RECORD.size)
+            if entry_key != key:
+                break
+            entries.append(((move & 7, (move >> 3) & 7),
+                            ((move >> 6) & 7, (move >> 9) & 7), weight))
+            low += 1
+        return entries
+
+    def get_move(self, game):
+        """
+
+        A book move for the side to move as a (piece, pos) tuple, picked at
+        random in proportion to the moves' weights, or None if the position
+        isn't in the book.
+
+        """
+        moves = []
+        for from_pos, to_pos, weight in self.get_entries(game.hash):
+            piece = game.get_piece_at(from_pos)
+            # a different position with the same hash is possible, if rare
+            if not piece or piece.color != game.color_to_move or not weight:
+                continue
+            if not (piece, to_pos) in game.get_valid_moves_for_piece(piece):
+                continue
+            moves.append(((piece, to_pos), weight))
+        if not moves:
+            return None
+
+        choice = random.random() * sum(weight for move, weight in moves)
+        for move, weight in moves:
+            choice -= weight
+            if choice < 0:
+                return move
+        return moves[-1][0]
+
+
+def _iter_pgn_games(filename):
+    """
+
+    Yield (moves, result) for each game in a PGN file, moves being
+    (from_pos, to_pos) tuples. Games with moves that can't be played are
+    cut short at that move.
+
+    """
+    with open(filename) as pgn_file:
+        for record in pgn.iter_games(pgn_file):
+            if "FEN" in record.headers:
+                continue
+            moves = []
+            try:
+                for piece, pos in record.replay():
+                    moves.append((piece.pos, pos))
+            except ValueError:
+                pass
+            yield moves, record.result
+
+
+def _iter_selfplay_games(filename):
+    """
+
+    Yield (moves, result) for each game in a self-play JSON lines file.
+
+    """
+    with open(filename) as results_file:
+        for line in results_file:
+            result = json.loads(line)
+            moves = [(utility.get_coords_for_grid_ref(move[:2].upper()),
+                      utility.get_coords_for_grid_ref(move[2:4].upper()))
+                     for move in result["moves"]]
+            yield moves, result["result"]
+
+
+def build_book(filenames, output, max_plies=20, min_games=1):
+    """
+
+    Write an opening book of the first max_plies moves of the games in the
+    PGN (.pgn) and self-play (.jsonl) files. A move is kept if it was played
+    in at least min_games games, weighted by how those games went for the
+    side that played it. Returns the number of records written.
+
+    """
+    counts = {}
+    weights = {}
+    for filename in filenames:
+        if filename.endswith(".jsonl"):
+            game_source = _iter_selfplay_games(filename)
+        else:
+            game_source = _iter_pgn_games(filename)
+        for moves, result in game_source:
+            game = games.Game()
+            for from_pos, to_pos in moves[:max_plies]:
+                piece = game.get_piece_at(from_pos)
+                if (not piece or piece.color != game.color_to_move or
+                   not (piece, to_pos) in
+                   game.get_valid_moves_for_piece(piece)):
+                    break
+                if result in (constants.DRAW, constants.UNFINISHED):
+                    weight = DRAW_WEIGHT
+                elif result == (constants.WHITE_WINS if game.color_to_move
+                                else constants.BLACK_WINS):
+                    weight = WIN_WEIGHT
+                else:
+                    weight = LOSS_WEIGHT
+                entry = (game.hash, (from_pos[0] + 8 * from_pos[1]) |
+                         (to_pos[0] + 8 * to_pos[1]) << 6)
+                counts[entry] = counts.get(entry, 0) + 1
+                weights[entry] = weights.get(entry, 0) + weight
+                game.make_move(piece, to_pos)
+                game.color_to_move = not game.color_to_move
+
+    # Scale the weights into 16 bits if need be, keeping every move that
+    # was ever worth playing. Moves that only ever lost are left out.
+    scale = max([MAX_WEIGHT] + weights.values()) / float(MAX_WEIGHT)
+    records = sorted(((key, -max(1, int(weight / scale)), move) for
+                      (key, move), weight in weights.items() if
+                      weight and counts[(key, move)] >= min_games))
+    with open(output, "wb") as book_file:
+        for key, weight, move in records:
+            book_file.write(RECORD.pack(key, move, -weight))
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build an opening book from PGN (.pgn) and self-play "
+                    "(.jsonl) game files.")
+    parser.add_argument("output")
+    parser.add_argument("inputs", nargs="+")
+    parser.add_argument("--max-plies", type=int, default=20,
+                        help="how far into each game to go")
+    parser.add_argument("--min-games", type=int, default=1,
+                        help="games a move must appear in to be kept")
+    args = parser.parse_args()
+
+    start = time.time()
+    size = build_book(args.inputs, args.output, max_plies=args.max_plies,
+                      min_games=args.min_games)
+    print "%i moves written to %s in %.1fs (%i bytes)" % (
+        size, args.output, time.time() - start, size * RECORD.size)
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,17 @@ GRID_REF = re.compile(r"^[A-H][1-8]$")
 WHITE = True
 BLACK = False
 
+# Move generation backends for games.Game
+PIECE_LIST = "pieces"
+BITBOARD = "bitboard"
+BACKENDS = (PIECE_LIST, BITBOARD)
+
+# Game results, as written in game records
+WHITE_WINS = "1-0"
+BLACK_WINS = "0-1"
+DRAW = "1/2-1/2"
+UNFINISHED = "*"
+
 # Color names
 COLOR_NAMES = {WHITE: 'white', BLACK: 'black'}
 
@@ -35,6 +46,11 @@ PIECE_VALUES = {King: 111,
                 Knight: 3,
                 Pawn: 1}
 
+# Every piece of a class shares its name and value
+for _piece_class in PIECE_NAMES:
+    _piece_class.name = PIECE_NAMES[_piece_class]
+    _piece_class.value = PIECE_VALUES[_piece_class]
+
 # Characters to represent pieces
 SELECTED_PIECE_CHARACTERS = {King: "K",
                              Queen: "Q",
@@ -59,6 +75,12 @@ DOWN = (0, -1)
 DOWN_LEFT = (-1, -1)
 LEFT = (-1, 0)
 UP_LEFT = (-1, 1)
+STRAIGHT_DIRECTIONS = [UP, RIGHT, DOWN, LEFT]
+DIAGONAL_DIRECTIONS = [UP_RIGHT, DOWN_RIGHT, DOWN_LEFT, UP_LEFT]
+
+# knight jumps
+KNIGHT_OFFSETS = [(1, 2), (2, 1), (2, -1), (1, -2),
+                  (-1, -2), (-2, -1), (-2, 1), (-1, 2)]
 
 # ANSI color codes used to display the chess board
 ANSI_BEGIN = "\033[%sm"
@@ -0,0 +1,119 @@
+# std lib imports
+# local imports
+import constants
+import pieces
+
+# ------------------------ Evaluation Tables ---------------------------------#
+
+# Scores are in hundredths of a pawn
+MATERIAL_SCALE = 100
+
+# Set to check the incrementally kept scores against a full recount on every
+# evaluation. Slow, for debugging only.
+CHECK_SCORES = False
+
+# Material value of each piece class
+MATERIAL = dict((piece_class, value * MATERIAL_SCALE) for piece_class, value
+                in constants.PIECE_VALUES.items())
+
+# Bonus for a piece standing on each square, as seen by white with the 8th
+# rank at the top (the usual "simplified evaluation function" tables).
+_PIECE_SQUARE_TABLES = {
+    pieces.Pawn: [0, 0, 0, 0, 0, 0, 0, 0,
+                  50, 50, 50, 50, 50, 50, 50, 50,
+                  10, 10, 20, 30, 30, 20, 10, 10,
+                  5, 5, 10, 25, 25, 10, 5, 5,
+                  0, 0, 0, 20, 20, 0, 0, 0,
+                  5, -5, -10, 0, 0, -10, -5, 5,
+                  5, 10, 10, -20, -20, 10, 10, 5,
+                  0, 0, 0, 0, 0, 0, 0, 0],
+    pieces.Knight: [-50, -40, -30, -30, -30, -30, -40, -50,
+                    -40, -20, 0, 0, 0, 0, -20, -40,
+                    -30, 0, 10, 15, 15, 10, 0, -30,
+                    -30, 5, 15, 20, 20, 15, 5, -30,
+                    -30, 0, 15, 20, 20, 15, 0, -30,
+                    -30, 5, 10, 15, 15, 10, 5, -30,
+                    -40, -20, 0, 5, 5, 0, -20, -40,
+                    -50, -40, -30, -30, -30, -30, -40, -50],
+    pieces.Bishop: [-20, -10, -10, -10, -10, -10, -10, -20,
+                    -10, 0, 0, 0, 0, 0, 0, -10,
+                    -10, 0, 5, 10, 10, 5, 0, -10,
+                    -10, 5, 5, 10, 10, 5, 5, -10,
+                    -10, 0, 10, 10, 10, 10, 0, -10,
+                    -10, 10, 10, 10, 10, 10, 10, -10,
+                    -10, 5, 0, 0, 0, 0, 5, -10,
+                    -20, -10, -10, -10, -10, -10, -10, -20],
+    pieces.Rook: [0, 0, 0, 0, 0, 0, 0, 0,
+                  5, 10, 10, 10, 10, 10, 10, 5,
+                  -5, 0, 0, 0, 0, 0, 0, -5,
+                  -5, 0, 0, 0, 0, 0, 0, -5,
+                  -5, 0, 0, 0, 0, 0, 0, -5,
+                  -5, 0, 0, 0, 0, 0, 0, -5,
+                  -5, 0, 0, 0, 0, 0, 0, -5,
+                  0, 0, 0, 5, 5, 0, 0, 0],
+    pieces.Queen: [-20, -10, -10, -5, -5, -10, -10, -20,
+                   -10, 0, 0, 0, 0, 0, 0, -10,
+                   -10, 0, 5, 5, 5, 5, 0, -10,
+                   -5, 0, 5, 5, 5, 5, 0, -5,
+                   0, 0, 5, 5, 5, 5, 0, -5,
+                   -10, 5, 5, 5, 5, 5, 0, -10,
+                   -10, 0, 5, 0, 0, 0, 0, -10,
+                   -20, -10, -10, -5, -5, -10, -10, -20],
+    pieces.King: [-30, -40, -40, -50, -50, -40, -40, -30,
+                  -30, -40, -40, -50, -50, -40, -40, -30,
+                  -30, -40, -40, -50, -50, -40, -40, -30,
+                  -30, -40, -40, -50, -50, -40, -40, -30,
+                  -20, -30, -30, -40, -40, -30, -30, -20,
+                  -10, -20, -20, -20, -20, -20, -20, -10,
+                  20, 20, 0, 0, 0, 0, 20, 20,
+                  20, 30, 10, 0, 0, 10, 30, 20],
+}
+
+
+def _square_scores(table):
+    """
+
+    Turn a table as printed above into per-color lists indexed by square
+    (x + 8 * y), mirroring it for black.
+
+    """
+    white = [table[(7 - (square >> 3)) * 8 + (square & 7)]
+             for square in xrange(64)]
+    black = [table[(square >> 3) * 8 + (square & 7)]
+             for square in xrange(64)]
+    return {constants.WHITE: white, constants.BLACK: black}
+
+# Square bonus by piece class, color and square
+POSITION_SCORES = dict((piece_class, _square_scores(table)) for
+                       piece_class, table in _PIECE_SQUARE_TABLES.items())
+
+
+def get_scores(game):
+    """
+
+    Count up the material and positional scores of each color from scratch.
+    Returns (material, positional), each a dict keyed by color.
+
+    """
+    material = {constants.WHITE: 0, constants.BLACK: 0}
+    positional = {constants.WHITE: 0, constants.BLACK: 0}
+    for piece in game.get_pieces():
+        material[piece.color] += MATERIAL[piece.__class__]
+        positional[piece.color] += POSITION_SCORES[piece.__class__][
+            piece.color][piece.pos[0] + 8 * piece.pos[1]]
+    return material, positional
+
+
+def evaluate(game):
+    """
+
+    Score of the position for the side to move, from the game's running
+    material and positional scores.
+
+    """
+    color = game.color_to_move
+    if CHECK_SCORES:
+        if (game.material, game.positional) != get_scores(game):
+            raise RuntimeError("Incremental scores are out of step.")
+    return (game.material[color] + game.positional[color] -
+            game.material[not color] - game.positional[not color])
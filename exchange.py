@@ -0,0 +1,157 @@
+# std lib imports
+# local imports
+import constants
+import pieces
+import evaluation
+
+# Pieces that can capture along each kind of line from any distance
+_SLIDERS = ((constants.STRAIGHT_DIRECTIONS, (pieces.Rook, pieces.Queen)),
+            (constants.DIAGONAL_DIRECTIONS, (pieces.Bishop, pieces.Queen)))
+
+
+def get_attackers(game, pos):
+    """
+
+    Every piece of either color that can capture on pos, either directly or
+    once the pieces in front of it on the same line have captured.
+
+    Returns (lines, knights): lines is a list of lists of pieces, one per
+    direction, nearest first. Pins are ignored.
+
+    """
+    x, y = pos
+    lines = []
+    for directions, sliders in _SLIDERS:
+        for dx, dy in directions:
+            line = []
+            square_x, square_y = x + dx, y + dy
+            distance = 1
+            while 0 <= square_x < 8 and 0 <= square_y < 8:
+                piece = game.get_piece_at((square_x, square_y))
+                if piece:
+                    piece_class = piece.__class__
+                    if piece_class in sliders:
+                        line.append(piece)
+                    elif distance == 1 and piece_class == pieces.King:
+                        line.append(piece)
+                    elif (distance == 1 and piece_class == pieces.Pawn and
+                          dx and dy == (-1 if piece.color == constants.WHITE
+                                        else 1)):
+                        line.append(piece)
+                    else:
+                        break
+                square_x += dx
+                square_y += dy
+                distance += 1
+            if line:
+                lines.append(line)
+
+    knights = []
+    for dx, dy in constants.KNIGHT_OFFSETS:
+        piece = game.get_piece_at((x + dx, y + dy))
+        if piece and piece.__class__ == pieces.Knight:
+            knights.append(piece)
+    return lines, knights
+
+
+def _remove_attacker(lines, knights, piece):
+    """
+
+    Take a piece that has captured out of the attackers, uncovering whatever
+    was behind it.
+
+    """
+    if piece in knights:
+        knights.remove(piece)
+        return
+    for line in lines:
+        if line and line[0] is piece:
+            line.pop(0)
+            return
+
+
+def _least_valuable_attacker(lines, knights, color):
+    """
+
+    The cheapest piece of the color that can capture next, or None.
+
+    """
+    best = None
+    for piece in knights:
+        if piece.color == color:
+            best = piece
+            break
+    for line in lines:
+        if line and line[0].color == color:
+            if best is None or line[0].value < best.value:
+                best = line[0]
+    return best
+
+
+def _swap(lines, knights, gain, piece, color):
+    """
+
+    Play out captures on the square, cheapest attacker first, with either
+    side free to stop capturing when it suits it. gain is what the first
+    capture (by piece) won; color is the side to capture next.
+
+    """
+    gains = [gain]
+    value = evaluation.MATERIAL[piece.__class__]
+    while True:
+        attacker = _least_valuable_attacker(lines, knights, color)
+        if not attacker:
+            break
+        gain = value - gains[-1]
+        # Not worth it even if nothing recaptures
+        if max(-gains[-1], gain) < 0:
+            break
+        gains.append(gain)
+        _remove_attacker(lines, knights, attacker)
+        value = evaluation.MATERIAL[attacker.__class__]
+        color = not color
+
+    while len(gains) > 1:
+        gain = gains.pop()
+        gains[-1] = min(gains[-1], -gain)
+    return gains[0]
+
+
+def static_exchange(game, piece, pos):
+    """
+
+    Material (in evaluation units) the piece's side can expect to win by
+    moving it to pos, once all the captures on pos that are worth making have
+    been made. Negative if the move loses material. The move needn't be a
+    capture: a move to a square where the piece is simply lost scores minus
+    its value.
+
+    """
+    victim = game.get_piece_at(pos)
+    if victim:
+        gain = evaluation.MATERIAL[victim.__class__]
+    elif piece.__class__ == pieces.Pawn and pos[0] != piece.pos[0]:
+        # en passant
+        gain = evaluation.MATERIAL[pieces.Pawn]
+    else:
+        gain = 0
+    lines, knights = get_attackers(game, pos)
+    _remove_attacker(lines, knights, piece)
+    return _swap(lines, knights, gain, piece, not piece.color)
+
+
+def get_threat(game, pos):
+    """
+
+    Material the opponent of the piece on pos can win by starting an
+    exchange on its square, or 0 if it's safe there.
+
+    """
+    piece = game.get_piece_at(pos)
+    lines, knights = get_attackers(game, pos)
+    attacker = _least_valuable_attacker(lines, knights, not piece.color)
+    if not attacker:
+        return 0
+    _remove_attacker(lines, knights, attacker)
+    return max(0, _swap(lines, knights, evaluation.MATERIAL[piece.__class__],
+                        attacker, piece.color))
@@ -0,0 +1,89 @@
+# std lib imports
+import sys
+import argparse
+
+# local imports
+import constants
+import games
+import perft
+
+# Positions from_fen has to turn down, with why
+INVALID_FENS = [
+    ("side not to move in check", "4k3/8/8/8/8/8/4q3/4K3 b - - 0 1"),
+    ("white pawn on the last rank", "4k2P/8/8/8/8/8/8/4K3 w - - 0 1"),
+    ("black pawn on the first rank", "4k3/8/8/8/8/8/8/p3K3 w - - 0 1"),
+    ("missing king", "8/8/8/8/8/8/8/4K3 w - - 0 1"),
+    ("two white kings", "4k3/8/8/8/8/8/8/3KK3 w - - 0 1"),
+    ("two black kings", "4kk2/8/8/8/8/8/8/4K3 w - - 0 1"),
+    ("short rank", "4k3/8/8/8/8/8/8/4K2 w - - 0 1"),
+    ("en passant square on the wrong rank",
+     "4k3/8/8/8/8/8/3P4/4K3 w - e3 0 1"),
+    ("en passant square for the side to move",
+     "4k3/8/8/3Pp3/8/8/8/4K3 b - e6 0 1"),
+    ("no pawn in front of the en passant square",
+     "4k3/8/8/8/8/8/8/4K3 w - e6 0 1"),
+    ("own pawn in front of the en passant square",
+     "4k3/8/8/4P3/8/8/8/4K3 w - e6 0 1"),
+    ("piece on the en passant square",
+     "4k3/8/4n3/3Pp3/8/8/8/4K3 w - e6 0 1"),
+    ("bare en passant file", "4k3/8/8/3Pp3/8/8/8/4K3 w - e 0 1"),
+    ("halfmove clock not a number", "4k3/8/8/8/8/8/8/4K3 w - - x 1"),
+    ("fullmove number not a number", "4k3/8/8/8/8/8/8/4K3 w - - 0 y"),
+]
+
+# Positions that have to load and come back unchanged from to_fen (bar the
+# fullmove number, which isn't kept)
+VALID_FENS = [fen for name, fen, expected in perft.POSITIONS] + [
+    "4k3/8/8/3Pp3/8/8/8/4K3 w - e6 0 1",
+    "4k3/8/8/8/3pP3/8/8/4K3 b - e3 0 1",
+]
+
+
+def check_fens(backend):
+    """
+
+    Check every valid FEN round trips and every invalid one is turned down.
+    Prints any failures and returns False if there were some.
+
+    """
+    all_correct = True
+    for fen in VALID_FENS:
+        try:
+            result = games.Game.from_fen(fen, backend).to_fen()
+        except ValueError as e:
+            print "Valid FEN turned down (%s): %s" % (e, fen)
+            all_correct = False
+            continue
+        if result.split()[:5] != fen.split()[:5]:
+            print "FEN round trip of %s gave %s" % (fen, result)
+            all_correct = False
+    for reason, fen in INVALID_FENS:
+        try:
+            games.Game.from_fen(fen, backend)
+        except ValueError:
+            continue
+        print "FEN with %s was accepted: %s" % (reason, fen)
+        all_correct = False
+    return all_correct
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check FEN strings are read back unchanged and that "
+                    "impossible positions are turned down.")
+    parser.add_argument("--backend", default=None,
+                        choices=constants.BACKENDS,
+                        help="backend to check (default all of them)")
+    args = parser.parse_args()
+
+    all_correct = True
+    for backend in [args.backend] if args.backend else constants.BACKENDS:
+        if check_fens(backend):
+            print "%s: FEN checks ok" % backend
+        else:
+            all_correct = False
+    if not all_correct:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
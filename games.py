@@ -1,9 +1,71 @@
 # std lib imports
-import copy
+import array
 
 # local imports
 import constants
 import pieces
+import attacks
+import bitboards
+import evaluation
+import zobrist
+
+# Piece class and color for each FEN board character
+_PIECES_FOR_FEN = {}
+for _piece_class, _character in constants.PIECE_CHARACTERS.items():
+    _PIECES_FOR_FEN[_character] = (_piece_class, constants.WHITE)
+    _PIECES_FOR_FEN[_character.lower()] = (_piece_class, constants.BLACK)
+
+# Squares skipped by each FEN digit
+_EMPTY_SQUARES = dict((str(count), count) for count in xrange(1, 9))
+
+# Castling side for each color's rooks by starting file
+_CASTLING_FOR_ROOK = {constants.WHITE: {0: zobrist.WHITE_QUEEN_SIDE,
+                                        7: zobrist.WHITE_KING_SIDE},
+                      constants.BLACK: {0: zobrist.BLACK_QUEEN_SIDE,
+                                        7: zobrist.BLACK_KING_SIDE}}
+
+# FEN castling characters for each castling side
+_CASTLING_CHARACTERS = [(zobrist.WHITE_KING_SIDE, "K"),
+                        (zobrist.WHITE_QUEEN_SIDE, "Q"),
+                        (zobrist.BLACK_KING_SIDE, "k"),
+                        (zobrist.BLACK_QUEEN_SIDE, "q")]
+
+# Piece class and color for each code in a snapshot's board, 0 being an
+# empty square, and the other way round
+_SNAPSHOT_PIECES = [None] + [(piece_class, color) for color in
+                             (constants.WHITE, constants.BLACK) for
+                             piece_class in (pieces.King, pieces.Queen,
+                                             pieces.Rook, pieces.Bishop,
+                                             pieces.Knight, pieces.Pawn)]
+_SNAPSHOT_CODES = dict((kind, code) for code, kind in
+                       enumerate(_SNAPSHOT_PIECES) if kind)
+
+# Positions whose legal moves are kept before the cache is emptied
+MOVE_CACHE_SIZE = 256
+
+# A snapshot is the 64 square codes, then the side to move, the castling
+# rights, the en passant file plus one (0 for none) and the idle move count
+SNAPSHOT_SIZE = 68
+
+
+def _has_moved(piece_class, color, pos, rights):
+    """
+
+    Whether a piece found on pos in a position set up from scratch has to be
+    treated as having moved, going by the castling rights (a mask of the
+    zobrist castling side constants).
+
+    """
+    x, y = pos
+    home = 0 if color == constants.WHITE else 7
+    sides = _CASTLING_FOR_ROOK[color]
+    if piece_class == pieces.Pawn:
+        return y != (1 if color == constants.WHITE else 6)
+    if piece_class == pieces.King:
+        return not (x == 4 and y == home and rights & (sides[0] | sides[7]))
+    if piece_class == pieces.Rook:
+        return not (x in sides and y == home and rights & sides[x])
+    return False
 
 
 class EndGameException(Exception):
@@ -15,21 +77,74 @@ class EndGameException(Exception):
     pass
 
 
+class UndoRecord(object):
+    """
+
+    Everything a move changed that isn't implied by the move itself, so
+    Game.unmake_move can put the game back the way it was.
+
+    """
+    __slots__ = ("piece", "from_pos", "to_pos", "has_moved", "captured",
+                 "captured_index", "promoted", "piece_index", "rook",
+                 "rook_from", "rook_has_moved", "en_passant_pos",
+                 "idle_move_count", "last_moved_piece")
+
+    def __init__(self, game, piece, pos):
+        self.piece = piece
+        self.from_pos = piece.pos
+        self.to_pos = pos
+        self.has_moved = piece.has_moved
+        # taken piece (including en passant) and its place in the piece list
+        self.captured = None
+        self.captured_index = None
+        # queen the piece was promoted to and the pawn's place in the list
+        self.promoted = None
+        self.piece_index = None
+        # rook moved by castling and the corner it came from
+        self.rook = None
+        self.rook_from = None
+        self.rook_has_moved = False
+        self.en_passant_pos = game.en_passant_pos
+        self.idle_move_count = game.idle_move_count
+        self.last_moved_piece = game.last_moved_piece
+
+
 class Game(object):
     """
 
     Class representing the game state. Board layout is stored as a list of
-    pieces as each piece knows its own position.
+    pieces as each piece knows its own position, plus a 64 square index of
+    the same pieces so occupancy lookups don't have to scan the list.
+
+    Move generation uses the pieces themselves by default. Pass
+    backend=constants.BITBOARD to generate moves from bitboards instead.
+
+    The game also keeps a Zobrist hash of the position in hash, covering the
+    pieces, side to move, castling rights and en passant square. Moves update
+    it incrementally; call rehash after setting up a position by hand.
+
+    material and positional hold each color's running material and
+    piece-square scores (see the evaluation module), likewise kept up to date
+    by every move so a position can be scored without counting up pieces.
+
+    Use Game.from_fen to start from any other position than the initial one.
+
+    The board is mirrored in a compact array of piece codes, so get_snapshot
+    can save the position as a single small buffer. from_snapshot and copy
+    rebuild a game from one.
+
+    Call enable_attack_maps to have the game keep count of how many pieces
+    of each color attack each square (see the attacks module). Square attack
+    tests then become lookups, at some cost to every move made.
+
+    Legal moves are cached by position hash and color, so asking for them
+    again in the same position (including after a move has been taken back)
+    costs next to nothing. move_cache_hits and move_cache_misses count how
+    often the cache was used.
 
     """
-    def __init__(self):
-        # list all pieces in the game
-        self._pieces = []
-        self.color_to_move = constants.WHITE
-        # no. of moves without a capture, 50 moves indicate a draw
-        self.idle_move_count = 0
-        self.last_moved_piece = None
-        self.en_passant_pos = None
+    def __init__(self, backend=constants.PIECE_LIST):
+        self._reset(backend)
 
         # initialize board
         # pawns
@@ -48,26 +163,420 @@ class Game(object):
             self._pieces.append(pieces.Knight(color, (6, rank)))
             self._pieces.append(pieces.Rook(color, (7, rank)))
 
-    def get_piece_at(self, pos):
+        self._index_pieces()
+
+    def _reset(self, backend):
+        """
+
+        Set up the state of an empty board.
+
+        """
+        if not backend in constants.BACKENDS:
+            raise ValueError('Not a valid backend')
+
+        self._backend = backend
+        # list all pieces in the game
+        self._pieces = []
+        # square index, (x, y) is stored at x + 8 * y
+        self._board = [None] * 64
+        # the same squares as snapshot piece codes
+        self._squares = array.array("B", [0]) * 64
+        # Zobrist hash of the position and the castling rights it includes
+        self.hash = 0
+        self._castling_rights = 0
+        # running material and piece-square scores for each color
+        self.material = {constants.WHITE: 0, constants.BLACK: 0}
+        self.positional = {constants.WHITE: 0, constants.BLACK: 0}
+        self._color_to_move = constants.WHITE
+        # no. of moves without a capture, 50 moves indicate a draw
+        self.idle_move_count = 0
+        self.last_moved_piece = None
+        self._en_passant_pos = None
+        # each color's king, for check tests
+        self._kings = {}
+        # bitboard move generator, if that backend was chosen
+        self._bitboards = None
+        # attack counts, once enable_attack_maps has been called
+        self._attack_maps = None
+        # legal moves as (from square, to pos) by (hash, color)
+        self._move_cache = {}
+        self.move_cache_hits = 0
+        self.move_cache_misses = 0
+
+    def _index_pieces(self):
         """
 
-        Get the piece at given position.
+        Build the square index, king lookup, bitboards, hash and scores from
+        the piece list.
 
         """
         for piece in self._pieces:
-            if piece.pos == pos:
-                return piece
+            square = piece.pos[0] + 8 * piece.pos[1]
+            self._board[square] = piece
+            self._squares[square] = _SNAPSHOT_CODES[piece.__class__,
+                                                    piece.color]
+            if piece.__class__ == pieces.King:
+                self._kings[piece.color] = piece
+
+        if self._backend == constants.BITBOARD:
+            self._bitboards = bitboards.Bitboards(self)
+        self.rehash()
+        self.material, self.positional = evaluation.get_scores(self)
+
+    @classmethod
+    def from_fen(cls, fen, backend=constants.PIECE_LIST):
+        """
+
+        Build a game from a FEN string: the board, side to move, castling
+        rights (as which kings and rooks have moved), en passant square and
+        halfmove clock (as idle_move_count). The halfmove and fullmove fields
+        may be left off. Raises ValueError for positions that can't come up
+        in a game: pawns on the first or last rank, other than one king a
+        side, the side not to move in check, or an en passant square no pawn
+        can have just skipped.
+
+        """
+        fields = fen.split()
+        if not 4 <= len(fields) <= 6:
+            raise ValueError('Not a valid FEN string')
+        game = cls.__new__(cls)
+        game._reset(backend)
+
+        rights = 0
+        for side, character in _CASTLING_CHARACTERS:
+            if character in fields[2]:
+                rights |= side
+        ranks = fields[0].split("/")
+        if len(ranks) != 8:
+            raise ValueError('Not a valid FEN string')
+        append = game._pieces.append
+        for rank_index, rank in enumerate(ranks):
+            y = 7 - rank_index
+            x = 0
+            for character in rank:
+                if character in _EMPTY_SQUARES:
+                    x += _EMPTY_SQUARES[character]
+                    continue
+                if not character in _PIECES_FOR_FEN or x > 7:
+                    raise ValueError('Not a valid FEN string')
+                piece_class, color = _PIECES_FOR_FEN[character]
+                if piece_class == pieces.Pawn and y in (0, 7):
+                    raise ValueError('Not a valid FEN string: pawn on the '
+                                     'first or last rank')
+                piece = piece_class(color, (x, y))
+                piece.has_moved = _has_moved(piece_class, color, (x, y),
+                                             rights)
+                append(piece)
+                x += 1
+            if x != 8:
+                raise ValueError('Not a valid FEN string')
+
+        if fields[1] == "w":
+            game._color_to_move = constants.WHITE
+        elif fields[1] == "b":
+            game._color_to_move = constants.BLACK
+        else:
+            raise ValueError('Not a valid FEN string')
+        if fields[3] != "-":
+            if len(fields[3]) != 2:
+                raise ValueError('Not a valid FEN string')
+            x = "abcdefgh".find(fields[3][0])
+            y = "12345678".find(fields[3][1])
+            if x < 0 or y < 0:
+                raise ValueError('Not a valid FEN string')
+            game._en_passant_pos = (x, y)
+        try:
+            counts = [int(field) for field in fields[4:]]
+        except ValueError:
+            raise ValueError('Not a valid FEN string: move counts must be '
+                             'numbers')
+        if counts:
+            game.idle_move_count = counts[0]
+        game._index_pieces()
+        kings = [piece.color for piece in game._pieces if
+                 piece.__class__ == pieces.King]
+        if sorted(kings) != [constants.BLACK, constants.WHITE]:
+            raise ValueError('Not a valid FEN string: needs one king a side')
+        if game._en_passant_pos and not game._is_en_passant_possible():
+            raise ValueError('Not a valid FEN string: no pawn can have just '
+                             'skipped the en passant square')
+        # the side that just moved can't have left its king in check
+        if game.in_check(not game.color_to_move):
+            raise ValueError('Not a valid FEN string: side not to move is in '
+                             'check')
+        return game
+
+    def _is_en_passant_possible(self):
+        """
+
+        If a pawn of the side not to move can have just made a double step
+        over the en passant square: the square is on the third rank from
+        that side, it and the pawn's start square are empty, and the pawn is
+        right in front of it.
+
+        """
+        x, y = self._en_passant_pos
+        if self._color_to_move == constants.WHITE:
+            start_y, skipped_y, pawn_y = 6, 5, 4
+        else:
+            start_y, skipped_y, pawn_y = 1, 2, 3
+        pawn = self.get_piece_at((x, pawn_y))
+        return (y == skipped_y and not self.get_piece_at((x, y)) and
+                not self.get_piece_at((x, start_y)) and pawn is not None and
+                pawn.__class__ == pieces.Pawn and
+                pawn.color != self._color_to_move)
+
+    def to_fen(self):
+        """
+
+        The position as a FEN string. The game doesn't count moves, so the
+        fullmove number is always 1.
+
+        """
+        ranks = []
+        for y in xrange(7, -1, -1):
+            rank = ""
+            empty = 0
+            for piece in self._board[8 * y:8 * y + 8]:
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                character = constants.PIECE_CHARACTERS[piece.__class__]
+                if piece.color == constants.BLACK:
+                    character = character.lower()
+                rank += character
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+
+        castling = "".join(character for side, character in
+                           _CASTLING_CHARACTERS if
+                           self._castling_rights & side) or "-"
+        if self._en_passant_pos:
+            en_passant = "abcdefgh"[self._en_passant_pos[0]] + \
+                str(self._en_passant_pos[1] + 1)
+        else:
+            en_passant = "-"
+        return "%s %s %s %s %i 1" % (
+            "/".join(ranks), "w" if self._color_to_move == constants.WHITE
+            else "b", castling, en_passant, self.idle_move_count)
+
+    def get_snapshot(self):
+        """
+
+        The position as an array of SNAPSHOT_SIZE bytes, for storing or
+        copying. The idle move count is capped at 255.
+
+        """
+        return self._squares + array.array("B", (
+            self._color_to_move, self._castling_rights,
+            self._en_passant_pos[0] + 1 if self._en_passant_pos else 0,
+            min(self.idle_move_count, 255)))
+
+    @classmethod
+    def from_snapshot(cls, snapshot, backend=constants.PIECE_LIST):
+        """
+
+        Build a game from a position saved by get_snapshot.
+
+        """
+        if len(snapshot) != SNAPSHOT_SIZE:
+            raise ValueError('Not a valid snapshot')
+        game = cls.__new__(cls)
+        game._reset(backend)
+
+        color, rights, en_passant, idle_move_count = snapshot[64:]
+        append = game._pieces.append
+        for square in xrange(64):
+            code = snapshot[square]
+            if not code:
+                continue
+            if code >= len(_SNAPSHOT_PIECES):
+                raise ValueError('Not a valid snapshot')
+            piece_class, piece_color = _SNAPSHOT_PIECES[code]
+            pos = (square & 7, square >> 3)
+            piece = piece_class(piece_color, pos)
+            piece.has_moved = _has_moved(piece_class, piece_color, pos,
+                                         rights)
+            append(piece)
+
+        game._color_to_move = bool(color)
+        if en_passant:
+            game._en_passant_pos = (en_passant - 1,
+                                    5 if color == constants.WHITE else 2)
+        game.idle_move_count = idle_move_count
+        game._index_pieces()
+        if len(game._kings) != 2:
+            raise ValueError('Not a valid snapshot')
+        return game
+
+    def copy(self):
+        """
+
+        A new game at the same position, sharing no pieces with this one.
+
+        """
+        return Game.from_snapshot(self.get_snapshot(), self._backend)
+
+    @property
+    def color_to_move(self):
+        return self._color_to_move
+
+    @color_to_move.setter
+    def color_to_move(self, color):
+        if color != self._color_to_move:
+            self.hash ^= zobrist.SIDE_KEY
+        self._color_to_move = color
+
+    @property
+    def en_passant_pos(self):
+        return self._en_passant_pos
+
+    @property
+    def castling_rights(self):
+        """
+
+        Castling still possible, as a mask of the side constants in zobrist.
+
+        """
+        return self._castling_rights
+
+    @en_passant_pos.setter
+    def en_passant_pos(self, pos):
+        if self._en_passant_pos:
+            self.hash ^= zobrist.EN_PASSANT_KEYS[self._en_passant_pos[0]]
+        if pos:
+            self.hash ^= zobrist.EN_PASSANT_KEYS[pos[0]]
+        self._en_passant_pos = pos
+
+    def rehash(self):
+        """
+
+        Work out the position hash from scratch.
+
+        """
+        self._castling_rights = zobrist.get_castling_rights(self)
+        self.hash = zobrist.get_hash(self)
+
+    def _update_castling_rights(self):
+        """
+
+        Bring the castling rights in the hash up to date after a king or rook
+        has moved or been taken.
+
+        """
+        rights = zobrist.get_castling_rights(self)
+        if rights != self._castling_rights:
+            self.hash ^= (zobrist.CASTLING_KEYS[self._castling_rights] ^
+                          zobrist.CASTLING_KEYS[rights])
+            self._castling_rights = rights
+
+    def get_piece_at(self, pos):
+        """
+
+        Get the piece at given position, or None for an empty or off board
+        square.
+
+        """
+        x, y = pos
+        if 0 <= x <= 7 and 0 <= y <= 7:
+            return self._board[x + 8 * y]
+        return None
+
+    def _add_piece(self, piece, index=None):
+        """
+
+        Put a piece on the board, optionally at a given place in the piece
+        list.
+
+        """
+        if index is None:
+            self._pieces.append(piece)
+        else:
+            self._pieces.insert(index, piece)
+        square = piece.pos[0] + 8 * piece.pos[1]
+        self._board[square] = piece
+        self._squares[square] = _SNAPSHOT_CODES[piece.__class__, piece.color]
+        self.hash ^= zobrist.PIECE_KEYS[piece.__class__][piece.color][square]
+        self.material[piece.color] += evaluation.MATERIAL[piece.__class__]
+        self.positional[piece.color] += evaluation.POSITION_SCORES[
+            piece.__class__][piece.color][square]
+        if piece.__class__ == pieces.King:
+            self._kings[piece.color] = piece
+        if self._bitboards:
+            self._bitboards.add(piece)
+        if self._attack_maps:
+            self._attack_maps.add(piece, square)
+
+    def _remove_piece(self, piece):
+        """
+
+        Take a piece off the board. Returns where it was in the piece list so
+        it can be put back in the same place.
+
+        """
+        index = self._pieces.index(piece)
+        del self._pieces[index]
+        square = piece.pos[0] + 8 * piece.pos[1]
+        self._board[square] = None
+        self._squares[square] = 0
+        self.hash ^= zobrist.PIECE_KEYS[piece.__class__][piece.color][square]
+        self.material[piece.color] -= evaluation.MATERIAL[piece.__class__]
+        self.positional[piece.color] -= evaluation.POSITION_SCORES[
+            piece.__class__][piece.color][square]
+        if self._bitboards:
+            self._bitboards.remove(piece)
+        if self._attack_maps:
+            self._attack_maps.remove(piece, square)
+        return index
+
+    def _relocate_piece(self, piece, pos):
+        """
+
+        Move a piece to an empty square, keeping the square index in sync.
+
+        """
+        old_square = piece.pos[0] + 8 * piece.pos[1]
+        new_square = pos[0] + 8 * pos[1]
+        self._board[old_square] = None
+        if self._attack_maps:
+            self._attack_maps.remove(piece, old_square)
+        if self._bitboards:
+            self._bitboards.relocate(piece, piece.pos, pos)
+        piece.pos = pos
+        self._board[new_square] = piece
+        self._squares[new_square] = self._squares[old_square]
+        self._squares[old_square] = 0
+        if self._attack_maps:
+            self._attack_maps.add(piece, new_square)
+        keys = zobrist.PIECE_KEYS[piece.__class__][piece.color]
+        self.hash ^= keys[old_square] ^ keys[new_square]
+        scores = evaluation.POSITION_SCORES[piece.__class__][piece.color]
+        self.positional[piece.color] += scores[new_square] - scores[old_square]
 
     def move_piece_to(self, piece, pos):
         """
 
         Update the piece's position and capture any existing piece. All moves
-        should be made with this method.
+        should be made with this method or make_move.
+
+        """
+        self.make_move(piece, pos)
+
+    def make_move(self, piece, pos):
+        """
+
+        Make a move and return an UndoRecord that unmake_move can use to take
+        it back again.
 
         """
         # Make sure we're not dealing with a piece from another game:
         piece = self.get_piece_at(piece.pos)
         previous_piece = self.get_piece_at(pos)
+        record = UndoRecord(self, piece, pos)
 
         # Check for taking
         if previous_piece:
@@ -80,22 +589,24 @@ class Game(object):
                 raise RuntimeError("%s took %s!" % (piece, previous_piece))
 
             # Remove the piece
-            self._pieces.remove(previous_piece)
+            record.captured = previous_piece
+            record.captured_index = self._remove_piece(previous_piece)
 
         # Move the piece
         old_pos = piece.pos
-        piece.pos = pos
+        self._relocate_piece(piece, pos)
 
         # Handle special cases. Pawns:
         if piece.__class__ == pieces.Pawn:
             # Promotion. TODO: Handle promotion to other officers
             if (piece.color == pieces.WHITE and piece.pos[1] == 7 or
                piece.color == pieces.BLACK and piece.pos[1] == 0):
-                self._pieces.remove(piece)
-                self._pieces.append(pieces.Queen(piece.color, piece.pos))
+                record.piece_index = self._remove_piece(piece)
+                record.promoted = pieces.Queen(piece.color, piece.pos)
+                self._add_piece(record.promoted)
 
             # En passant
-            if piece.pos == self.en_passant_pos:
+            if piece.pos == self.en_passant_pos and not previous_piece:
                 if piece.pos[1] == 2:
                     taken_pawn = self.get_piece_at((piece.pos[0], 3))
                 elif piece.pos[1] == 5:
@@ -104,18 +615,23 @@ class Game(object):
                     raise RuntimeError("Messed up en passant.")
                 if not taken_pawn:
                     raise RuntimeError("Messed up en passant again.")
-                self._pieces.remove(taken_pawn)
+                record.captured = taken_pawn
+                record.captured_index = self._remove_piece(taken_pawn)
 
         # Castling
         if piece.__class__ == pieces.King:
+            rook_move = None
             if old_pos[0] - pos[0] == 2:  # Queen side castling
-                queen_rook = self.get_piece_at((0, pos[1]))
-                queen_rook.pos = (3, pos[1])
-                queen_rook.has_moved = True
+                rook_move = ((0, pos[1]), (3, pos[1]))
             if old_pos[0] - pos[0] == -2:  # King side castling
-                king_rook = self.get_piece_at((7, pos[1]))
-                king_rook.pos = (5, pos[1])
-                king_rook.has_moved = True
+                rook_move = ((7, pos[1]), (5, pos[1]))
+            if rook_move:
+                rook = self.get_piece_at(rook_move[0])
+                record.rook = rook
+                record.rook_from = rook_move[0]
+                record.rook_has_moved = rook.has_moved
+                self._relocate_piece(rook, rook_move[1])
+                rook.has_moved = True
 
         # Update en passant status
         if (piece.__class__ == pieces.Pawn and piece.pos[1] in [3, 4] and
@@ -130,6 +646,9 @@ class Game(object):
         # Update game state for castling etc.
         piece.has_moved = True
         self.last_moved_piece = piece
+        if (piece.__class__ in (pieces.King, pieces.Rook) or
+           previous_piece.__class__ == pieces.Rook):
+            self._update_castling_rights()
 
         # Alter idle move count - reset if it's a take or a pawn move
         if piece.__class__ == pieces.Pawn or previous_piece:
@@ -137,6 +656,40 @@ class Game(object):
         else:
             self.idle_move_count += 1
 
+        return record
+
+    def unmake_move(self, record):
+        """
+
+        Take back a move made with make_move. Moves must be taken back in the
+        reverse order they were made.
+
+        """
+        piece = record.piece
+
+        # Put the castling rook back in the corner
+        if record.rook:
+            self._relocate_piece(record.rook, record.rook_from)
+            record.rook.has_moved = record.rook_has_moved
+
+        # Swap the promoted queen for the original pawn
+        if record.promoted:
+            self._remove_piece(record.promoted)
+            self._add_piece(piece, record.piece_index)
+
+        # Move the piece back, then restore whatever it took
+        self._relocate_piece(piece, record.from_pos)
+        piece.has_moved = record.has_moved
+        if record.captured:
+            self._add_piece(record.captured, record.captured_index)
+        if (piece.__class__ in (pieces.King, pieces.Rook) or
+           record.captured.__class__ == pieces.Rook):
+            self._update_castling_rights()
+
+        self.en_passant_pos = record.en_passant_pos
+        self.idle_move_count = record.idle_move_count
+        self.last_moved_piece = record.last_moved_piece
+
     def check_endgame(self):
         """
 
@@ -144,7 +697,7 @@ class Game(object):
 
         """
         # See if that's the end of the game
-        if not self.get_valid_moves(self.color_to_move):
+        if not self.has_legal_move(self.color_to_move):
             # In check? That's checkmate
             if self.in_check():
                 raise EndGameException("Checkmated! %s wins!" %
@@ -160,14 +713,7 @@ class Game(object):
         """True if the piece can be taken, otherwise False.
 
         """
-        opposing_moves = self.get_valid_moves(not piece.color,
-                                              testing_check=True)
-        for move in opposing_moves:
-            if self.get_piece_at(move[1]) == piece:
-                # They have a move that could potentially take the piece
-                # on the next turn
-                return True
-        return False
+        return self.is_square_attacked(piece.pos, not piece.color)
 
     def in_check(self, color=None):
         """
@@ -178,14 +724,8 @@ class Game(object):
         if color is None:
             color = self.color_to_move
 
-        # See if any of the other player's moves could take the king
-        king = [piece for piece in self._pieces if
-                piece.__class__ == pieces.King and piece.color == color][0]
-        if self.is_piece_at_risk(king):
-            return True
-
-        # The king isn't under attack
-        return False
+        # See if any of the other player's pieces attack the king
+        return self.is_square_attacked(self._kings[color].pos, not color)
 
     def get_pieces(self, color=None):
         """
@@ -197,29 +737,219 @@ class Game(object):
             return self._pieces
         return [piece for piece in self._pieces if piece.color == color]
 
+    def enable_attack_maps(self):
+        """
+
+        Start keeping count of the pieces attacking each square. There's no
+        turning it off again.
+
+        """
+        if not self._attack_maps:
+            self._attack_maps = attacks.AttackMaps(self._board)
+
+    def get_attack_counts(self):
+        """
+
+        How many pieces of each color attack (or, for its own pieces,
+        defend) each square, ignoring pins, as a list of 64 counts per color.
+        Counted from scratch unless attack maps are enabled, in which case
+        the lists are the maps themselves and mustn't be changed.
+
+        """
+        if self._attack_maps:
+            return self._attack_maps.counts
+        return attacks.count_attacks(self._board)
+
+    def is_square_attacked(self, pos, by_color):
+        """
+
+        True if a piece of the given color attacks the square.
+
+        """
+        if self._attack_maps:
+            return self._attack_maps.counts[by_color][pos[0] + 8 * pos[1]] > 0
+        if self._bitboards:
+            return self._bitboards.is_square_attacked(pos[0] + 8 * pos[1],
+                                                      by_color)
+        return self._scan_for_attack(pos, by_color)
+
+    def _scan_for_attack(self, pos, by_color):
+        """
+
+        Same as is_square_attacked, looking outward from the square for
+        knights, pawns, the king and sliders rather than generating any
+        moves.
+
+        """
+        board = self._board
+        x, y = pos
+
+        for dx, dy in constants.KNIGHT_OFFSETS:
+            tx, ty = x + dx, y + dy
+            if 0 <= tx <= 7 and 0 <= ty <= 7:
+                piece = board[tx + 8 * ty]
+                if (piece and piece.color == by_color and
+                   piece.__class__ == pieces.Knight):
+                    return True
+
+        # Pawns attack diagonally forward, so look the other way for them
+        pawn_y = y - 1 if by_color == constants.WHITE else y + 1
+        if 0 <= pawn_y <= 7:
+            for tx in x - 1, x + 1:
+                if 0 <= tx <= 7:
+                    piece = board[tx + 8 * pawn_y]
+                    if (piece and piece.color == by_color and
+                       piece.__class__ == pieces.Pawn):
+                        return True
+
+        for directions, slider in ((constants.STRAIGHT_DIRECTIONS,
+                                    pieces.Rook),
+                                   (constants.DIAGONAL_DIRECTIONS,
+                                    pieces.Bishop)):
+            for dx, dy in directions:
+                tx, ty = x + dx, y + dy
+                distance = 1
+                while 0 <= tx <= 7 and 0 <= ty <= 7:
+                    piece = board[tx + 8 * ty]
+                    if piece:
+                        if piece.color == by_color and (
+                           piece.__class__ in (slider, pieces.Queen) or
+                           distance == 1 and piece.__class__ == pieces.King):
+                            return True
+                        break
+                    tx, ty = tx + dx, ty + dy
+                    distance += 1
+        return False
+
+    def _get_checks_and_pins(self, color):
+        """
+
+        Look outward from the color's king for checks and pins.
+
+        Returns (check_mask, pins). check_mask is None when not in check,
+        otherwise the set of squares a move other than the king's must land
+        on to deal with the check (empty in double check). pins maps each
+        pinned piece to the squares it can move to without exposing the king.
+
+        """
+        board = self._board
+        x, y = self._kings[color].pos
+        checkers = 0
+        check_mask = set()
+        pins = {}
+
+        for directions, slider in ((constants.STRAIGHT_DIRECTIONS,
+                                    pieces.Rook),
+                                   (constants.DIAGONAL_DIRECTIONS,
+                                    pieces.Bishop)):
+            for dx, dy in directions:
+                ray = []
+                pinned = None
+                tx, ty = x + dx, y + dy
+                while 0 <= tx <= 7 and 0 <= ty <= 7:
+                    ray.append((tx, ty))
+                    piece = board[tx + 8 * ty]
+                    tx, ty = tx + dx, ty + dy
+                    if not piece:
+                        continue
+                    if piece.color == color:
+                        if pinned:
+                            break
+                        pinned = piece
+                        continue
+                    if piece.__class__ in (slider, pieces.Queen):
+                        if pinned:
+                            pins[pinned] = set(ray)
+                        else:
+                            checkers += 1
+                            check_mask.update(ray)
+                    break
+
+        for dx, dy in constants.KNIGHT_OFFSETS:
+            tx, ty = x + dx, y + dy
+            if 0 <= tx <= 7 and 0 <= ty <= 7:
+                piece = board[tx + 8 * ty]
+                if (piece and piece.color != color and
+                   piece.__class__ == pieces.Knight):
+                    checkers += 1
+                    check_mask.add((tx, ty))
+
+        pawn_y = y + 1 if color == constants.WHITE else y - 1
+        if 0 <= pawn_y <= 7:
+            for tx in x - 1, x + 1:
+                if 0 <= tx <= 7:
+                    piece = board[tx + 8 * pawn_y]
+                    if (piece and piece.color != color and
+                       piece.__class__ == pieces.Pawn):
+                        checkers += 1
+                        check_mask.add((tx, pawn_y))
+
+        if not checkers:
+            return None, pins
+        if checkers > 1:
+            return set(), pins
+        return check_mask, pins
+
+    def _iter_legal_moves(self, piece, check_mask, pins):
+        """
+
+        The piece's moves that don't leave its king in check, given the
+        checks and pins from _get_checks_and_pins, one at a time.
+
+        """
+        targets = piece.iter_valid_moves(self)
+        enemy_color = not piece.color
+
+        # The king can go anywhere that isn't attacked once it has moved
+        # off its square, so look with it taken off the board (which the
+        # attack maps know nothing about). It goes back before each move is
+        # handed out.
+        if piece.__class__ == pieces.King:
+            square = piece.pos[0] + 8 * piece.pos[1]
+            for pos in targets:
+                self._board[square] = None
+                attacked = self._scan_for_attack(pos, enemy_color)
+                self._board[square] = piece
+                if not attacked:
+                    yield (piece, pos)
+            return
+
+        allowed = pins.get(piece)
+        for pos in targets:
+            # En passant takes a piece off a square it doesn't move to, which
+            # neither pins nor the check mask allow for, so try it out.
+            if (piece.__class__ == pieces.Pawn and
+               pos == self.en_passant_pos and not self.get_piece_at(pos)):
+                record = self.make_move(piece, pos)
+                exposed = self.in_check(piece.color)
+                self.unmake_move(record)
+                if not exposed:
+                    yield (piece, pos)
+                continue
+            if allowed is not None and not pos in allowed:
+                continue
+            if check_mask is not None and not pos in check_mask:
+                continue
+            yield (piece, pos)
+
     def get_valid_moves_for_piece(self, piece, testing_check=False):
         """Get the moves the given piece can legally make.
 
         """
-        moves = []
-
-        # Get every possible move
-        for pos in piece.get_valid_moves(self, testing_check=testing_check):
-            moves.append((piece, pos))
+        # Make sure we're not dealing with a piece from another game
+        piece = self.get_piece_at(piece.pos)
 
-        # If we're not worried about putting ourself in check, we're done.
+        # If we're not worried about putting ourself in check, every possible
+        # move will do.
         if testing_check:
-            return moves
-
-        # Filter out moves that would put the King in check
-        would_check = []
-        for move in moves:
-            test_game = copy.deepcopy(self)
-            test_game.move_piece_to(move[0], move[1])
-            if test_game.in_check(piece.color):
-                would_check.append(move)
+            if self._bitboards:
+                return self._bitboards.get_valid_moves_for_piece(
+                    piece, testing_check=True)
+            return [(piece, pos) for pos in
+                    piece.get_valid_moves(self, testing_check=True)]
 
-        return [move for move in moves if not move in would_check]
+        return [move for move in self._get_cached_moves(piece.color) if
+                move[0] is piece]
 
     def get_valid_moves(self, color, testing_check=False):
         """All possible moves for the given color.
@@ -229,10 +959,82 @@ class Game(object):
         moves that would put the King at risk.
 
         """
-        moves = []
+        if not testing_check:
+            return self._get_cached_moves(color)
+        if self._bitboards:
+            return self._bitboards.get_valid_moves(
+                color, testing_check=testing_check)
 
         # Get every possible move
+        moves = []
         for piece in self.get_pieces(color):
             moves.extend(self.get_valid_moves_for_piece(piece,
-                         testing_check=testing_check))
+                         testing_check=True))
+        return moves
+
+    def _get_cached_moves(self, color):
+        """
+
+        Legal moves for the color, from the cache if they've already been
+        worked out in this position.
+
+        """
+        key = (self.hash, color)
+        entry = self._move_cache.get(key)
+        if entry is not None:
+            self.move_cache_hits += 1
+            board = self._board
+            return [(board[square], pos) for square, pos in entry]
+
+        self.move_cache_misses += 1
+        if self._bitboards:
+            moves = self._bitboards.get_valid_moves(color)
+        else:
+            # Work out checks and pins once for every piece
+            moves = []
+            check_mask, pins = self._get_checks_and_pins(color)
+            for piece in self.get_pieces(color):
+                moves.extend(self._iter_legal_moves(piece, check_mask, pins))
+
+        # Pieces are stored by square, as a promotion that is taken back and
+        # made again brings in a new queen
+        if len(self._move_cache) >= MOVE_CACHE_SIZE:
+            self._move_cache.clear()
+        self._move_cache[key] = [(piece.pos[0] + 8 * piece.pos[1], pos) for
+                                 piece, pos in moves]
         return moves
+
+    def iter_legal_moves(self, color=None):
+        """
+
+        Generator version of get_valid_moves for the given color (by default
+        the side to move), working out each move only when it's asked for.
+        The position mustn't change while the moves are being iterated.
+
+        """
+        if color is None:
+            color = self.color_to_move
+        if (self.hash, color) in self._move_cache:
+            for move in self._get_cached_moves(color):
+                yield move
+            return
+        if self._bitboards:
+            for move in self._bitboards.iter_valid_moves(color):
+                yield move
+            return
+
+        check_mask, pins = self._get_checks_and_pins(color)
+        for piece in self.get_pieces(color):
+            for move in self._iter_legal_moves(piece, check_mask, pins):
+                yield move
+
+    def has_legal_move(self, color=None):
+        """
+
+        True if the given color (by default the side to move) has any legal
+        move. Stops at the first one found.
+
+        """
+        for move in self.iter_legal_moves(color):
+            return True
+        return False
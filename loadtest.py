@@ -0,0 +1,217 @@
+# std lib imports
+import sys
+import time
+import random
+import socket
+import argparse
+import threading
+
+# local imports
+import fencheck
+import server
+
+# Latency percentiles reported
+PERCENTILES = [50, 90, 99]
+
+# Seconds to wait before asking again when the server is busy
+BUSY_WAIT = 0.05
+
+
+def check_server(address, family):
+    """
+
+    Check the server turns down new games it can't play, such as one from a
+    position with an impossible en passant square. Prints any it accepted
+    and returns False if there were some.
+
+    """
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.connect(address)
+    lines = sock.makefile("r")
+    all_correct = True
+    commands = [("new fen %s" % fen, "error bad fen") for reason, fen in
+                fencheck.INVALID_FENS]
+    commands += [("new depth x", "error bad depth"),
+                 ("new movetime y", "error bad movetime")]
+    try:
+        for command, expected in commands:
+            sock.sendall(command + "\n")
+            reply = lines.readline().strip()
+            if reply != expected:
+                print "%s: expected %s, got %s" % (command, expected, reply)
+                all_correct = False
+        sock.sendall("quit\n")
+    finally:
+        sock.close()
+    return all_correct
+
+
+def get_percentile(values, percentile):
+    """
+
+    The value below which the given percent of the (sorted) values fall,
+    or 0 if there are none.
+
+    """
+    if not values:
+        return 0.0
+    index = int(round(percentile / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+class Client(object):
+    """
+
+    One simulated player: plays random legal moves against the engine over
+    its own connection, one game after another, timing each move.
+
+    ack_times are the seconds from sending a move to the server accepting
+    it, which shows how quickly the event loop answers under load.
+    reply_times run on to the engine's move, so include the search and any
+    waiting while the server was too busy to start it.
+
+    """
+    def __init__(self, address, family, depth, max_plies, seed):
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.connect(address)
+        self.lines = self.sock.makefile("r")
+        self.depth = depth
+        self.max_plies = max_plies
+        self.random = random.Random(seed)
+        self.moves = 0
+        self.games = 0
+        self.errors = 0
+        self.busy = 0
+        self.ack_times = []
+        self.reply_times = []
+
+    def send(self, line):
+        self.sock.sendall(line + "\n")
+
+    def read(self, *replies):
+        """
+
+        The next line starting with one of the replies, as a list of words.
+        Errors are counted and returned too, with the server being busy
+        counted apart from the rest.
+
+        """
+        while True:
+            line = self.lines.readline()
+            if not line:
+                raise IOError("Server closed the connection")
+            words = line.split()
+            if words and words[0] == "error":
+                if words[-1] == "busy":
+                    self.busy += 1
+                else:
+                    self.errors += 1
+                return words
+            if words and words[0] in replies:
+                return words
+
+    def play_game(self, deadline):
+        """
+
+        Play a game until it ends, reaches max_plies or the deadline passes.
+
+        """
+        self.send("new depth %i" % self.depth)
+        number = self.read("game")[1]
+        plies = 0
+        while plies < self.max_plies and time.time() < deadline:
+            self.send("moves %s" % number)
+            moves = self.read("moves")[2:]
+            if not moves:
+                break
+            start = time.time()
+            self.send("move %s %s" % (number, self.random.choice(moves)))
+            if self.read("moved")[0] != "moved":
+                break
+            self.ack_times.append(time.time() - start)
+            self.moves += 1
+            reply = self.read("bestmove", "end")
+            while reply[-1] == "busy":
+                time.sleep(BUSY_WAIT)
+                self.send("go %s" % number)
+                reply = self.read("bestmove", "end")
+            if reply[0] != "bestmove":
+                break
+            self.reply_times.append(time.time() - start)
+            self.moves += 1
+            plies += 2
+        self.send("close %s" % number)
+        self.read("closed")
+        self.games += 1
+
+    def run(self, seconds):
+        deadline = time.time() + seconds
+        try:
+            while time.time() < deadline:
+                self.play_game(deadline)
+        finally:
+            self.send("quit")
+            self.sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load test a running server with many clients playing "
+                    "random moves, and report moves/sec and latency "
+                    "percentiles.")
+    parser.add_argument("--host", default=server.HOST)
+    parser.add_argument("--port", type=int, default=server.PORT)
+    parser.add_argument("--unix", default=None,
+                        help="connect to this Unix socket instead of TCP")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--depth", type=int, default=1,
+                        help="engine search depth for the games")
+    parser.add_argument("--max-plies", type=int, default=100,
+                        help="longest game before starting another")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="store_true",
+                        help="check the server turns down bad new games "
+                             "instead of load testing it")
+    args = parser.parse_args()
+
+    if args.unix:
+        address, family = args.unix, socket.AF_UNIX
+    else:
+        address, family = (args.host, args.port), socket.AF_INET
+    if args.check:
+        if check_server(address, family):
+            print "Server checks ok"
+        else:
+            sys.exit(1)
+        return
+    clients = [Client(address, family, args.depth, args.max_plies,
+                      args.seed + number) for number in xrange(args.clients)]
+    threads = [threading.Thread(target=client.run, args=(args.seconds,))
+               for client in clients]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    moves = sum(client.moves for client in clients)
+    print "%i clients, %i games, %i moves in %.1fs: %.1f moves/sec" % (
+        len(clients), sum(client.games for client in clients), moves,
+        elapsed, moves / elapsed)
+    print "%i errors, %i busy replies" % (
+        sum(client.errors for client in clients),
+        sum(client.busy for client in clients))
+    for name, attribute in ("accepted", "ack_times"), ("answered",
+                                                        "reply_times"):
+        times = sorted(time_taken for client in clients for time_taken in
+                       getattr(client, attribute))
+        print "Move %s: %s, max %.1fms" % (name, ", ".join(
+            "p%i %.1fms" % (percentile,
+                            get_percentile(times, percentile) * 1000)
+            for percentile in PERCENTILES),
+            (times[-1] if times else 0.0) * 1000)
+
+if __name__ == "__main__":
+    main()
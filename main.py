@@ -1,14 +1,58 @@
 # std lib imports
 import sys
+import argparse
 
 # local imports
 import player
 import constants
 import games
+import pgn
+import timecontrol
+import uci
 import utility
 
 
+def get_computer(game, color, args, clock=None, against_human=False):
+    """
+
+    The computer player the command line options ask for.
+
+    """
+    if args.search or args.ponder:
+        # Thinking on another computer's time would only slow that one down
+        return player.SearchComputer(game, color, clock=clock,
+                                     ponder=args.ponder and against_human)
+    # The heuristic player reads these for every move it weighs. They'd only
+    # slow a search down, as every move it tries has to update them.
+    game.enable_attack_maps()
+    return player.Computer(game, color)
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Play chess on the command "
+                                                 "line.")
+    parser.add_argument("--pgn", default=None,
+                        help="append the finished game to this PGN file")
+    parser.add_argument("--search", action="store_true",
+                        help="let the computer search ahead")
+    parser.add_argument("--time", type=float, default=None,
+                        help="minutes on each player's clock")
+    parser.add_argument("--increment", type=float, default=0.0,
+                        help="seconds added to a clock after each move")
+    parser.add_argument("--ponder", action="store_true",
+                        help="let a searching computer think on your time")
+    parser.add_argument("--uci", action="store_true",
+                        help="run as a UCI engine instead of showing the "
+                             "menu")
+    args = parser.parse_args()
+
+    if args.uci:
+        uci.Engine().run()
+        return
+
+    clock = None
+    if args.time:
+        clock = timecontrol.Clock(args.time * 60, args.increment)
     game = games.Game()
 
     # get game type
@@ -24,32 +68,65 @@ def main():
             print "Select an option above (1-3)"
             continue
         if option == "1":
-            players = {constants.WHITE: player.Computer(game, constants.WHITE),
-                       constants.BLACK: player.Computer(game, constants.BLACK)}
+            players = {constants.WHITE: get_computer(game, constants.WHITE,
+                                                     args, clock),
+                       constants.BLACK: get_computer(game, constants.BLACK,
+                                                     args, clock)}
         elif option == "2":
             players = {constants.WHITE: player.Human(game, constants.WHITE),
-                       constants.BLACK: player.Computer(game, constants.BLACK)}
+                       constants.BLACK: get_computer(game, constants.BLACK,
+                                                     args, clock, True)}
         elif option == "3":
             players = {constants.WHITE: player.Human(game, constants.WHITE),
                        constants.BLACK: player.Human(game, constants.BLACK)}
         else:
             raise RuntimeError()
         break
+    player_names = {"1": ("Computer", "Computer"),
+                    "2": ("Human", "Computer"),
+                    "3": ("Human", "Human")}[option]
 
     # game loop
+    san_moves = []
     try:
         while True:
             utility.draw_game(game)
+            if clock:
+                print clock
 
             player_to_move = players[game.color_to_move]
+            if clock:
+                clock.start(game.color_to_move)
             move = player_to_move.get_move()
+            if clock:
+                clock.stop()
+                if clock.flagged is not None:
+                    raise games.EndGameException(
+                        "Out of time! %s wins!" % constants.COLOR_NAMES[
+                            not clock.flagged].title())
+            san_moves.append(pgn.get_san(game, move[0], move[1]))
             game.move_piece_to(move[0], move[1])
             game.color_to_move = not game.color_to_move
             game.check_endgame()
+            player_to_move.ponder()
 
     except games.EndGameException as e:
         utility.draw_game(game)
         print e
+        if clock and clock.flagged is not None:
+            result = {constants.WHITE: constants.BLACK_WINS,
+                      constants.BLACK: constants.WHITE_WINS}[clock.flagged]
+        else:
+            result = pgn.get_result(game)
+        if args.pgn:
+            with open(args.pgn, "a") as pgn_file:
+                pgn.write_game(pgn_file, san_moves, result,
+                               {"White": player_names[0],
+                                "Black": player_names[1],
+                                "Termination": str(e)})
+    finally:
+        for each_player in players.values():
+            each_player.stop_pondering()
 
 if __name__ == "__main__":
     try:
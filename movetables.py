@@ -0,0 +1,197 @@
+# std lib imports
+import os
+import time
+import marshal
+import argparse
+
+# local imports
+# (none: pieces imports this module while constants is still being loaded)
+
+# Piece types
+WHITE = True
+BLACK = False
+
+# Bump whenever the tables change, so older cache files get rebuilt
+VERSION = 1
+
+# Where the tables are kept between runs, once written by main()
+CACHE_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "movetables.cache")
+
+# Directions in order around the compass, starting with up, so the opposite
+# of direction i is i + 4 (mod 8). Even ones are straight, odd ones
+# diagonal.
+DIRECTIONS = [(0, 1), (1, 1), (1, 0), (1, -1),
+              (0, -1), (-1, -1), (-1, 0), (-1, 1)]
+STRAIGHT = [0, 2, 4, 6]
+DIAGONAL = [1, 3, 5, 7]
+
+_KNIGHT_OFFSETS = [(1, 2), (2, 1), (2, -1), (1, -2),
+                   (-1, -2), (-2, -1), (-2, 1), (-1, 2)]
+
+
+def _get_targets(square, offsets):
+    """
+
+    Squares reachable from square with one of the offsets, in order.
+
+    """
+    x, y = square & 7, square >> 3
+    return [tx + 8 * ty for tx, ty in
+            ((x + dx, y + dy) for dx, dy in offsets) if
+            0 <= tx <= 7 and 0 <= ty <= 7]
+
+
+def build_tables():
+    """
+
+    Work every table out from scratch, as a dict of plain lists, tuples and
+    dicts that marshal can store. Squares are numbered x + 8 * y.
+
+    """
+    square_pos = [(square & 7, square >> 3) for square in xrange(64)]
+    square_names = ["abcdefgh"[x] + "12345678"[y] for x, y in square_pos]
+    pos_for_name = {}
+    for square, name in enumerate(square_names):
+        pos_for_name[name] = square_pos[square]
+        pos_for_name[name.upper()] = square_pos[square]
+
+    rays = []
+    for square in xrange(64):
+        square_rays = []
+        for dx, dy in DIRECTIONS:
+            ray = []
+            x, y = (square & 7) + dx, (square >> 3) + dy
+            while 0 <= x <= 7 and 0 <= y <= 7:
+                ray.append(x + 8 * y)
+                x, y = x + dx, y + dy
+            square_rays.append(ray)
+        rays.append(square_rays)
+
+    # Pawn pushes are (one square, two squares or None), or None on the
+    # last rank. Captures are listed left then right as the pawn sees it.
+    pawn_pushes = {WHITE: [], BLACK: []}
+    pawn_captures = {WHITE: [], BLACK: []}
+    for color, step, start_rank in (WHITE, 1, 1), (BLACK, -1, 6):
+        for square in xrange(64):
+            y = square >> 3
+            if not 0 <= y + step <= 7:
+                pawn_pushes[color].append(None)
+            else:
+                pawn_pushes[color].append(
+                    (square + 8 * step,
+                     square + 16 * step if y == start_rank else None))
+            pawn_captures[color].append(
+                _get_targets(square, [(-step, step), (step, step)]))
+
+    return {"version": VERSION,
+            "square_pos": square_pos,
+            "square_names": square_names,
+            "pos_for_name": pos_for_name,
+            "knight_targets": [_get_targets(square, _KNIGHT_OFFSETS)
+                               for square in xrange(64)],
+            "king_targets": [_get_targets(square, DIRECTIONS)
+                             for square in xrange(64)],
+            "rays": rays,
+            "pawn_pushes": pawn_pushes,
+            "pawn_captures": pawn_captures}
+
+
+def save_tables(tables, filename=CACHE_FILENAME):
+    """
+
+    Write the tables to the cache file. The file is written under another
+    name and then renamed, so processes starting at the same time never
+    read half of one.
+
+    """
+    temporary = "%s.%i" % (filename, os.getpid())
+    with open(temporary, "wb") as cache_file:
+        marshal.dump(tables, cache_file)
+    os.rename(temporary, filename)
+
+
+def load_tables(filename=CACHE_FILENAME):
+    """
+
+    The tables from the cache file, or None if it's missing, unreadable or
+    out of date.
+
+    """
+    try:
+        with open(filename, "rb") as cache_file:
+            tables = marshal.load(cache_file)
+        if tables.get("version") == VERSION:
+            return tables
+    except (IOError, OSError, EOFError, ValueError, TypeError,
+            AttributeError):
+        pass
+    return None
+
+
+_tables = None
+
+
+def get_tables():
+    """
+
+    The tables, loaded from the cache file on first use, or built in memory
+    if there isn't a usable one. Nothing is written here, so importing the
+    module never touches the disk beyond reading; main() writes the cache.
+
+    """
+    global _tables
+    if _tables is None:
+        _tables = load_tables() or build_tables()
+    return _tables
+
+# The move generators look these up as they're imported, which is their
+# first use
+_tables = get_tables()
+
+# (x, y) for each square, and its name such as "e4"
+SQUARE_POS = _tables["square_pos"]
+SQUARE_NAMES = _tables["square_names"]
+# (x, y) for each square name, in lower or upper case
+POS_FOR_NAME = _tables["pos_for_name"]
+# Squares a knight or king on each square can move to
+KNIGHT_TARGETS = _tables["knight_targets"]
+KING_TARGETS = _tables["king_targets"]
+# Squares in each of DIRECTIONS from each square, nearest first
+RAYS = _tables["rays"]
+# Per color and square: a pawn's pushes and the squares it captures on
+PAWN_PUSHES = _tables["pawn_pushes"]
+PAWN_CAPTURES = _tables["pawn_captures"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the move tables and write them to the cache "
+                    "file, and compare building them with loading them.")
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--filename", default=CACHE_FILENAME,
+                        help="cache file to write (default next to the code)")
+    args = parser.parse_args()
+
+    start = time.time()
+    for _ in xrange(args.repeat):
+        tables = build_tables()
+    build_time = (time.time() - start) / args.repeat
+    try:
+        save_tables(tables, args.filename)
+    except (IOError, OSError) as e:
+        # the tables just get built in memory every run instead
+        print "Couldn't write %s: %s" % (args.filename, e)
+        print "Building: %.0fus" % (build_time * 1e6)
+        return
+    start = time.time()
+    for _ in xrange(args.repeat):
+        load_tables(args.filename)
+    load_time = (time.time() - start) / args.repeat
+    print "Tables written to %s (%i bytes)" % (
+        args.filename, os.path.getsize(args.filename))
+    print "Building: %.0fus, loading: %.0fus" % (build_time * 1e6,
+                                                 load_time * 1e6)
+
+if __name__ == "__main__":
+    main()
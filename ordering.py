@@ -0,0 +1,225 @@
+# std lib imports
+import time
+import argparse
+
+# local imports
+import constants
+import pieces
+
+# Sort keys for each kind of move; within a kind, higher keys go first.
+TABLE_MOVE_SCORE = 1000000
+CAPTURE_SCORE = 500000
+KILLER_SCORES = (400000, 390000)
+HISTORY_LIMIT = 300000
+
+# Deepest ply killer moves are kept for
+MAX_PLY = 128
+
+# Move kinds, for the cutoff statistics
+TABLE = "table"
+CAPTURE = "capture"
+KILLER = "killer"
+QUIET = "quiet"
+
+
+class MoveOrderer(object):
+    """
+
+    Orders moves so alpha-beta finds cutoffs early.
+
+    Moves are tried in this order: the transposition table's move, captures
+    by most valuable victim then least valuable attacker (MVV-LVA, from
+    constants.PIECE_VALUES), the two killer moves that last caused a cutoff
+    at the same ply, then the remaining quiet moves by how often they have
+    caused cutoffs (history heuristic). Moves are picked one at a time, so
+    once a cutoff happens the rest are never sorted.
+
+    Each heuristic can be switched off to measure what it's worth, and stats
+    counts the cutoffs found by each kind of move.
+
+    """
+    def __init__(self, use_captures=True, use_killers=True,
+                 use_history=True):
+        self.use_captures = use_captures
+        self.use_killers = use_killers
+        self.use_history = use_history
+        self.clear()
+
+    def clear(self):
+        """
+
+        Forget killers, history and statistics.
+
+        """
+        self.killers = [[None, None] for ply in xrange(MAX_PLY)]
+        # cutoff counts by color and from square * 64 + to square
+        self.history = {constants.WHITE: [0] * 4096,
+                        constants.BLACK: [0] * 4096}
+        self.stats = {"cutoffs": 0,
+                      "first_move_cutoffs": 0,
+                      "moves_before_cutoff": 0,
+                      TABLE: 0,
+                      CAPTURE: 0,
+                      KILLER: 0,
+                      QUIET: 0}
+
+    def new_search(self):
+        """
+
+        Start a new search: killers are for the last position, and older
+        history counts matter less.
+
+        """
+        self.killers = [[None, None] for ply in xrange(MAX_PLY)]
+        for color in self.history:
+            self.history[color] = [count >> 1 for count in
+                                   self.history[color]]
+
+    def get_victim(self, game, piece, pos):
+        """
+
+        The piece the move takes, or None.
+
+        """
+        victim = game.get_piece_at(pos)
+        if (not victim and piece.__class__ == pieces.Pawn and
+           pos == game.en_passant_pos and pos[0] != piece.pos[0]):
+            return game.get_piece_at((pos[0], piece.pos[1]))
+        return victim
+
+    def score_move(self, game, piece, pos, ply, table_move=None):
+        """
+
+        Sort key for one move; higher goes first.
+
+        """
+        move = (piece.pos, pos)
+        if move == table_move:
+            return TABLE_MOVE_SCORE
+        if self.use_captures:
+            victim = self.get_victim(game, piece, pos)
+            if victim:
+                return (CAPTURE_SCORE + 1000 * victim.value -
+                        piece.value)
+        if self.use_killers and ply < MAX_PLY:
+            killers = self.killers[ply]
+            if move == killers[0]:
+                return KILLER_SCORES[0]
+            if move == killers[1]:
+                return KILLER_SCORES[1]
+        if self.use_history:
+            return min(self.history[piece.color][
+                (piece.pos[0] + 8 * piece.pos[1]) * 64 + pos[0] + 8 * pos[1]],
+                HISTORY_LIMIT)
+        return 0
+
+    def iter_moves(self, game, moves, ply, table_move=None):
+        """
+
+        Yield the moves best first, picking each one as it's asked for.
+        table_move is a (from_pos, to_pos) tuple to try first.
+
+        """
+        scores = [self.score_move(game, piece, pos, ply, table_move)
+                  for piece, pos in moves]
+        count = len(moves)
+        for index in xrange(count):
+            best = max(xrange(index, count), key=scores.__getitem__)
+            if best != index:
+                moves[index], moves[best] = moves[best], moves[index]
+                scores[index], scores[best] = scores[best], scores[index]
+            yield moves[index]
+
+    def get_kind(self, game, piece, pos, ply, table_move=None):
+        """
+
+        Which heuristic put the move where it was.
+
+        """
+        move = (piece.pos, pos)
+        if move == table_move:
+            return TABLE
+        if self.get_victim(game, piece, pos):
+            return CAPTURE
+        if (self.use_killers and ply < MAX_PLY and
+           move in self.killers[ply]):
+            return KILLER
+        return QUIET
+
+    def record_cutoff(self, game, piece, pos, depth, ply, index,
+                      table_move=None):
+        """
+
+        Note that the move (the index'th tried) caused a beta cutoff. Quiet
+        moves become killers at this ply and gain history. Must be called
+        before the move is made.
+
+        """
+        kind = self.get_kind(game, piece, pos, ply, table_move)
+        self.stats["cutoffs"] += 1
+        self.stats["moves_before_cutoff"] += index
+        if index == 0:
+            self.stats["first_move_cutoffs"] += 1
+        self.stats[kind] += 1
+        if kind == CAPTURE or kind == TABLE and self.get_victim(game, piece,
+                                                                pos):
+            return
+
+        move = (piece.pos, pos)
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if move != killers[0]:
+                killers[1] = killers[0]
+                killers[0] = move
+        self.history[piece.color][
+            (piece.pos[0] + 8 * piece.pos[1]) * 64 +
+            pos[0] + 8 * pos[1]] += depth * depth
+
+
+def main():
+    # imported here as the search depends on this module
+    import games
+    import perft
+    import search
+    import transposition
+
+    parser = argparse.ArgumentParser(
+        description="Count search nodes on the perft positions with each "
+                    "move ordering heuristic switched on in turn.")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--backend", default=constants.PIECE_LIST,
+                        choices=constants.BACKENDS)
+    args = parser.parse_args()
+
+    settings = [("no ordering", dict(use_captures=False, use_killers=False,
+                                     use_history=False)),
+                ("MVV-LVA", dict(use_killers=False, use_history=False)),
+                ("MVV-LVA + killers", dict(use_history=False)),
+                ("MVV-LVA + killers + history", dict())]
+    for name, options in settings:
+        nodes = 0
+        elapsed = 0.0
+        orderer = MoveOrderer(**options)
+        for position_name, fen, expected in perft.POSITIONS:
+            game = games.Game.from_fen(fen, args.backend)
+            searcher = search.Searcher(
+                game, max_depth=args.depth, orderer=orderer,
+                table=transposition.TranspositionTable(16))
+            start = time.time()
+            searcher.search()
+            elapsed += time.time() - start
+            nodes += searcher.nodes
+        stats = orderer.stats
+        print "%s: %i nodes in %.2fs" % (name, nodes, elapsed)
+        print ("  %i cutoffs, %.0f%% on the first move, %.2f moves tried "
+               "before the cutoff on average" % (
+                   stats["cutoffs"],
+                   100.0 * stats["first_move_cutoffs"] /
+                   max(stats["cutoffs"], 1),
+                   float(stats["moves_before_cutoff"]) /
+                   max(stats["cutoffs"], 1)))
+        print "  cutoffs by table move %i, capture %i, killer %i, quiet %i" % (
+            stats[TABLE], stats[CAPTURE], stats[KILLER], stats[QUIET])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# std lib imports
+import time
+import argparse
+import multiprocessing
+
+# local imports
+import constants
+import games
+import perft
+import search
+import transposition
+
+
+def _helper_search(game, table, max_depth, start_depth, seed, stop_flag,
+                   node_counts, index):
+    """
+
+    Body of a helper process: search until told to stop, leaving results in
+    the shared table for the main search to pick up.
+
+    """
+    searcher = search.Searcher(game, max_depth=max_depth, table=table,
+                               stop_flag=stop_flag, start_depth=start_depth,
+                               shuffle_seed=seed)
+    searcher.search()
+    node_counts[index] = searcher.nodes
+
+
+class ParallelSearcher(object):
+    """
+
+    Lazy SMP search over several processes.
+
+    The main search runs in this process exactly like search.Searcher, while
+    workers - 1 helper processes search the same position with shuffled root
+    moves and staggered depths. They all share one transposition table in
+    shared memory, so the main search keeps finding results the helpers have
+    already worked out. The helpers are stopped as soon as the main search
+    finishes, and only its move is played. The speedup on several cores
+    hasn't been measured yet (see the README).
+
+    """
+    def __init__(self, game, workers=None, max_depth=64, max_nodes=None,
+                 max_time=None, table=None, soft_time=None):
+        if table is None:
+            table = transposition.TranspositionTable(shared=True)
+        if not table.shared:
+            raise ValueError('Parallel search needs a shared table')
+        self.game = game
+        self.workers = workers or multiprocessing.cpu_count()
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.max_time = max_time
+        self.soft_time = soft_time
+        self.table = table
+        self.nodes = 0
+        self.depth_reached = 0
+        self.best_score = 0
+
+    def search(self):
+        """
+
+        Search the current position for the side to move and return the best
+        move as a (piece, pos) tuple, or None if there are no legal moves.
+
+        """
+        stop_flag = multiprocessing.RawValue('b', 0)
+        node_counts = multiprocessing.RawArray('l', self.workers)
+        helpers = []
+        for index in xrange(1, self.workers):
+            helper = multiprocessing.Process(
+                target=_helper_search,
+                args=(self.game, self.table, self.max_depth, 1 + index % 2,
+                      index, stop_flag, node_counts, index))
+            helper.daemon = True
+            helper.start()
+            helpers.append(helper)
+
+        searcher = search.Searcher(self.game, max_depth=self.max_depth,
+                                   max_nodes=self.max_nodes,
+                                   max_time=self.max_time, table=self.table,
+                                   soft_time=self.soft_time)
+        try:
+            move = searcher.search()
+        finally:
+            stop_flag.value = 1
+            for helper in helpers:
+                helper.join()
+
+        self.nodes = searcher.nodes + sum(node_counts)
+        self.depth_reached = searcher.depth_reached
+        self.best_score = searcher.best_score
+        return move
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time fixed-depth searches of the perft positions with "
+                    "1 to N worker processes and report the speedup.")
+    parser.add_argument("--workers", type=int,
+                        default=multiprocessing.cpu_count(),
+                        help="most workers to try (default one per core)")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--hash-mb", type=float, default=16)
+    parser.add_argument("--backend", default=constants.PIECE_LIST,
+                        choices=constants.BACKENDS)
+    args = parser.parse_args()
+
+    baseline = None
+    for workers in xrange(1, args.workers + 1):
+        total_time = 0.0
+        total_nodes = 0
+        for name, fen, expected in perft.POSITIONS:
+            game = games.Game.from_fen(fen, args.backend)
+            table = transposition.TranspositionTable(args.hash_mb,
+                                                     shared=True)
+            searcher = ParallelSearcher(game, workers=workers,
+                                        max_depth=args.depth, table=table)
+            start = time.time()
+            searcher.search()
+            total_time += time.time() - start
+            total_nodes += searcher.nodes
+        if baseline is None:
+            baseline = total_time
+        print "%i worker(s): %.2fs to depth %i, %i nodes/sec, speedup %.2fx" % (
+            workers, total_time, args.depth, total_nodes / total_time,
+            baseline / total_time)
+
+if __name__ == "__main__":
+    main()
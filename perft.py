@@ -0,0 +1,209 @@
+# std lib imports
+import sys
+import time
+import argparse
+
+# local imports
+import bitboards
+import constants
+import games
+import utility
+
+# Standard test positions and their known leaf node counts by depth. Only
+# depths without promotions are listed, as pawns always promote to queens.
+POSITIONS = [
+    ("startpos",
+     "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete",
+     "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862]),
+    ("position3",
+     "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("position6",
+     "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+
+def perft(game, depth):
+    """
+
+    Count the leaf nodes of the legal move tree to the given depth.
+
+    """
+    if depth == 0:
+        return 1
+    moves = game.get_valid_moves(game.color_to_move)
+    if depth == 1:
+        return len(moves)
+
+    nodes = 0
+    for piece, pos in moves:
+        record = game.make_move(piece, pos)
+        game.color_to_move = not game.color_to_move
+        nodes += perft(game, depth - 1)
+        game.unmake_move(record)
+        game.color_to_move = not game.color_to_move
+    return nodes
+
+
+def divide(game, depth):
+    """
+
+    Leaf node counts below each root move, as a list of (move, nodes).
+
+    """
+    results = []
+    for piece, pos in game.get_valid_moves(game.color_to_move):
+        move_name = utility.get_grid_pos(piece.pos) + utility.get_grid_pos(pos)
+        record = game.make_move(piece, pos)
+        game.color_to_move = not game.color_to_move
+        results.append((move_name, perft(game, depth - 1)))
+        game.unmake_move(record)
+        game.color_to_move = not game.color_to_move
+    return results
+
+
+def get_size(obj, seen=None):
+    """
+
+    Bytes taken up by an object and everything it refers to that isn't
+    shared with the rest of the program (classes, None and booleans).
+
+    """
+    if seen is None:
+        seen = set([id(None), id(True), id(False)])
+    if id(obj) in seen or isinstance(obj, type):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += get_size(key, seen) + get_size(value, seen)
+    elif isinstance(obj, (list, tuple, set)):
+        for item in obj:
+            size += get_size(item, seen)
+    if hasattr(obj, "__dict__"):
+        size += get_size(obj.__dict__, seen)
+    for cls in type(obj).__mro__:
+        for name in cls.__dict__.get("__slots__", ()):
+            if hasattr(obj, name):
+                size += get_size(getattr(obj, name), seen)
+    return size
+
+
+def measure_memory(name, fen, backend, repeat=1000):
+    """
+
+    Print how much memory a game at the position takes up, against a
+    snapshot of it, and how long each takes to make.
+
+    """
+    game = games.Game.from_fen(fen, backend)
+    start = time.time()
+    for _ in xrange(repeat):
+        snapshot = game.get_snapshot()
+    snapshot_time = (time.time() - start) / repeat
+    start = time.time()
+    for _ in xrange(repeat):
+        game.copy()
+    copy_time = (time.time() - start) / repeat
+    pieces = game.get_pieces()
+    print ("%s: game %i bytes (%i per piece), snapshot %i bytes; snapshot "
+           "%.1fus, copy %.1fus" % (
+               name, get_size(game), sum(get_size(piece) for piece in
+                                         pieces) / len(pieces),
+               sys.getsizeof(snapshot), snapshot_time * 1e6,
+               copy_time * 1e6))
+
+
+def run_position(name, fen, expected, depth, backend, show_divide=False,
+                 attack_maps=False, bitboards_only=False):
+    """
+
+    Run perft on one position at every depth up to the given one, printing
+    timings and checking against the reference counts. Returns False if any
+    count is wrong. With bitboards_only the moves are made on a
+    bitboards.Position rather than the game.
+
+    """
+    all_correct = True
+    game = games.Game.from_fen(fen, backend)
+    if attack_maps:
+        game.enable_attack_maps()
+    position = bitboards_only and bitboards.Position(game)
+    for current_depth in xrange(1, depth + 1):
+        start = time.time()
+        if show_divide and current_depth == depth:
+            results = divide(game, current_depth)
+            for move_name, nodes in sorted(results):
+                print "  %s: %i" % (move_name, nodes)
+            nodes = sum(result[1] for result in results)
+        elif position:
+            nodes = position.perft(current_depth)
+        else:
+            nodes = perft(game, current_depth)
+        elapsed = time.time() - start
+
+        if current_depth > len(expected):
+            status = "no reference"
+        elif nodes == expected[current_depth - 1]:
+            status = "ok"
+        else:
+            status = "WRONG, expected %i" % expected[current_depth - 1]
+            all_correct = False
+        print "%s depth %i: %i nodes in %.2fs (%i nodes/sec) %s" % (
+            name, current_depth, nodes, elapsed,
+            nodes / max(elapsed, 1e-6), status)
+    return all_correct
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Count move tree leaf nodes to check and benchmark move "
+                    "generation.")
+    parser.add_argument("--depth", type=int, default=3,
+                        help="deepest depth to search (default 3)")
+    parser.add_argument("--position", default=None,
+                        help="name of one test position, or a FEN string")
+    parser.add_argument("--backend", default=constants.PIECE_LIST,
+                        choices=constants.BACKENDS)
+    parser.add_argument("--divide", action="store_true",
+                        help="break the deepest count down by root move")
+    parser.add_argument("--attack-maps", action="store_true",
+                        help="keep attack maps up to date while counting")
+    parser.add_argument("--memory", action="store_true",
+                        help="measure memory per stored position instead")
+    parser.add_argument("--bitboards-only", action="store_true",
+                        help="make the moves on bare bitboards rather than "
+                             "through the game")
+    args = parser.parse_args()
+    if args.bitboards_only and (args.divide or args.attack_maps):
+        parser.error("--bitboards-only counts without the game, so can't "
+                     "be combined with --divide or --attack-maps")
+
+    positions = POSITIONS
+    if args.position:
+        positions = [position for position in POSITIONS if
+                     position[0] == args.position]
+        if not positions:
+            positions = [("fen", args.position, [])]
+
+    if args.memory:
+        for name, fen, expected in positions:
+            measure_memory(name, fen, args.backend)
+        return
+
+    all_correct = True
+    for name, fen, expected in positions:
+        if not run_position(name, fen, expected, args.depth, args.backend,
+                            args.divide, args.attack_maps,
+                            args.bitboards_only):
+            all_correct = False
+    if not all_correct:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
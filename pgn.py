@@ -0,0 +1,337 @@
+# std lib imports
+import re
+import time
+import argparse
+
+# local imports
+import constants
+import games
+import pieces
+
+# Headers every game gets, in the order PGN wants them first
+SEVEN_TAG_ROSTER = ["Event", "Site", "Date", "Round", "White", "Black",
+                    "Result"]
+
+# Longest line written in the move text
+LINE_LENGTH = 79
+
+RESULTS = [constants.WHITE_WINS, constants.BLACK_WINS, constants.DRAW,
+           constants.UNFINISHED]
+
+_HEADER = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# Move text tokens: comments, variation brackets, annotation glyphs, move
+# numbers, results and moves
+_TOKEN = re.compile(r'\{[^}]*\}?|;.*|\(|\)|\$\d+|\d+\.+|'
+                    r'1-0|0-1|1/2-1/2|\*|[^\s(){};$]+')
+_SAN = re.compile(r'([KQRBN])?([a-h])?([1-8])?x?([a-h])([1-8])'
+                  r'(?:=?([QRBN]))?$')
+_ANNOTATION = re.compile(r'[+#!?]+$')
+
+_PIECE_FOR_LETTER = dict((character, piece_class) for piece_class, character
+                         in constants.PIECE_CHARACTERS.items())
+_FILES = "abcdefgh"
+_RANKS = "12345678"
+
+
+class GameRecord(object):
+    """
+
+    A game read from a PGN file: its headers, its moves in standard
+    algebraic notation (SAN) and its result.
+
+    """
+    def __init__(self, headers, moves, result):
+        self.headers = headers
+        self.moves = moves
+        self.result = result
+
+    def get_game(self, backend=constants.PIECE_LIST):
+        """
+
+        A game set up at the record's starting position.
+
+        """
+        if "FEN" in self.headers:
+            return games.Game.from_fen(self.headers["FEN"], backend)
+        return games.Game(backend=backend)
+
+    def replay(self, game=None):
+        """
+
+        Play the moves out on the game (by default a new one at the starting
+        position), yielding each one as a (piece, pos) tuple just before it
+        is made. Raises ValueError at a move that isn't legal.
+
+        """
+        if game is None:
+            game = self.get_game()
+        for san in self.moves:
+            move = parse_san(game, san)
+            yield move
+            game.make_move(move[0], move[1])
+            game.color_to_move = not game.color_to_move
+
+
+def iter_games(lines):
+    """
+
+    Yield each game in a PGN file (or any other iterable of lines) as a
+    GameRecord. Only one game is held in memory at a time. Comments,
+    variations and annotation glyphs are skipped.
+
+    """
+    headers = {}
+    moves = []
+    in_movetext = False
+    in_comment = False
+    variation_depth = 0
+    for line in lines:
+        if in_comment:
+            end = line.find("}")
+            if end < 0:
+                continue
+            line = line[end + 1:]
+            in_comment = False
+
+        stripped = line.strip()
+        if not stripped or stripped[0] == "%":
+            continue
+        if stripped[0] == "[" and not variation_depth:
+            if in_movetext:
+                # a game that didn't end with a result
+                yield GameRecord(headers, moves, constants.UNFINISHED)
+                headers = {}
+                moves = []
+                in_movetext = False
+            match = _HEADER.match(stripped)
+            if match:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"')
+            continue
+
+        in_movetext = True
+        for token in _TOKEN.findall(stripped):
+            first = token[0]
+            if first == "{":
+                if token[-1] != "}":
+                    in_comment = True
+            elif first == ";" or first == "$":
+                continue
+            elif first == "(":
+                variation_depth += 1
+            elif first == ")":
+                variation_depth = max(0, variation_depth - 1)
+            elif variation_depth:
+                continue
+            elif token in RESULTS:
+                yield GameRecord(headers, moves, token)
+                headers = {}
+                moves = []
+                in_movetext = False
+            elif first.isdigit() and token[-1] == ".":
+                continue
+            else:
+                moves.append(token)
+
+    if in_movetext or headers:
+        yield GameRecord(headers, moves, constants.UNFINISHED)
+
+
+def parse_san(game, san):
+    """
+
+    The (piece, pos) tuple for a move in standard algebraic notation, for
+    the side to move. Raises ValueError if it isn't a legal move.
+
+    """
+    color = game.color_to_move
+    text = _ANNOTATION.sub("", san)
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        y = 0 if color == constants.WHITE else 7
+        piece = game.get_piece_at((4, y))
+        pos = (6 if len(text) == 3 else 2, y)
+        if (piece and piece.__class__ == pieces.King and
+           piece.color == color and
+           (piece, pos) in game.get_valid_moves_for_piece(piece)):
+            return (piece, pos)
+        raise ValueError('Not a valid move: %s' % san)
+
+    match = _SAN.match(text)
+    if not match:
+        raise ValueError('Not a valid move: %s' % san)
+    letter, from_file, from_rank, to_file, to_rank, promotion = match.groups()
+    # pawns only ever promote to queens here
+    if promotion and promotion != "Q":
+        raise ValueError('Not a valid move: %s' % san)
+    piece_class = _PIECE_FOR_LETTER[letter] if letter else pieces.Pawn
+    pos = (_FILES.index(to_file), _RANKS.index(to_rank))
+    from_x = _FILES.index(from_file) if from_file else None
+    from_y = _RANKS.index(from_rank) if from_rank else None
+    if piece_class == pieces.Pawn and from_x is None:
+        from_x = pos[0]
+
+    found = None
+    for piece in game.get_pieces(color):
+        if (piece.__class__ != piece_class or
+           from_x is not None and piece.pos[0] != from_x or
+           from_y is not None and piece.pos[1] != from_y):
+            continue
+        if (piece, pos) in game.get_valid_moves_for_piece(piece):
+            if found:
+                raise ValueError('Ambiguous move: %s' % san)
+            found = (piece, pos)
+    if not found:
+        raise ValueError('Not a valid move: %s' % san)
+    return found
+
+
+def get_san(game, piece, pos):
+    """
+
+    Standard algebraic notation for a legal move by the side to move, as
+    played from the current position.
+
+    """
+    suffix = ""
+    record = game.make_move(piece, pos)
+    if game.in_check(not piece.color):
+        if game.has_legal_move(not piece.color):
+            suffix = "+"
+        else:
+            suffix = "#"
+    game.unmake_move(record)
+
+    from_x, from_y = piece.pos
+    square = _FILES[pos[0]] + _RANKS[pos[1]]
+    if piece.__class__ == pieces.King and abs(pos[0] - from_x) == 2:
+        return ("O-O" if pos[0] == 6 else "O-O-O") + suffix
+
+    if piece.__class__ == pieces.Pawn:
+        san = square
+        if from_x != pos[0]:
+            san = _FILES[from_x] + "x" + square
+        if pos[1] in (0, 7):
+            san += "=Q"
+        return san + suffix
+
+    # Name the file, rank or both if another piece like this one can also
+    # move there
+    rivals = [other for other in game.get_pieces(piece.color) if
+              other.__class__ == piece.__class__ and other is not piece and
+              (other, pos) in game.get_valid_moves_for_piece(other)]
+    origin = ""
+    if rivals:
+        if all(other.pos[0] != from_x for other in rivals):
+            origin = _FILES[from_x]
+        elif all(other.pos[1] != from_y for other in rivals):
+            origin = _RANKS[from_y]
+        else:
+            origin = _FILES[from_x] + _RANKS[from_y]
+    capture = "x" if game.get_piece_at(pos) else ""
+    return (constants.PIECE_CHARACTERS[piece.__class__] + origin + capture +
+            square + suffix)
+
+
+def get_result(game):
+    """
+
+    PGN result of a game that has just ended (check_endgame raised).
+
+    """
+    if not game.has_legal_move() and game.in_check():
+        # the side to move has been mated
+        if game.color_to_move == constants.WHITE:
+            return constants.BLACK_WINS
+        return constants.WHITE_WINS
+    return constants.DRAW
+
+
+def format_game(moves, result, headers=None):
+    """
+
+    A game as PGN text. moves are in SAN; headers is a dict of any headers
+    besides or overriding the defaults.
+
+    """
+    all_headers = {"Event": "?", "Site": "?", "Date": "????.??.??",
+                   "Round": "?", "White": "?", "Black": "?"}
+    all_headers.update(headers or {})
+    all_headers["Result"] = result
+    names = SEVEN_TAG_ROSTER + sorted(name for name in all_headers if
+                                      not name in SEVEN_TAG_ROSTER)
+    lines = ['[%s "%s"]' % (name, str(all_headers[name]).replace('"', '\\"'))
+             for name in names]
+    lines.append("")
+
+    # Black moves first from a FEN position with black to move
+    first_color = constants.WHITE
+    if "FEN" in all_headers and all_headers["FEN"].split()[1] == "b":
+        first_color = constants.BLACK
+    # A move number is kept on the same line as its move
+    tokens = []
+    for index, san in enumerate(moves):
+        if first_color == constants.WHITE:
+            if not index % 2:
+                san = "%i. %s" % (index / 2 + 1, san)
+        elif not index:
+            san = "1... " + san
+        elif index % 2:
+            san = "%i. %s" % ((index + 1) / 2 + 1, san)
+        tokens.append(san)
+    tokens.append(result)
+
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else:
+            line = line + " " + token if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n\n"
+
+
+def write_game(output_file, moves, result, headers=None):
+    """
+
+    Append a game to an open PGN file. See format_game.
+
+    """
+    output_file.write(format_game(moves, result, headers))
+    output_file.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Read a PGN file and report how fast its games parse.")
+    parser.add_argument("filename")
+    parser.add_argument("--replay", action="store_true",
+                        help="also play every move out on a game")
+    parser.add_argument("--backend", default=constants.PIECE_LIST,
+                        choices=constants.BACKENDS)
+    args = parser.parse_args()
+
+    number_of_games = 0
+    number_of_moves = 0
+    errors = 0
+    start = time.time()
+    with open(args.filename) as pgn_file:
+        for record in iter_games(pgn_file):
+            number_of_games += 1
+            if not args.replay:
+                number_of_moves += len(record.moves)
+                continue
+            try:
+                for move in record.replay(record.get_game(args.backend)):
+                    number_of_moves += 1
+            except ValueError as e:
+                errors += 1
+                print "Game %i: %s" % (number_of_games, e)
+    elapsed = max(time.time() - start, 1e-6)
+    print "%i games, %i moves in %.2fs (%.1f games/sec, %i moves/sec)" % (
+        number_of_games, number_of_moves, elapsed, number_of_games / elapsed,
+        number_of_moves / elapsed)
+    if errors:
+        print "%i games had moves that couldn't be played" % errors
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,13 @@
 # std lib imports
-import copy
-
 # local imports
 import constants
+import movetables
 import utility
 
+# Positions and tables by square number (x + 8 * y)
+_SQUARE_POS = movetables.SQUARE_POS
+_RAYS = movetables.RAYS
+
 # ------------------------ Piece Abstract Class ------------------------------#
 
 # Piece types
@@ -16,33 +19,49 @@ class AbstractPiece(object):
     """
 
     Abstract class which defines a chess piece. Each chess piece stores their
-    own position on board. Subclasses must implement get_vali_moves method.
+    own position on board. Subclasses must implement iter_valid_moves method.
+
+    Pieces have slots rather than an attribute dict, as a game makes and
+    keeps a lot of them. name and value belong to each class and are filled
+    in by the constants module.
 
     """
+    __slots__ = ("color", "pos", "has_moved")
+
+    name = None
+    value = 0
+
     def __init__(self, color, position):
         if not color in (WHITE, BLACK):
             raise ValueError('Not a valid color')
         self.color = color
         self.pos = position
-        self.name = constants.PIECE_NAMES[self.__class__]
-        self.value = constants.PIECE_VALUES[self.__class__]
         self.has_moved = False
 
     def __str__(self):
         color = constants.COLOR_NAMES[self.color]
         piece = constants.PIECE_NAMES[self.__class__]
         pos = utility.get_grid_pos(self.pos)
-        return "%s %s at %s" (color.title(), piece, pos)
+        return "%s %s at %s" % (color.title(), piece, pos)
 
     def __repr__(self):
         return self.__str__()
 
-    def get_valid_moves(self, game, check=False):
+    def get_valid_moves(self, game, testing_check=False):
         """
 
         Moves allowed in the game. Return a list of positions.
         eg.[(1, 2), (5, 6), ...]
 
+        """
+        return list(self.iter_valid_moves(game, testing_check))
+
+    def iter_valid_moves(self, game, testing_check=False):
+        """
+
+        Generator version of get_valid_moves, yielding one position at a
+        time so callers can stop at the first one that will do.
+
         """
         raise NotImplementedError()
 
@@ -54,8 +73,14 @@ class AbstractPiece(object):
         Direction is an offset tuple. eg. (1, 2)
 
         """
-        moves = []
+        return list(self.iter_moves_direction(game, direction))
+
+    def iter_moves_direction(self, game, direction):
+        """
+
+        Generator version of get_moves_direction.
 
+        """
         # start from curr position
         test_move = self.pos
 
@@ -77,10 +102,30 @@ class AbstractPiece(object):
                     break
                 else:
                     # different color. is a valid move
-                    moves.append(test_move)
+                    yield test_move
                     break
 
-        return moves
+            # empty square, keep going
+            yield test_move
+
+    def iter_moves_along(self, game, directions):
+        """
+
+        Same as iter_moves_direction for each of the directions, given as
+        indices into movetables.DIRECTIONS, reading the squares from the
+        precomputed rays.
+
+        """
+        rays = _RAYS[self.pos[0] + 8 * self.pos[1]]
+        for direction in directions:
+            for square in rays[direction]:
+                test_move = _SQUARE_POS[square]
+                hit = game.get_piece_at(test_move)
+                if hit:
+                    if hit.color != self.color:
+                        yield test_move
+                    break
+                yield test_move
 
     def remove_invalid_moves(self, game, moves):
         """
@@ -92,7 +137,14 @@ class AbstractPiece(object):
         2. collision with own piece
 
         """
-        valid_moves = []
+        return list(self.skip_invalid_moves(game, moves))
+
+    def skip_invalid_moves(self, game, moves):
+        """
+
+        Generator version of remove_invalid_moves.
+
+        """
         for pos in moves:
             if pos == self.pos:
                 continue
@@ -106,119 +158,105 @@ class AbstractPiece(object):
             if taken_piece and taken_piece.color == self.color:
                 continue
 
-            valid_moves.append(pos)
-        return valid_moves
+            yield pos
 
 # ------------------------ Piece Concrete Class ------------------------------#
 
+# Each slider's directions as indices into movetables.DIRECTIONS, in the
+# order its moves are listed
+_QUEEN_DIRECTIONS = range(8)
+_BISHOP_DIRECTIONS = [7, 1, 5, 3]
+_ROOK_DIRECTIONS = [0, 2, 6, 4]
+
 
 class Pawn(AbstractPiece):
-    def get_valid_moves(self, game, testing_check=False):
+    __slots__ = ()
+
+    def iter_valid_moves(self, game, testing_check=False):
         """
 
         Pawns move 1/2 squares each time.
 
         """
-        moves = []
-
-        # get all valid square
-        if self.color == WHITE:
-            forward_one = (self.pos[0], self.pos[1] + 1)
-            forward_two = (self.pos[0], self.pos[1] + 2)
-            take_left = (self.pos[0] - 1, self.pos[1] + 1)
-            take_right = (self.pos[0] + 1, self.pos[1] + 1)
-        elif self.color == BLACK:
-            forward_one = (self.pos[0], self.pos[1] - 1)
-            forward_two = (self.pos[0], self.pos[1] - 2)
-            take_left = (self.pos[0] + 1, self.pos[1] - 1)
-            take_right = (self.pos[0] - 1, self.pos[1] - 1)
-        else:
-            raise RuntimeError("Square not reached.")
-
-        # one square forward
-        if not game.get_piece_at(forward_one):
-            moves.append(forward_one)
-
-        # two square forward at starting position
-        if ((self.color == WHITE and self.pos[1] == 1) or
-           (self.color == BLACK and self.pos[1] == 6)):
-            if not game.get_piece_at(forward_two):
-                moves.append(forward_two)
+        square = self.pos[0] + 8 * self.pos[1]
+        pushes = movetables.PAWN_PUSHES[self.color][square]
+
+        # one square forward, then two at the starting position if nothing
+        # is in the way
+        if pushes:
+            forward_one = _SQUARE_POS[pushes[0]]
+            if not game.get_piece_at(forward_one):
+                yield forward_one
+                if pushes[1] is not None:
+                    forward_two = _SQUARE_POS[pushes[1]]
+                    if not game.get_piece_at(forward_two):
+                        yield forward_two
 
         # move diagonally
-        for taking_move in take_left, take_right:
+        taking_moves = [_SQUARE_POS[target] for target in
+                        movetables.PAWN_CAPTURES[self.color][square]]
+        for taking_move in taking_moves:
             taken_piece = game.get_piece_at(taking_move)
             if taken_piece and not taken_piece.color == self.color:
-                moves.append(taking_move)
-
-        if game.en_passant_pos in [take_left, take_right]:
-            moves.append(game.en_passant_pos)
+                yield taking_move
 
-        return self.remove_invalid_moves(game, moves)
+        if game.en_passant_pos in taking_moves:
+            yield game.en_passant_pos
 
 
 class Knight(AbstractPiece):
-    def get_valid_moves(self, game, testing_check=False):
+    __slots__ = ()
+
+    def iter_valid_moves(self, game, testing_check=False):
         """
 
         Knights move in 2x + 1/-1 positions each time.
 
         """
-        moves = []
-
-        offsets = [(1, 2), (2, 1), (2, -1), (1, -2),
-                   (-1, -2), (-2, -1), (-2, 1), (-1, 2)]
-        for offset in offsets:
-            moves.append((self.pos[0] + offset[0], self.pos[1] + offset[1]))
-
-        # Remove obviously invalid moves
-        moves = self.remove_invalid_moves(game, moves)
-        return moves
+        for square in movetables.KNIGHT_TARGETS[self.pos[0] + 8 *
+                                                self.pos[1]]:
+            pos = _SQUARE_POS[square]
+            taken_piece = game.get_piece_at(pos)
+            if not taken_piece or taken_piece.color != self.color:
+                yield pos
 
 
 class King(AbstractPiece):
-    def get_valid_moves(self, game, testing_check=False):
+    __slots__ = ()
+
+    def iter_valid_moves(self, game, testing_check=False):
         """
 
         King moves 1 square at a time.
 
         """
-        moves = []
-
-        offsets = [constants.UP,
-                   constants.UP_RIGHT,
-                   constants.RIGHT,
-                   constants.DOWN_RIGHT,
-                   constants.DOWN,
-                   constants.DOWN_LEFT,
-                   constants.LEFT,
-                   constants.UP_LEFT]
-        for offset in offsets:
-            moves.append((self.pos[0] + offset[0], self.pos[1] + offset[1]))
-
-        # castling move
+        for square in movetables.KING_TARGETS[self.pos[0] + 8 * self.pos[1]]:
+            pos = _SQUARE_POS[square]
+            taken_piece = game.get_piece_at(pos)
+            if not taken_piece or taken_piece.color != self.color:
+                yield pos
+
+        # castling move, only worked out if the caller gets this far
+        if testing_check or self.has_moved:
+            return
         y_pos = self.pos[1]
         queen_rook = game.get_piece_at((0, y_pos))
         king_rook = game.get_piece_at((7, y_pos))
         for rook in queen_rook, king_rook:
-            if testing_check:
+            if not rook or rook.__class__ != Rook or rook.color != self.color:
                 continue
 
-            if not rook:
-                continue
-
-            if game.in_check(self.color):
-                continue
-
-            if self.has_moved or rook.has_moved:
+            if rook.has_moved:
                 continue
 
             # make sure squares between king and rook are vacant
             squares_between = []
             if rook.pos[0] < self.pos[0]:  # Queen side
                 squares_between = [(1, y_pos), (2, y_pos), (3, y_pos)]
+                crossed_square = (3, y_pos)
             else:  # King side
                 squares_between = [(5, y_pos), (6, y_pos)]
+                crossed_square = (5, y_pos)
             all_squares_vacant = True
             for square in squares_between:
                 if game.get_piece_at(square):
@@ -226,91 +264,59 @@ class King(AbstractPiece):
             if not all_squares_vacant:
                 continue
 
-            # none of the squares checks king
-            crosses_check = False
-            for square in squares_between:
-                test_game = copy.deepcopy(game)
-                test_game.move_piece_to(self, square)
-                if test_game.in_check(self.color):
-                    crosses_check = True
-                    break
-            if crosses_check:
+            if game.in_check(self.color):
                 continue
 
-            # castling on quee side is allowed
+            # the king can't pass through check. Landing in check is caught
+            # like any other move by the game's legality filter.
+            if game.is_square_attacked(crossed_square, not self.color):
+                continue
+
+            # castling on quee side is allowed. The king lands on an empty
+            # square, so there's nothing more to check.
             if rook == queen_rook:
-                moves.append((2, self.pos[1]))
+                yield (2, self.pos[1])
             else:
-                moves.append((6, self.pos[1]))
-
-        # remove invalid moves
-        return self.remove_invalid_moves(game, moves)
+                yield (6, self.pos[1])
 
 
 class Queen(AbstractPiece):
-    def get_valid_moves(self, game, testing_check=False):
+    __slots__ = ()
+
+    def iter_valid_moves(self, game, testing_check=False):
         """
 
         Queen moves in all horizontal, parallel and diagonal moves.
 
         """
-        moves = []
-
-        # All directions are valid
-        directions = [constants.UP,
-                      constants.UP_RIGHT,
-                      constants.RIGHT,
-                      constants.DOWN_RIGHT,
-                      constants.DOWN,
-                      constants.DOWN_LEFT,
-                      constants.LEFT,
-                      constants.UP_LEFT]
-
-        # Keep moving in each direction until we hit a piece or the edge
-        # of the board.
-        for direction in directions:
-            moves.extend(self.get_moves_direction(game, direction))
-
-        return self.remove_invalid_moves(game, moves)
+        # All directions are valid. Keep moving in each direction until we
+        # hit a piece or the edge of the board.
+        return self.iter_moves_along(game, _QUEEN_DIRECTIONS)
 
 
 class Bishop(AbstractPiece):
-    def get_valid_moves(self, game, testing_check=False):
+    __slots__ = ()
+
+    def iter_valid_moves(self, game, testing_check=False):
         """
 
         Bishop moves in all diagonal squares.
 
         """
-        moves = []
-
-        # only diagonal direction are valid
-        directions = [constants.UP_LEFT,
-                      constants.UP_RIGHT,
-                      constants.DOWN_LEFT,
-                      constants.DOWN_RIGHT]
-
-        # move in direction until we hit a piece or edge of board
-        for direction in directions:
-            moves.extend(self.get_moves_direction(game, direction))
-        return self.remove_invalid_moves(game, moves)
+        # only diagonal direction are valid. move in direction until we hit
+        # a piece or edge of board
+        return self.iter_moves_along(game, _BISHOP_DIRECTIONS)
 
 
 class Rook(AbstractPiece):
-    def get_valid_moves(self, game, testing_check=False):
+    __slots__ = ()
+
+    def iter_valid_moves(self, game, testing_check=False):
         """
 
         Rook moves in all horizontal squares only.
 
         """
-        moves = []
-
-        directions = [constants.UP, constants.RIGHT,
-                      constants.LEFT, constants.DOWN]
-
         # Keep moving in each direction until we hit a piece or the edge
         # of the board.
-        for direction in directions:
-            moves.extend(self.get_moves_direction(game, direction))
-
-        moves = self.remove_invalid_moves(game, moves)
-        return moves
+        return self.iter_moves_along(game, _ROOK_DIRECTIONS)
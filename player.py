@@ -1,12 +1,20 @@
 # std lib imports
 import re
-import copy
+import time
 import random
+import threading
+import multiprocessing
 
 # local imports
 import constants
 import utility
 import pieces
+import evaluation
+import exchange
+import search
+import ordering
+import parallel
+import transposition
 
 
 class AbstractPlayer(object):
@@ -28,6 +36,23 @@ class AbstractPlayer(object):
         """
         raise NotImplementedError()
 
+    def ponder(self):
+        """
+
+        Called once the opponent is to move. Players that think on the
+        opponent's time start doing so here.
+
+        """
+        pass
+
+    def stop_pondering(self):
+        """
+
+        Stop thinking on the opponent's time.
+
+        """
+        pass
+
 
 class Human(AbstractPlayer):
     """
@@ -149,41 +174,80 @@ class Computer(AbstractPlayer):
 
     AI-controlled player.
 
-    Considers checkmate, checks, captures, retreats and pawn advances.
+    Considers checkmate, checks, captures, retreats and pawn advances. Plays
+    from book (a book.OpeningBook) instead while the position is in it, and
+    perfectly once tablebases (a tablebase.Tablebases) cover the position.
 
     """
+    def __init__(self, game, color, book=None, tablebases=None):
+        super(Computer, self).__init__(game, color)
+        self.book = book
+        self.tablebases = tablebases
+
     def get_move(self):
         if not self.game.color_to_move == self.color:
             raise RuntimeError("Not my turn!")
 
+        # Play from the opening book while the game is still in it
+        if self.book:
+            move = self.book.get_move(self.game)
+            if move:
+                return move
+
+        # Play perfectly once the endgame tables cover the position
+        if self.tablebases:
+            move = self.tablebases.get_move(self.game)
+            if move:
+                return move
+
         available_moves = self.game.get_valid_moves(self.color)
+        enemy_attacks = self.game.get_attack_counts()[not self.color]
+
+        # What each move stands to win or lose on its target square. If the
+        # opponent attacks neither the target nor the square the piece leaves
+        # (which could uncover an attack), it's just what the move takes.
+        exchanges = {}
+        for move in available_moves:
+            piece, pos = move
+            victim = self.game.get_piece_at(pos)
+            if (enemy_attacks[pos[0] + 8 * pos[1]] or
+               enemy_attacks[piece.pos[0] + 8 * piece.pos[1]] or
+               not victim and piece.__class__ == pieces.Pawn and
+               pos[0] != piece.pos[0]):
+                exchanges[move] = exchange.static_exchange(self.game, piece,
+                                                           pos)
+            elif victim:
+                exchanges[move] = evaluation.MATERIAL[victim.__class__]
+            else:
+                exchanges[move] = 0
 
         # Find checking moves
         checking_moves = []
         riskless_checking_moves = []
         for move in available_moves:
-            test_game = copy.deepcopy(self.game)
-            test_game.move_piece_to(move[0], move[1])
-            if test_game.in_check(not self.color):
+            record = self.game.make_move(move[0], move[1])
+            if self.game.in_check(not self.color):
                 # Check for potential mates
-                if not test_game.get_valid_moves(not self.color):
+                if not self.game.has_legal_move(not self.color):
+                    self.game.unmake_move(record)
                     return move
                 checking_moves.append(move)
-                if not test_game.is_piece_at_risk(move[0]):
+                if exchanges[move] >= 0:
                     riskless_checking_moves.append(move)
+            self.game.unmake_move(record)
 
         # Find taking moves
         taking_moves = [move for move in available_moves if
                         self.game.get_piece_at(move[1])]
 
-        # Retreats
+        # Retreats: move the most valuable piece that would lose material
+        # where it stands to a square where it won't
         retreats = {}
+        at_risk = set(piece for piece in self.game.get_pieces(self.color) if
+                      enemy_attacks[piece.pos[0] + 8 * piece.pos[1]] and
+                      exchange.get_threat(self.game, piece.pos) > 0)
         for move in available_moves:
-            if self.game.is_piece_at_risk(move[0]):
-                test_game = copy.deepcopy(self.game)
-                test_game.move_piece_to(move[0], move[1])
-                if test_game.is_piece_at_risk(test_game.get_piece_at(move[1])):
-                    continue
+            if move[0] in at_risk and exchanges[move] >= 0:
                 retreats[move] = move[0].value
         highest_value = -999999
         best_retreat = None
@@ -194,44 +258,38 @@ class Computer(AbstractPlayer):
         if best_retreat:
             return best_retreat
 
-        # Find riskless taking moves (free material)
-        riskless_taking_moves = []
+        # Find the taking move that wins the most material
+        highest_value = 0
+        best_winning_move = None
         for move in taking_moves:
-            test_game = copy.deepcopy(self.game)
-            test_game.move_piece_to(move[0], move[1])
-            if not test_game.is_piece_at_risk(test_game.get_piece_at(move[1])):
-                riskless_taking_moves.append(move)
-        if riskless_taking_moves:
-            return random.choice(riskless_taking_moves)
+            if exchanges[move] > highest_value:
+                best_winning_move = move
+                highest_value = exchanges[move]
+        if best_winning_move:
+            return best_winning_move
 
         # A check is pretty good if it doesn't cost anything
         if riskless_checking_moves:
             return random.choice(riskless_checking_moves)
 
-        # Find the best value taking move
-        valued_taking_moves = {}
-        for move in taking_moves:
-            our_piece = move[0]
-            their_piece = self.game.get_piece_at(move[1])
-            move_value = their_piece.value - our_piece.value
-            valued_taking_moves[move] = move_value
-        highest_value = -999999
+        # Find an even trade
+        even_taking_moves = [move for move in taking_moves if
+                             exchanges[move] == 0]
         best_taking_move = None
-        for move, value in valued_taking_moves.items():
-            if value > highest_value:
-                best_taking_move = move
-                highest_value = value
+        if even_taking_moves:
+            best_taking_move = random.choice(even_taking_moves)
 
         # Find pawn moves
         pawn_moves = [move for move in available_moves if
-                      move[0].__class__ == pieces.Pawn]
+                      move[0].__class__ == pieces.Pawn and
+                      exchanges[move] >= 0]
 
         # Good options
         good_options = []
         if pawn_moves:
             good_options.append(random.choice(pawn_moves))
         if checking_moves:
-            good_options.append(checking_moves)
+            good_options.append(random.choice(checking_moves))
         if best_taking_move:
             good_options.append(best_taking_move)
         if good_options:
@@ -239,3 +297,198 @@ class Computer(AbstractPlayer):
 
         # Make any move
         return random.choice(available_moves)
+
+
+class SearchComputer(AbstractPlayer):
+    """
+
+    AI-controlled player that searches ahead with alpha-beta.
+
+    Searches deeper one ply at a time until it reaches max_depth or uses up
+    its node or time budget, then plays the best move found. A transposition
+    table of hash_mb megabytes and the move ordering history are kept from
+    one move to the next.
+
+    With more than one worker the search is spread over that many processes
+    sharing the transposition table. Book moves (from book, a
+    book.OpeningBook) and endgame table moves (from tablebases, a
+    tablebase.Tablebases) are played without searching.
+
+    Given a clock (a timecontrol.Clock) each move's time is budgeted from it
+    instead of max_time. With ponder set, the player searches the reply it
+    expects in a background thread while the opponent thinks, and carries
+    on with that search if the reply is played.
+
+    """
+    def __init__(self, game, color, max_depth=64, max_nodes=None,
+                 max_time=5.0, hash_mb=16, workers=1, book=None,
+                 tablebases=None, clock=None, ponder=False):
+        super(SearchComputer, self).__init__(game, color)
+        self.book = book
+        self.tablebases = tablebases
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.max_time = max_time
+        self.workers = workers
+        self.clock = clock
+        self.pondering = ponder
+        self.ponder_searcher = None
+        self.ponder_thread = None
+        self.ponder_move = None
+        self.ponder_snapshot = None
+        self.ponder_started = None
+        self.ponder_hits = 0
+        self.ponder_misses = 0
+        # deepest iteration completed for the last move searched
+        self.depth_reached = 0
+        self.table = transposition.TranspositionTable(hash_mb,
+                                                      shared=workers > 1)
+        self.orderer = ordering.MoveOrderer()
+
+    def get_move(self):
+        if not self.game.color_to_move == self.color:
+            raise RuntimeError("Not my turn!")
+
+        if self.clock:
+            soft_time, max_time = self.clock.allocate(self.color)
+        else:
+            soft_time, max_time = None, self.max_time
+
+        # Carry on from the ponder search if the expected reply was played
+        move = self.finish_pondering(soft_time, max_time)
+        if move:
+            return move
+
+        if self.book:
+            move = self.book.get_move(self.game)
+            if move:
+                return move
+        if self.tablebases:
+            move = self.tablebases.get_move(self.game)
+            if move:
+                return move
+
+        if self.workers > 1:
+            searcher = parallel.ParallelSearcher(
+                self.game, workers=self.workers, max_depth=self.max_depth,
+                max_nodes=self.max_nodes, max_time=max_time,
+                table=self.table, soft_time=soft_time)
+        else:
+            searcher = search.Searcher(self.game, max_depth=self.max_depth,
+                                       max_nodes=self.max_nodes,
+                                       max_time=max_time,
+                                       table=self.table,
+                                       orderer=self.orderer,
+                                       soft_time=soft_time)
+        move = searcher.search()
+        self.depth_reached = searcher.depth_reached
+        return move
+
+    def get_expected_reply(self):
+        """
+
+        The opponent's most likely reply in the current position as a
+        (from_pos, to_pos) tuple, or None if it has no moves. The last search
+        has usually left the best move here in the table. Failing that (say
+        after a book move), the move the search would try first is taken,
+        without searching, as this runs before the opponent is asked to move.
+
+        """
+        game = self.game
+        entry = self.table.probe(game.hash)
+        if entry and entry[3]:
+            from_pos, to_pos = entry[3]
+            piece = game.get_piece_at(from_pos)
+            if (piece and piece.color == game.color_to_move and
+               (piece, to_pos) in game.get_valid_moves_for_piece(piece)):
+                return from_pos, to_pos
+
+        moves = game.get_valid_moves(game.color_to_move)
+        if not moves:
+            return None
+        # the reply is one ply into the last search, as far as killers go
+        piece, pos = next(self.orderer.iter_moves(game, moves, 1))
+        return piece.pos, pos
+
+    def ponder(self):
+        """
+
+        Start searching the position after the expected reply in a background
+        thread, on a copy of the game, so the opponent can keep using the
+        game while it runs.
+
+        """
+        if not self.pondering or self.game.color_to_move == self.color:
+            return
+        self.stop_pondering()
+        expected = self.get_expected_reply()
+        if not expected:
+            return
+
+        game = self.game.copy()
+        game.make_move(game.get_piece_at(expected[0]), expected[1])
+        game.color_to_move = not game.color_to_move
+        self.ponder_move = expected
+        self.ponder_snapshot = game.get_snapshot()
+        self.ponder_started = time.time()
+        # No limits until the reply is played; finish_pondering sets them
+        self.ponder_searcher = search.Searcher(
+            game, max_depth=self.max_depth, table=self.table,
+            orderer=self.orderer,
+            stop_flag=multiprocessing.RawValue('b', 0))
+        self.ponder_thread = threading.Thread(
+            target=self.ponder_searcher.search)
+        self.ponder_thread.daemon = True
+        self.ponder_thread.start()
+
+    def stop_pondering(self):
+        """
+
+        Stop any ponder search and wait for its thread to finish.
+
+        """
+        if self.ponder_thread:
+            self.ponder_searcher.stop_flag.value = 1
+            self.ponder_thread.join()
+        self.ponder_searcher = None
+        self.ponder_thread = None
+
+    def finish_pondering(self, soft_time, max_time):
+        """
+
+        If the position is the one being pondered, let the ponder search
+        carry on within the move's time budget, wait for it and return its
+        move. Otherwise stop it and return None. The time spent pondering
+        counts towards the soft limit, as that's how long this search has
+        had, but the hard limit runs from now.
+
+        """
+        searcher = self.ponder_searcher
+        if not searcher:
+            return None
+        if self.game.get_snapshot() != self.ponder_snapshot:
+            self.ponder_misses += 1
+            self.stop_pondering()
+            return None
+
+        self.ponder_hits += 1
+        now = time.time()
+        if soft_time is not None:
+            searcher.soft_deadline = self.ponder_started + soft_time
+        if max_time is not None:
+            searcher.deadline = now + max_time
+        if self.max_nodes is not None:
+            searcher.max_nodes = searcher.nodes + self.max_nodes
+        if max_time is None and self.max_nodes is None:
+            # nothing would ever stop it, so settle for what it has found
+            searcher.stop_flag.value = 1
+        self.ponder_thread.join()
+        self.ponder_searcher = None
+        self.ponder_thread = None
+
+        self.depth_reached = searcher.depth_reached
+        if not searcher.best_move:
+            return None
+        # the ponder search's pieces belong to its copy of the game
+        piece, pos = searcher.best_move
+        return self.game.get_piece_at(piece.pos), pos
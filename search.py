@@ -0,0 +1,369 @@
+# std lib imports
+import time
+import random
+
+# local imports
+import evaluation
+import exchange
+import ordering
+import transposition
+
+# Scores are from the point of view of the side to move, in hundredths of a
+# pawn. A mate is worth MATE less the number of plies needed to deliver it.
+MATE = 100000
+INFINITY = MATE + 1
+# Scores beyond this are mates
+MATE_BOUND = MATE - 1000
+
+# Longest principal variation read back from the table
+MAX_PV_LENGTH = 32
+
+# Deepest ply searched. Quiescence searches every evasion when in check, so
+# a line of checks is cut off here with the static score.
+MAX_PLY = ordering.MAX_PLY
+
+# How often (in nodes) the clock is checked. At the search's speed this is
+# every few milliseconds, so even a short hard deadline is kept.
+TIME_CHECK_INTERVAL = 128
+
+
+def score_to_table(score, ply):
+    """
+
+    Mate scores count plies from the root. Stored scores count them from
+    the stored position instead, so they stay right wherever it's reached.
+
+    """
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    """
+
+    Undo score_to_table for a position reached at the given ply.
+
+    """
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+
+def get_pv(game, table, max_length=MAX_PV_LENGTH):
+    """
+
+    The principal variation from the game's position as a list of
+    (from_pos, to_pos) tuples, following the best moves stored in the
+    table. It stops at the first missing or illegal move, or when a
+    position repeats. The game is left as it was.
+
+    """
+    pv = []
+    records = []
+    seen = set()
+    while len(pv) < max_length and not game.hash in seen:
+        seen.add(game.hash)
+        entry = table.probe(game.hash)
+        if not entry or not entry[3]:
+            break
+        from_pos, to_pos = entry[3]
+        piece = game.get_piece_at(from_pos)
+        if (not piece or piece.color != game.color_to_move or
+           not (piece, to_pos) in game.get_valid_moves_for_piece(piece)):
+            break
+        pv.append((from_pos, to_pos))
+        records.append(game.make_move(piece, to_pos))
+        game.color_to_move = not game.color_to_move
+    for record in reversed(records):
+        game.unmake_move(record)
+        game.color_to_move = not game.color_to_move
+    return pv
+
+
+class Searcher(object):
+    """
+
+    Negamax alpha-beta search with iterative deepening, followed by a
+    capture-only quiescence search so positions aren't scored in the middle
+    of an exchange.
+
+    The search deepens one ply at a time until it reaches max_depth or runs
+    out of its node or time budget. When the budget runs out it stops at once
+    and returns the best move found so far, so it always has a move to play.
+    max_time is that hard limit; once soft_time seconds have gone the search
+    also stops, but only between iterations, as a partial iteration is worth
+    less.
+
+    Pass a transposition.TranspositionTable as table to reuse results across
+    transpositions, iterations and (if the table is kept) later searches.
+
+    Moves are tried in the order given by an ordering.MoveOrderer, which can
+    be passed as orderer to keep its history (and statistics) across searches.
+
+    stop_flag is anything with a value attribute (e.g. a shared
+    multiprocessing value); the search stops as soon as it's set. start_depth
+    and shuffle_seed (which shuffles the root moves) let helper searches in
+    a parallel search explore the tree differently from the main one.
+
+    report, if given, is called with the searcher after each completed
+    iteration, e.g. to print progress.
+
+    """
+    def __init__(self, game, max_depth=64, max_nodes=None, max_time=None,
+                 table=None, stop_flag=None, start_depth=1,
+                 shuffle_seed=None, orderer=None, soft_time=None,
+                 report=None):
+        self.game = game
+        self.table = table
+        self.orderer = orderer or ordering.MoveOrderer()
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.max_time = max_time
+        self.soft_time = soft_time
+        self.stop_flag = stop_flag
+        self.start_depth = start_depth
+        self.shuffle_seed = shuffle_seed
+        self.report = report
+        self.deadline = None
+        self.soft_deadline = None
+        self.stopped = False
+        self.nodes = 0
+        # results of the deepest completed iteration
+        self.depth_reached = 0
+        self.best_move = None
+        self.best_score = 0
+
+    def search(self):
+        """
+
+        Search the current position for the side to move and return the best
+        move as a (piece, pos) tuple, or None if there are no legal moves.
+
+        """
+        game = self.game
+        self.stopped = False
+        self.nodes = 0
+        self.depth_reached = 0
+        self.best_move = None
+        self.best_score = 0
+        if self.max_time is not None:
+            self.deadline = time.time() + self.max_time
+        if self.soft_time is not None:
+            self.soft_deadline = time.time() + self.soft_time
+        if self.table:
+            self.table.new_search()
+        self.orderer.new_search()
+
+        root_moves = game.get_valid_moves(game.color_to_move)
+        if not root_moves:
+            return None
+        if self.shuffle_seed is not None:
+            random.Random(self.shuffle_seed).shuffle(root_moves)
+        else:
+            root_moves = list(self.orderer.iter_moves(game, root_moves, 0))
+        self.best_move = root_moves[0]
+
+        for depth in xrange(min(self.start_depth, self.max_depth),
+                            self.max_depth + 1):
+            # Search the best move from the last iteration first so a partial
+            # iteration is still worth using.
+            root_moves.remove(self.best_move)
+            root_moves.insert(0, self.best_move)
+
+            alpha = -INFINITY
+            iteration_move = None
+            for piece, pos in root_moves:
+                record = game.make_move(piece, pos)
+                game.color_to_move = not game.color_to_move
+                score = -self.negamax(depth - 1, -INFINITY, -alpha, 1)
+                game.unmake_move(record)
+                game.color_to_move = not game.color_to_move
+                if self.stopped:
+                    break
+                if score > alpha:
+                    alpha = score
+                    iteration_move = (piece, pos)
+
+            if iteration_move:
+                self.best_move = iteration_move
+                self.best_score = alpha
+            if self.stopped:
+                break
+            self.depth_reached = depth
+            if self.table:
+                self.table.store(game.hash, depth,
+                                 score_to_table(self.best_score, 0),
+                                 transposition.EXACT,
+                                 (self.best_move[0].pos, self.best_move[1]))
+            if self.report:
+                self.report(self)
+
+            # No point searching deeper once a forced mate is found
+            if abs(self.best_score) >= MATE - depth:
+                break
+            # Nor once the soft limit has passed
+            if (self.soft_deadline is not None and
+               time.time() >= self.soft_deadline):
+                break
+
+        return self.best_move
+
+    def out_of_budget(self):
+        """
+
+        True if the node or time budget has run out, or the search has been
+        told to stop.
+
+        """
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            return True
+        if self.nodes % TIME_CHECK_INTERVAL:
+            return False
+        if self.deadline is not None and time.time() >= self.deadline:
+            return True
+        if self.stop_flag is not None and self.stop_flag.value:
+            return True
+        return False
+
+    def negamax(self, depth, alpha, beta, ply):
+        """
+
+        Score of the position for the side to move, searched depth plies
+        deeper. Scores outside (alpha, beta) are only bounds.
+
+        """
+        self.nodes += 1
+        if self.out_of_budget():
+            self.stopped = True
+        if self.stopped:
+            return 0
+
+        game = self.game
+        if game.idle_move_count >= 50:
+            return 0
+        if depth <= 0:
+            return self.quiesce(alpha, beta, ply)
+
+        # Use a stored result if it was searched deep enough, otherwise try
+        # its best move first
+        table_move = None
+        if self.table:
+            entry = self.table.probe(game.hash)
+            if entry:
+                score, entry_depth, bound, table_move = entry
+                if entry_depth >= depth:
+                    score = score_from_table(score, ply)
+                    if (bound == transposition.EXACT or
+                       bound == transposition.LOWER and score >= beta or
+                       bound == transposition.UPPER and score <= alpha):
+                        return score
+
+        moves = game.get_valid_moves(game.color_to_move)
+        if not moves:
+            if game.in_check():
+                return -MATE + ply
+            return 0
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = None
+        orderer = self.orderer
+        for index, (piece, pos) in enumerate(
+                orderer.iter_moves(game, moves, ply, table_move)):
+            record = game.make_move(piece, pos)
+            game.color_to_move = not game.color_to_move
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            game.unmake_move(record)
+            game.color_to_move = not game.color_to_move
+            if self.stopped:
+                return 0
+            if score > best_score:
+                best_score = score
+                best_move = (piece.pos, pos)
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        orderer.record_cutoff(game, piece, pos, depth, ply,
+                                              index, table_move)
+                        break
+
+        if self.table:
+            if best_score >= beta:
+                bound = transposition.LOWER
+            elif best_score > original_alpha:
+                bound = transposition.EXACT
+            else:
+                bound = transposition.UPPER
+            self.table.store(game.hash, depth,
+                             score_to_table(best_score, ply), bound,
+                             best_move)
+        return best_score
+
+    def quiesce(self, alpha, beta, ply):
+        """
+
+        Score of the position for the side to move once the captures have
+        played out. The side to move can stand on the static score instead of
+        capturing, and captures that lose material by static exchange
+        evaluation aren't tried. In check every evasion is searched instead,
+        and having none is mate.
+
+        """
+        self.nodes += 1
+        if self.out_of_budget():
+            self.stopped = True
+        if self.stopped:
+            return 0
+
+        game = self.game
+        if game.idle_move_count >= 50:
+            return 0
+        if ply >= MAX_PLY:
+            return self.evaluate()
+        in_check = game.in_check()
+        if in_check:
+            best_score = -INFINITY
+        else:
+            best_score = self.evaluate()
+            if best_score >= beta:
+                return best_score
+            if best_score > alpha:
+                alpha = best_score
+
+        moves = game.get_valid_moves(game.color_to_move)
+        if in_check:
+            if not moves:
+                return -MATE + ply
+        else:
+            moves = [(piece, pos) for piece, pos in moves if
+                     self.orderer.get_victim(game, piece, pos) and
+                     exchange.static_exchange(game, piece, pos) >= 0]
+
+        for piece, pos in self.orderer.iter_moves(game, moves, ply):
+            record = game.make_move(piece, pos)
+            game.color_to_move = not game.color_to_move
+            score = -self.quiesce(-beta, -alpha, ply + 1)
+            game.unmake_move(record)
+            game.color_to_move = not game.color_to_move
+            if self.stopped:
+                return 0
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        break
+        return best_score
+
+    def evaluate(self):
+        """
+
+        Material and piece-square balance for the side to move.
+
+        """
+        return evaluation.evaluate(self.game)
@@ -0,0 +1,195 @@
+# std lib imports
+import sys
+import time
+import json
+import random
+import argparse
+import multiprocessing
+
+# local imports
+import book
+import constants
+import games
+import pgn
+import player
+import tablebase
+import utility
+
+# Players that can be put in a batch, by name. Each is built from the game,
+# its color and the batch options.
+PLAYERS = {
+    "computer": lambda game, color, options: player.Computer(
+        game, color, book=options.get("opening_book"),
+        tablebases=options.get("endgame_tables")),
+    "search": lambda game, color, options: player.SearchComputer(
+        game, color, max_depth=options.get("search_depth", 64),
+        max_time=options.get("search_time", 1.0),
+        book=options.get("opening_book"),
+        tablebases=options.get("endgame_tables")),
+}
+
+
+def play_game(job):
+    """
+
+    Play one headless game and return a dict describing how it went. job is
+    a (game number, seed, white name, black name, options) tuple, so this can
+    be handed to a process pool.
+
+    """
+    number, seed, white, black, options = job
+    random.seed(seed)
+    game = games.Game(backend=options.get("backend", constants.PIECE_LIST))
+    if options.get("book"):
+        options = dict(options, opening_book=book.OpeningBook(options["book"]))
+    if options.get("tablebases"):
+        options = dict(options, endgame_tables=tablebase.Tablebases(
+            options["tablebases"]))
+    players = {constants.WHITE: PLAYERS[white](game, constants.WHITE,
+                                               options),
+               constants.BLACK: PLAYERS[black](game, constants.BLACK,
+                                               options)}
+    max_plies = options.get("max_plies")
+    max_seconds = options.get("max_seconds")
+
+    moves = []
+    san_moves = []
+    result = constants.UNFINISHED
+    start = time.time()
+    try:
+        while True:
+            if max_plies is not None and len(moves) >= max_plies:
+                reason = "Ply limit reached"
+                break
+            if (max_seconds is not None and
+               time.time() - start >= max_seconds):
+                reason = "Time limit reached"
+                break
+
+            move = players[game.color_to_move].get_move()
+            san_moves.append(pgn.get_san(game, move[0], move[1]))
+            moves.append(utility.get_grid_pos(move[0].pos) +
+                         utility.get_grid_pos(move[1]))
+            game.move_piece_to(move[0], move[1])
+            game.color_to_move = not game.color_to_move
+            game.check_endgame()
+    except games.EndGameException as e:
+        reason = str(e)
+        result = pgn.get_result(game)
+    if options.get("opening_book"):
+        options["opening_book"].close()
+    if options.get("endgame_tables"):
+        options["endgame_tables"].close()
+
+    return {"game": number,
+            "seed": seed,
+            "white": white,
+            "black": black,
+            "result": result,
+            "plies": len(moves),
+            "reason": reason,
+            "seconds": round(time.time() - start, 3),
+            "moves": moves,
+            "san": san_moves}
+
+
+def run_batch(number_of_games, white, black, output, workers=None, seed=0,
+              options=None, pgn_output=None):
+    """
+
+    Play a batch of games over a pool of worker processes, appending each
+    result to the output file as a line of JSON as soon as it finishes, and
+    to the pgn_output file as PGN if one is given. Game n is played with
+    random seed seed + n. Returns the results.
+
+    """
+    options = options or {}
+    jobs = [(number, seed + number, white, black, options)
+            for number in xrange(number_of_games)]
+    pool = multiprocessing.Pool(workers)
+    results = []
+    pgn_file = open(pgn_output, "a") if pgn_output else None
+    try:
+        with open(output, "a") as output_file:
+            for result in pool.imap_unordered(play_game, jobs):
+                output_file.write(json.dumps(result) + "\n")
+                output_file.flush()
+                if pgn_file:
+                    pgn.write_game(pgn_file, result["san"], result["result"],
+                                   {"Event": "Self-play",
+                                    "Round": result["game"] + 1,
+                                    "White": result["white"],
+                                    "Black": result["black"],
+                                    "Seed": result["seed"],
+                                    "Termination": result["reason"]})
+                results.append(result)
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        if pgn_file:
+            pgn_file.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Play a batch of headless AI vs. AI games over every "
+                    "core and write the results as JSON lines.")
+    parser.add_argument("--games", type=int, default=10)
+    parser.add_argument("--white", default="computer",
+                        choices=sorted(PLAYERS))
+    parser.add_argument("--black", default="computer",
+                        choices=sorted(PLAYERS))
+    parser.add_argument("--output", default="selfplay.jsonl")
+    parser.add_argument("--pgn", default=None,
+                        help="also append the games to this PGN file")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default one per core)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="random seed of the first game")
+    parser.add_argument("--max-plies", type=int, default=None)
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="time limit per game")
+    parser.add_argument("--search-time", type=float, default=1.0,
+                        help="seconds per move for search players")
+    parser.add_argument("--search-depth", type=int, default=64,
+                        help="deepest search for search players")
+    parser.add_argument("--backend", default=constants.PIECE_LIST,
+                        choices=constants.BACKENDS)
+    parser.add_argument("--book", default=None,
+                        help="opening book for the players to use")
+    parser.add_argument("--tablebases", default=None,
+                        help="directory of endgame tables for the players")
+    args = parser.parse_args()
+
+    options = {"book": args.book,
+               "tablebases": args.tablebases,
+               "max_plies": args.max_plies,
+               "max_seconds": args.max_seconds,
+               "search_time": args.search_time,
+               "search_depth": args.search_depth,
+               "backend": args.backend}
+    start = time.time()
+    results = run_batch(args.games, args.white, args.black, args.output,
+                        workers=args.workers, seed=args.seed, options=options,
+                        pgn_output=args.pgn)
+    elapsed = time.time() - start
+
+    scores = dict((result, 0) for result in pgn.RESULTS)
+    for result in results:
+        scores[result["result"]] += 1
+    print "%i games in %.1fs (%.2f games/sec)" % (len(results), elapsed,
+                                                  len(results) / elapsed)
+    print "White wins: %i, black wins: %i, draws: %i, unfinished: %i" % (
+        scores[constants.WHITE_WINS], scores[constants.BLACK_WINS],
+        scores[constants.DRAW], scores[constants.UNFINISHED])
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print "\nBye!"
+        sys.exit()
@@ -0,0 +1,476 @@
+# std lib imports
+import os
+import sys
+import Queue
+import signal
+import socket
+import asyncore
+import asynchat
+import argparse
+import traceback
+import multiprocessing
+
+# local imports
+import constants
+import games
+import pgn
+import search
+import transposition
+import uci
+
+HOST = "127.0.0.1"
+PORT = 7070
+
+# Engine strength unless a game asks for something else
+SEARCH_DEPTH = 3
+MOVETIME = 1000
+# Transposition table each search gets, in megabytes
+HASH_MB = 4
+# Searches that may wait for a worker before the server turns more away
+QUEUE_PER_WORKER = 4
+
+# Longest line a client may send
+MAX_LINE = 4096
+
+
+def search_move(job):
+    """
+
+    Body of a pool worker: search a position and return the best move in
+    UCI notation, None if there are no moves, or the error if the search
+    failed. job is a (fen, depth, movetime in ms, hash_mb, backend) tuple.
+
+    """
+    fen, depth, movetime, hash_mb, backend = job
+    try:
+        game = games.Game.from_fen(fen, backend)
+        searcher = search.Searcher(
+            game, max_depth=depth, max_time=movetime / 1000.0,
+            table=transposition.TranspositionTable(hash_mb))
+        move = searcher.search()
+        if not move:
+            return None
+        return uci.format_move(game, move[0].pos, move[1])
+    except Exception:
+        return RuntimeError(traceback.format_exc())
+
+
+def _ignore_interrupts():
+    """
+
+    Workers leave Ctrl-C to the server, which shuts the pool down itself.
+
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class _Waker(asyncore.file_dispatcher):
+    """
+
+    Read end of a pipe that wakes the event loop when search results come
+    back from the pool.
+
+    """
+    def __init__(self, fd, server):
+        asyncore.file_dispatcher.__init__(self, fd)
+        self.server = server
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        self.recv(4096)
+        self.server.handle_results()
+
+
+class Session(object):
+    """
+
+    One game on the server, played by a client against the engine.
+
+    version goes up with every move, so a search result that arrives after
+    the game has moved on (or been closed) is recognised and dropped.
+
+    """
+    def __init__(self, number, connection, game, depth, movetime):
+        self.number = number
+        self.connection = connection
+        self.game = game
+        self.depth = depth
+        self.movetime = movetime
+        self.version = 0
+        self.thinking = False
+        self.over = False
+
+
+class Connection(asynchat.async_chat):
+    """
+
+    A client connection, reading one command per line. See Server for the
+    commands.
+
+    """
+    def __init__(self, sock, server):
+        asynchat.async_chat.__init__(self, sock)
+        self.server = server
+        self.buffer = []
+        self.buffered = 0
+        self.sessions = {}
+        self.set_terminator("\n")
+
+    def collect_incoming_data(self, data):
+        if self.buffer is None:
+            # already hanging up
+            return
+        self.buffered += len(data)
+        if self.buffered > MAX_LINE:
+            self.send_line("error Line too long")
+            self.close_when_done()
+            self.buffer = None
+            return
+        self.buffer.append(data)
+
+    def found_terminator(self):
+        if self.buffer is None:
+            return
+        line = "".join(self.buffer).strip()
+        self.buffer = []
+        self.buffered = 0
+        if not line:
+            return
+        # a command that goes wrong mustn't take the connection's other
+        # games down with it
+        try:
+            self.server.handle_command(self, line)
+        except Exception:
+            sys.stderr.write(traceback.format_exc())
+            self.send_line("error Internal error")
+
+    def send_line(self, line):
+        self.push(line + "\n")
+
+    def handle_close(self):
+        self.server.drop_connection(self)
+        self.close()
+
+
+class Server(asyncore.dispatcher):
+    """
+
+    Hosts many games at once from a single event loop, one session per game,
+    over TCP or a Unix socket. Engine searches go to a pool of worker
+    processes, so a slow one never holds up the other sessions, and at most
+    QUEUE_PER_WORKER searches per worker are left waiting before new ones
+    are turned away.
+
+    Commands, one per line, with the replies sent back:
+
+        new [depth <n>] [movetime <ms>] [fen <fen>]   game <id> <fen>
+        move <id> <move>          moved <id> <move>, then the engine's
+                                  bestmove <id> <move>
+        go <id>                   bestmove <id> <move> (the engine moves)
+        moves <id>                moves <id> <move> <move> ...
+        fen <id>                  fen <id> <fen>
+        close <id>                closed <id>
+        quit                      (the connection is closed)
+
+    Moves are in UCI notation and checked with the game's own legality
+    rules. A move that ends the game is followed by
+    end <id> <result> <reason>. Anything wrong gets error [<id>] <message>.
+
+    """
+    def __init__(self, address, family=socket.AF_INET, workers=None,
+                 depth=SEARCH_DEPTH, movetime=MOVETIME, hash_mb=HASH_MB,
+                 backend=constants.PIECE_LIST):
+        # The workers are forked first, so they don't hold the socket open
+        self.workers = workers or multiprocessing.cpu_count()
+        self.max_pending = self.workers * QUEUE_PER_WORKER
+        self.pending = 0
+        self.pool = multiprocessing.Pool(self.workers,
+                                         initializer=_ignore_interrupts)
+
+        asyncore.dispatcher.__init__(self)
+        self.create_socket(family, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind(address)
+        self.listen(128)
+
+        self.depth = depth
+        self.movetime = movetime
+        self.hash_mb = hash_mb
+        self.backend = backend
+        self.sessions = {}
+        self.next_number = 1
+
+        # Search results come back on a pool thread. They're queued for the
+        # event loop, which a byte down the pipe wakes up.
+        self.results = Queue.Queue()
+        wake_read, self.wake_write = os.pipe()
+        # the waker keeps a copy of the read end
+        self.waker = _Waker(wake_read, self)
+        os.close(wake_read)
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair:
+            Connection(pair[0], self)
+
+    def handle_command(self, connection, line):
+        """
+
+        Carry out a command from a client.
+
+        """
+        tokens = line.split()
+        command = tokens[0].lower()
+        if command == "new":
+            self.new_session(connection, tokens[1:])
+            return
+        if command == "quit":
+            self.drop_connection(connection)
+            connection.close_when_done()
+            return
+        if not command in ("move", "go", "moves", "fen", "close"):
+            connection.send_line("error Unknown command: %s" % command)
+            return
+
+        try:
+            session = connection.sessions[int(tokens[1])]
+        except (IndexError, ValueError, KeyError):
+            connection.send_line("error No such game")
+            return
+        game = session.game
+        if command == "fen":
+            connection.send_line("fen %i %s" % (session.number,
+                                                game.to_fen()))
+        elif command == "moves":
+            moves = [uci.format_move(game, piece.pos, pos) for piece, pos in
+                     game.get_valid_moves(game.color_to_move)]
+            connection.send_line("moves %i %s" % (session.number,
+                                                  " ".join(moves)))
+        elif command == "close":
+            self.close_session(session)
+            connection.send_line("closed %i" % session.number)
+        elif session.over:
+            connection.send_line("error %i The game is over" %
+                                 session.number)
+        elif session.thinking:
+            connection.send_line("error %i The engine is thinking" %
+                                 session.number)
+        elif command == "go":
+            self.start_search(session)
+        elif command == "move":
+            if len(tokens) != 3:
+                connection.send_line("error %i Usage: move <id> <move>" %
+                                     session.number)
+                return
+            try:
+                piece, pos = uci.parse_move(game, tokens[2])
+            except ValueError as e:
+                connection.send_line("error %i %s" % (session.number, e))
+                return
+            connection.send_line("moved %i %s" % (session.number, tokens[2]))
+            self.play(session, piece, pos)
+            if not session.over:
+                self.start_search(session)
+
+    def new_session(self, connection, tokens):
+        """
+
+        Start a game for the connection from a new command's tokens.
+
+        """
+        depth = self.depth
+        movetime = self.movetime
+        fen = None
+        if "fen" in tokens:
+            fen = " ".join(tokens[tokens.index("fen") + 1:])
+            tokens = tokens[:tokens.index("fen")]
+        for index in xrange(0, len(tokens) - 1, 2):
+            option = tokens[index]
+            if not option in ("depth", "movetime"):
+                connection.send_line("error bad option %s" % option)
+                return
+            try:
+                value = max(1, int(tokens[index + 1]))
+            except ValueError:
+                connection.send_line("error bad %s" % option)
+                return
+            if option == "depth":
+                depth = value
+            else:
+                movetime = value
+        if fen:
+            # from_fen also turns down positions that can't come up in a
+            # game, such as one where the king to move could be taken
+            try:
+                game = games.Game.from_fen(fen, self.backend)
+            except ValueError:
+                connection.send_line("error bad fen")
+                return
+        else:
+            game = games.Game(self.backend)
+
+        session = Session(self.next_number, connection, game, depth, movetime)
+        self.next_number += 1
+        self.sessions[session.number] = session
+        connection.sessions[session.number] = session
+        connection.send_line("game %i %s" % (session.number, game.to_fen()))
+
+    def play(self, session, piece, pos):
+        """
+
+        Make a legal move in the session's game, and tell the client if that
+        ended it.
+
+        """
+        game = session.game
+        game.move_piece_to(piece, pos)
+        game.color_to_move = not game.color_to_move
+        session.version += 1
+        try:
+            game.check_endgame()
+        except games.EndGameException as e:
+            session.over = True
+            session.connection.send_line("end %i %s %s" % (
+                session.number, pgn.get_result(game), e))
+
+    def start_search(self, session):
+        """
+
+        Hand the session's position to the worker pool, or tell the client
+        the server is too busy.
+
+        """
+        if self.pending >= self.max_pending:
+            session.connection.send_line("error %i Server busy" %
+                                         session.number)
+            return
+        self.pending += 1
+        session.thinking = True
+        number, version = session.number, session.version
+        job = (session.game.to_fen(), session.depth, session.movetime,
+               self.hash_mb, self.backend)
+        self.pool.apply_async(
+            search_move, (job,),
+            callback=lambda move: self.post_result(number, version, move))
+
+    def post_result(self, number, version, move):
+        """
+
+        Called on a pool thread with a search's move; passes it on to the
+        event loop.
+
+        """
+        self.results.put((number, version, move))
+        os.write(self.wake_write, "x")
+
+    def handle_results(self):
+        """
+
+        Play the moves of finished searches, on the event loop.
+
+        """
+        while True:
+            try:
+                number, version, move = self.results.get_nowait()
+            except Queue.Empty:
+                break
+            self.pending -= 1
+            session = self.sessions.get(number)
+            if not session or session.version != version:
+                continue
+            session.thinking = False
+            connection = session.connection
+            if isinstance(move, Exception):
+                connection.send_line("error %i Search failed" % number)
+                sys.stderr.write(str(move))
+            elif move is None:
+                connection.send_line("error %i No moves to play" % number)
+            else:
+                # the event loop has to survive a game going wrong
+                try:
+                    piece, pos = uci.parse_move(session.game, move)
+                    connection.send_line("bestmove %i %s" % (number, move))
+                    self.play(session, piece, pos)
+                except Exception:
+                    sys.stderr.write(traceback.format_exc())
+                    connection.send_line("error %i Internal error" % number)
+
+    def close_session(self, session):
+        """
+
+        Forget a game. A search still running for it is dropped when it
+        comes back.
+
+        """
+        self.sessions.pop(session.number, None)
+        session.connection.sessions.pop(session.number, None)
+
+    def drop_connection(self, connection):
+        """
+
+        Forget all the games of a connection that's going away.
+
+        """
+        for session in connection.sessions.values():
+            self.close_session(session)
+
+    def shutdown(self):
+        """
+
+        Close the socket and stop the worker pool.
+
+        """
+        self.close()
+        self.waker.close()
+        os.close(self.wake_write)
+        self.pool.terminate()
+        self.pool.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve many games at once over a socket, with a line "
+                    "protocol and a pool of worker processes searching the "
+                    "engine's moves.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--unix", default=None,
+                        help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="search processes (default one per core)")
+    parser.add_argument("--depth", type=int, default=SEARCH_DEPTH,
+                        help="engine search depth unless a game sets one")
+    parser.add_argument("--movetime", type=int, default=MOVETIME,
+                        help="most milliseconds per engine move")
+    parser.add_argument("--hash-mb", type=float, default=HASH_MB)
+    parser.add_argument("--backend", default=constants.PIECE_LIST,
+                        choices=constants.BACKENDS)
+    args = parser.parse_args()
+
+    if args.unix:
+        if os.path.exists(args.unix):
+            os.remove(args.unix)
+        address, family = args.unix, socket.AF_UNIX
+    else:
+        address, family = (args.host, args.port), socket.AF_INET
+    server = Server(address, family, workers=args.workers, depth=args.depth,
+                    movetime=args.movetime, hash_mb=args.hash_mb,
+                    backend=args.backend)
+    print "Serving on %s with %i workers" % (args.unix or "%s:%i" % address,
+                                             server.workers)
+    sys.stdout.flush()
+    try:
+        asyncore.loop(timeout=1.0, use_poll=True)
+    finally:
+        server.shutdown()
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print "\nBye!"
+        sys.exit()
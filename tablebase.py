@@ -0,0 +1,687 @@
+# std lib imports
+import os
+import mmap
+import time
+import struct
+import argparse
+
+# local imports
+import constants
+import bitboards
+import games
+
+# Result for the side to move, as stored in the tables
+DRAW = 0
+WIN = 1
+LOSS = 2
+INVALID = 3  # can't happen, e.g. the side not to move is in check
+
+# Most pieces (kings included) a table can have
+MAX_PIECES = 4
+
+# Each table file is a header, then the result of every position packed
+# four to a byte, then the distance to mate of every position in plies (0
+# for draws), one byte each. Positions are only stored once for each of
+# their reflections and rotations (see _Indexing).
+MAGIC = "CTB2"
+HEADER = struct.Struct("<4s16s")
+
+# Piece letters, in the order they're listed in a signature such as "KRvK"
+LETTERS = "KQRBNP"
+_TYPE_FOR_LETTER = {"K": bitboards.KING,
+                    "Q": bitboards.QUEEN,
+                    "R": bitboards.ROOK,
+                    "B": bitboards.BISHOP,
+                    "N": bitboards.KNIGHT,
+                    "P": bitboards.PAWN}
+_LETTER_FOR_TYPE = dict((piece_type, letter) for letter, piece_type in
+                        _TYPE_FOR_LETTER.items())
+_VALUES = dict((piece_type, constants.PIECE_VALUES[piece_class]) for
+               piece_class, piece_type in bitboards.PIECE_TYPES.items())
+
+# Position still being worked out, during generation
+_UNKNOWN = 4
+
+
+def _get_transform(flip_x, flip_y, swap):
+    """
+
+    Where each square goes when the board is mirrored left to right and/or
+    top to bottom, after reflecting it in the a1-h8 diagonal if swap.
+
+    """
+    transform = []
+    for square in xrange(64):
+        x, y = square & 7, square >> 3
+        if swap:
+            x, y = y, x
+        if flip_x:
+            x = 7 - x
+        if flip_y:
+            y = 7 - y
+        transform.append(x + 8 * y)
+    return transform
+
+# Without pawns a position looks the same from all 8 of the board's
+# rotations and reflections. Pawns only allow mirroring left to right. The
+# identity comes first.
+_SYMMETRIES = [_get_transform(flip_x, flip_y, swap) for swap in (False, True)
+               for flip_y in (False, True) for flip_x in (False, True)]
+_MIRRORS = _SYMMETRIES[:2]
+# Squares the white king is moved onto: the a1-d1-d4 triangle, or files a-d
+_PAWNLESS_KING_SQUARES = [x + 8 * y for y in xrange(4) for x in xrange(y, 4)]
+_PAWN_KING_SQUARES = [x + 8 * y for y in xrange(8) for x in xrange(4)]
+
+
+class _Indexing(object):
+    """
+
+    Numbers the positions of a table's pieces, given as squares in table
+    order (the white king first), with white or black to move.
+
+    Each position is turned so the white king lands on one of a few squares,
+    and the index is then made of the king's place among those squares, the
+    other squares and the side to move. Where more than one turn does that
+    (the king on the a1-h8 diagonal), the one putting the other pieces on
+    the lowest squares is used, so every position and its reflections share
+    one index. The indices of the other turns are never used.
+
+    """
+    def __init__(self, piece_types):
+        self.count = len(piece_types)
+        if any(piece_type == bitboards.PAWN for color, piece_type in
+               piece_types):
+            transforms = _MIRRORS
+            self.king_squares = _PAWN_KING_SQUARES
+        else:
+            transforms = _SYMMETRIES
+            self.king_squares = _PAWNLESS_KING_SQUARES
+        self.king_index = dict((square, number) for number, square in
+                               enumerate(self.king_squares))
+        # turns that bring the white king from each square into place
+        self.candidates = [[transform for transform in transforms if
+                            transform[square] in self.king_index]
+                           for square in xrange(64)]
+        self.size = 2 * len(self.king_squares) * 64 ** (self.count - 1)
+
+    def encode(self, squares, color_to_move):
+        """
+
+        Index of the position with the pieces on the squares.
+
+        """
+        candidates = self.candidates[squares[0]]
+        mapped = [candidates[0][square] for square in squares]
+        for transform in candidates[1:]:
+            other = [transform[square] for square in squares]
+            if other < mapped:
+                mapped = other
+        index = 0
+        for square in reversed(mapped[1:]):
+            index = index * 64 + square
+        index = index * len(self.king_squares) + self.king_index[mapped[0]]
+        return index * 2 + (0 if color_to_move == constants.WHITE else 1)
+
+    def decode(self, index):
+        """
+
+        (squares, color to move) of the position at the index.
+
+        """
+        color_to_move = constants.WHITE if not index & 1 else constants.BLACK
+        rest, king = divmod(index >> 1, len(self.king_squares))
+        return ([self.king_squares[king]] +
+                [(rest >> (6 * slot)) & 63 for slot in
+                 xrange(self.count - 1)], color_to_move)
+
+
+# Positions with few enough pieces that the tables still mustn't answer for
+UNCOVERED_FENS = [
+    "4k3/8/8/8/8/8/8/R3K3 w Q - 0 1",  # white can castle
+    "r3k3/8/8/8/8/8/8/4K3 b q - 0 1",  # black can castle
+    "8/8/8/8/3pP3/8/8/K6k b - e3 0 1",  # black can take en passant
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+]
+
+
+def get_signature(white_letters, black_letters):
+    """
+
+    The signature of the table covering the given material, and whether the
+    colors have to be swapped (and the board mirrored) to look positions up
+    in it. The stronger side is always white in a table.
+
+    """
+    white = "".join(sorted(white_letters, key=LETTERS.index))
+    black = "".join(sorted(black_letters, key=LETTERS.index))
+    strength = lambda letters: (sum(_VALUES[_TYPE_FOR_LETTER[letter]]
+                                    for letter in letters), letters)
+    if strength(black) > strength(white):
+        return black + "v" + white, True
+    return white + "v" + black, False
+
+
+def _get_piece_types(signature):
+    """
+
+    (color, piece type) for each piece of a signature, in table order.
+
+    """
+    white, black = signature.split("v")
+    return ([(constants.WHITE, _TYPE_FOR_LETTER[letter]) for letter in white] +
+            [(constants.BLACK, _TYPE_FOR_LETTER[letter]) for letter in black])
+
+
+def _get_index(indexing, piece_types, placed, color_to_move):
+    """
+
+    Index in a table of a position given as (color, piece type, square)
+    tuples, already in the table's colors.
+
+    """
+    remaining = list(placed)
+    squares = []
+    for color, piece_type in piece_types:
+        for number, (piece_color, placed_type, square) in enumerate(
+                remaining):
+            if piece_color == color and placed_type == piece_type:
+                squares.append(square)
+                del remaining[number]
+                break
+    return indexing.encode(squares, color_to_move)
+
+
+def _attacks(piece_type, color, square, occupied):
+    """
+
+    Squares attacked by a piece.
+
+    """
+    if piece_type == bitboards.KING:
+        return bitboards.KING_ATTACKS[square]
+    if piece_type == bitboards.KNIGHT:
+        return bitboards.KNIGHT_ATTACKS[square]
+    if piece_type == bitboards.PAWN:
+        return bitboards.PAWN_ATTACKS[color][square]
+    attacks = 0
+    if piece_type != bitboards.BISHOP:
+        attacks |= bitboards.slider_attacks(square, occupied,
+                                            bitboards.ROOK_RAYS)
+    if piece_type != bitboards.ROOK:
+        attacks |= bitboards.slider_attacks(square, occupied,
+                                            bitboards.BISHOP_RAYS)
+    return attacks
+
+
+class Table(object):
+    """
+
+    One memory-mapped table file.
+
+    """
+    def __init__(self, filename):
+        self._file = open(filename, "rb")
+        magic, signature = HEADER.unpack(self._file.read(HEADER.size))
+        if magic != MAGIC:
+            self._file.close()
+            raise ValueError('Not a valid tablebase file')
+        self.signature = signature.rstrip("\0")
+        self.piece_types = _get_piece_types(self.signature)
+        self.indexing = _Indexing(self.piece_types)
+        self.size = self.indexing.size
+        self._map = mmap.mmap(self._file.fileno(), 0,
+                              access=mmap.ACCESS_READ)
+        self._distance_offset = HEADER.size + self.size // 4
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def get(self, index):
+        """
+
+        (result, distance to mate in plies) of the position at the index.
+
+        """
+        packed = ord(self._map[HEADER.size + (index >> 2)])
+        return ((packed >> ((index & 3) * 2)) & 3,
+                ord(self._map[self._distance_offset + index]))
+
+
+class Tablebases(object):
+    """
+
+    The endgame tables in a directory, opened as they're needed.
+
+    Results are exact as long as neither side can castle or take en
+    passant; the tables don't cover either. Distances ignore the 50 move
+    rule.
+
+    """
+    def __init__(self, directory="tablebases"):
+        self.directory = directory
+        self._tables = {}
+
+    def get_filename(self, signature):
+        return os.path.join(self.directory, signature + ".ctb")
+
+    def get_table(self, signature):
+        """
+
+        The table for the signature, or None if there's no such file or it
+        was written by an older version and has to be generated again.
+
+        """
+        if not signature in self._tables:
+            filename = self.get_filename(signature)
+            table = None
+            if os.path.exists(filename):
+                try:
+                    table = Table(filename)
+                except ValueError:
+                    pass
+            self._tables[signature] = table
+        return self._tables[signature]
+
+    def close(self):
+        for table in self._tables.values():
+            if table:
+                table.close()
+        self._tables = {}
+
+    def probe_pieces(self, placed, color_to_move):
+        """
+
+        (result, distance to mate) for the side to move of a position given
+        as (color, piece type, square) tuples, or None if it isn't covered.
+
+        """
+        if len(placed) == 2:
+            # only the kings are left
+            return DRAW, 0
+        if len(placed) > MAX_PIECES:
+            return None
+        signature, swapped = get_signature(
+            [_LETTER_FOR_TYPE[piece_type] for color, piece_type, square in
+             placed if color == constants.WHITE],
+            [_LETTER_FOR_TYPE[piece_type] for color, piece_type, square in
+             placed if color == constants.BLACK])
+        table = self.get_table(signature)
+        if not table:
+            return None
+        if swapped:
+            placed = [(not color, piece_type, square ^ 56) for
+                      color, piece_type, square in placed]
+            color_to_move = not color_to_move
+        return table.get(_get_index(table.indexing, table.piece_types,
+                                    placed, color_to_move))
+
+    def probe(self, game):
+        """
+
+        (result, distance to mate) for the side to move, or None if the
+        position isn't covered. The tables assume neither side can castle or
+        take en passant, so positions where one can aren't covered.
+
+        """
+        if (game.en_passant_pos or game.castling_rights or
+           len(game.get_pieces()) > MAX_PIECES):
+            return None
+        return self.probe_pieces(
+            [(piece.color, bitboards.PIECE_TYPES[piece.__class__],
+              piece.pos[0] + 8 * piece.pos[1]) for piece in game.get_pieces()],
+            game.color_to_move)
+
+    def get_move(self, game):
+        """
+
+        The best move for the side to move as a (piece, pos) tuple: the
+        quickest win, else a draw, else the slowest loss. None if the
+        position (or a position a move leads to) isn't covered.
+
+        """
+        entry = self.probe(game)
+        if entry is None or entry[0] == INVALID:
+            return None
+        best_move = None
+        best_key = None
+        for piece, pos in game.get_valid_moves(game.color_to_move):
+            record = game.make_move(piece, pos)
+            game.color_to_move = not game.color_to_move
+            if game.en_passant_pos:
+                # The tables don't cover en passant, so look the reply up as
+                # if the pawn couldn't be taken that way
+                en_passant_pos = game.en_passant_pos
+                game.en_passant_pos = None
+                entry = self.probe(game)
+                game.en_passant_pos = en_passant_pos
+            else:
+                entry = self.probe(game)
+            game.unmake_move(record)
+            game.color_to_move = not game.color_to_move
+            if entry is None:
+                return None
+
+            # Rank the move from the mover's point of view
+            result, distance = entry
+            if result == LOSS:
+                key = (2, -distance)
+            elif result == WIN:
+                key = (0, distance)
+            else:
+                key = (1, 0)
+            if best_key is None or key > best_key:
+                best_key = key
+                best_move = (piece, pos)
+        return best_move
+
+
+def _get_successors(signature):
+    """
+
+    Signatures of the tables a capture or promotion can lead to.
+
+    """
+    piece_types = _get_piece_types(signature)
+    successors = set()
+    for captured in [None] + range(len(piece_types)):
+        if captured is not None and piece_types[captured][1] == \
+                bitboards.KING:
+            continue
+        for promoted in [None] + range(len(piece_types)):
+            if captured is None and promoted is None or captured == promoted:
+                continue
+            if promoted is not None and (
+                    piece_types[promoted][1] != bitboards.PAWN or
+                    captured is not None and
+                    piece_types[captured][0] == piece_types[promoted][0]):
+                continue
+            letters = {constants.WHITE: [], constants.BLACK: []}
+            for number, (color, piece_type) in enumerate(piece_types):
+                if number == captured:
+                    continue
+                if number == promoted:
+                    piece_type = bitboards.QUEEN
+                letters[color].append(_LETTER_FOR_TYPE[piece_type])
+            if len(letters[constants.WHITE]) + \
+                    len(letters[constants.BLACK]) > 2:
+                successors.add(get_signature(letters[constants.WHITE],
+                                             letters[constants.BLACK])[0])
+    return successors
+
+
+def generate(signature, tablebases, verbose=False):
+    """
+
+    Work out the table for the signature by retrograde analysis and write
+    it to the tablebases' directory, first generating any table a capture
+    or promotion can lead to. Tables that already exist are left alone.
+
+    """
+    white, black = signature.split("v")
+    signature = get_signature(white, black)[0]
+    if len(signature) - 1 > MAX_PIECES:
+        raise ValueError('Not a valid signature')
+    if tablebases.get_table(signature):
+        return
+    for successor in sorted(_get_successors(signature)):
+        generate(successor, tablebases, verbose)
+
+    start = time.time()
+    piece_types = _get_piece_types(signature)
+    indexing = _Indexing(piece_types)
+    encode = indexing.encode
+    colors = [color for color, piece_type in piece_types]
+    types = [piece_type for color, piece_type in piece_types]
+    count = len(piece_types)
+    slots = range(count)
+    kings = dict((colors[slot], slot) for slot in slots if
+                 types[slot] == bitboards.KING)
+    size = indexing.size
+
+    results = bytearray([_UNKNOWN]) * size
+    distances = bytearray(size)
+    # Moves not yet known to lose, per position. Moves to reflections of the
+    # same position count once, as only one of them is found going back.
+    move_counts = bytearray(size)
+    # positions to settle, by distance to mate
+    queue = {}
+    # longest mate a position suffers by capturing or promoting
+    exit_distances = {}
+
+    def is_attacked(square, by_color, squares, occupied, captured):
+        bit = bitboards.SQUARE_BIT[square]
+        for slot in slots:
+            if (colors[slot] == by_color and slot != captured and
+               _attacks(types[slot], by_color, squares[slot], occupied) &
+               bit):
+                return True
+        return False
+
+    # First pass: find the impossible positions, mates and stalemates,
+    # count the moves of the others and look up the captures and promotions
+    for index in xrange(size):
+        squares, color = indexing.decode(index)
+        occupied = 0
+        for square in squares:
+            occupied |= bitboards.SQUARE_BIT[square]
+        if bin(occupied).count("1") != count:
+            results[index] = INVALID
+            continue
+        if any(types[slot] == bitboards.PAWN and squares[slot] >> 3 in (0, 7)
+               for slot in slots):
+            results[index] = INVALID
+            continue
+        if is_attacked(squares[kings[not color]], color, squares, occupied,
+                       None):
+            results[index] = INVALID
+            continue
+        if (len(indexing.candidates[squares[0]]) > 1 and
+           encode(squares, color) != index):
+            # stored under a reflection
+            results[index] = INVALID
+            continue
+
+        own = 0
+        for slot in slots:
+            if colors[slot] == color:
+                own |= bitboards.SQUARE_BIT[squares[slot]]
+        moves = 0
+        children = set()
+        best_win = None
+        for slot in slots:
+            if colors[slot] != color:
+                continue
+            square = squares[slot]
+            piece_type = types[slot]
+            if piece_type == bitboards.PAWN:
+                forward = 8 if color == constants.WHITE else -8
+                targets = bitboards.PAWN_ATTACKS[color][square] & occupied & \
+                    ~own
+                if not occupied & bitboards.SQUARE_BIT[square + forward]:
+                    targets |= bitboards.SQUARE_BIT[square + forward]
+                    if (square >> 3 == (1 if color == constants.WHITE else 6)
+                       and not occupied &
+                       bitboards.SQUARE_BIT[square + 2 * forward]):
+                        targets |= bitboards.SQUARE_BIT[square + 2 * forward]
+            else:
+                targets = _attacks(piece_type, color, square, occupied) & ~own
+
+            for target in bitboards.iter_squares(targets):
+                captured = None
+                if occupied & bitboards.SQUARE_BIT[target]:
+                    captured = squares.index(target)
+                new_squares = list(squares)
+                new_squares[slot] = target
+                new_occupied = occupied ^ bitboards.SQUARE_BIT[square] | \
+                    bitboards.SQUARE_BIT[target]
+                king_square = target if slot == kings[color] else \
+                    squares[kings[color]]
+                if is_attacked(king_square, not color, new_squares,
+                               new_occupied, captured):
+                    continue
+                promoted = (piece_type == bitboards.PAWN and
+                            target >> 3 in (0, 7))
+                if captured is None and not promoted:
+                    children.add(encode(new_squares, not color))
+                    continue
+
+                # Leaves this table: look the result up in the smaller one
+                placed = [(colors[other], bitboards.QUEEN if
+                           other == slot and promoted else types[other],
+                           new_squares[other]) for other in slots if
+                          other != captured]
+                result, distance = tablebases.probe_pieces(placed,
+                                                           not color)
+                if result == LOSS:
+                    moves += 1
+                    if best_win is None or distance + 1 < best_win:
+                        best_win = distance + 1
+                elif result == WIN:
+                    exit_distances[index] = max(
+                        exit_distances.get(index, 0), distance + 1)
+                else:
+                    moves += 1
+
+        moves += len(children)
+        move_counts[index] = moves
+        if best_win is not None:
+            queue.setdefault(best_win, []).append((index, WIN))
+        elif not moves:
+            if index in exit_distances:
+                queue.setdefault(exit_distances[index], []).append(
+                    (index, LOSS))
+            elif is_attacked(squares[kings[color]], not color, squares,
+                             occupied, None):
+                queue.setdefault(0, []).append((index, LOSS))
+            else:
+                results[index] = DRAW
+
+    # Then work back from the settled positions in order of distance: the
+    # positions that can move into a loss are won, and the positions whose
+    # every move leads to a win for the opponent are lost.
+    distance = 0
+    while queue:
+        for index, result in queue.pop(distance, []):
+            if results[index] != _UNKNOWN:
+                continue
+            results[index] = result
+            distances[index] = min(distance, 255)
+
+            squares, color = indexing.decode(index)
+            mover = not color
+            occupied = 0
+            for square in squares:
+                occupied |= bitboards.SQUARE_BIT[square]
+            parents = set()
+            for slot in slots:
+                if colors[slot] != mover:
+                    continue
+                square = squares[slot]
+                piece_type = types[slot]
+                if piece_type == bitboards.PAWN:
+                    backward = -8 if mover == constants.WHITE else 8
+                    rank = square >> 3
+                    sources = 0
+                    if (rank != (1 if mover == constants.WHITE else 6) and
+                       not occupied & bitboards.SQUARE_BIT[square +
+                                                           backward]):
+                        sources = bitboards.SQUARE_BIT[square + backward]
+                        if (rank == (3 if mover == constants.WHITE else 4) and
+                           not occupied &
+                           bitboards.SQUARE_BIT[square + 2 * backward]):
+                            sources |= bitboards.SQUARE_BIT[
+                                square + 2 * backward]
+                else:
+                    sources = _attacks(piece_type, mover, square,
+                                       occupied) & ~occupied
+                for source in bitboards.iter_squares(sources):
+                    new_squares = list(squares)
+                    new_squares[slot] = source
+                    parents.add(encode(new_squares, mover))
+
+            for parent in parents:
+                if results[parent] != _UNKNOWN:
+                    continue
+                if result == LOSS:
+                    queue.setdefault(distance + 1, []).append((parent, WIN))
+                else:
+                    move_counts[parent] -= 1
+                    if not move_counts[parent]:
+                        queue.setdefault(
+                            max(distance + 1, exit_distances.get(parent, 0)),
+                            []).append((parent, LOSS))
+        distance += 1
+
+    # Whatever is still unsettled can't be won by either side
+    results = results.translate(bytearray(
+        [DRAW, WIN, LOSS, INVALID, DRAW] + [0] * 251))
+    packed = bytearray(size // 4)
+    for index in xrange(0, size, 4):
+        packed[index >> 2] = (results[index] | results[index + 1] << 2 |
+                              results[index + 2] << 4 |
+                              results[index + 3] << 6)
+
+    if not os.path.isdir(tablebases.directory):
+        os.makedirs(tablebases.directory)
+    with open(tablebases.get_filename(signature), "wb") as table_file:
+        table_file.write(HEADER.pack(MAGIC, signature))
+        table_file.write(packed)
+        table_file.write(distances)
+    # open the new file the next time it's asked for
+    tablebases._tables.pop(signature, None)
+
+    if verbose:
+        wins = results.count(chr(WIN))
+        losses = results.count(chr(LOSS))
+        invalid = results.count(chr(INVALID))
+        print ("%s: %i positions, %i wins, %i losses, %i draws, longest mate "
+               "%i plies, %.1fs" % (signature, size - invalid, wins, losses,
+                                    size - invalid - wins - losses,
+                                    max(distances), time.time() - start))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate endgame tables by retrograde analysis, or look "
+                    "a position up in them.")
+    parser.add_argument("signatures", nargs="*",
+                        help="material to generate, e.g. KQvK KRvK KPvK")
+    parser.add_argument("--directory", default="tablebases")
+    parser.add_argument("--probe", metavar="FEN",
+                        help="show the result and best move for a position")
+    parser.add_argument("--check", action="store_true",
+                        help="check positions the tables can't cover are "
+                             "never looked up")
+    args = parser.parse_args()
+
+    tablebases = Tablebases(args.directory)
+    for signature in args.signatures:
+        generate(signature, tablebases, verbose=True)
+
+    if args.check:
+        all_correct = True
+        for fen in UNCOVERED_FENS:
+            if tablebases.probe(games.Game.from_fen(fen)) is not None:
+                print "Looked up a position the tables can't cover: %s" % fen
+                all_correct = False
+        print "Checks %s" % ("ok" if all_correct else "FAILED")
+
+    if args.probe:
+        game = games.Game.from_fen(args.probe)
+        entry = tablebases.probe(game)
+        if entry is None:
+            print "Position not covered by the tables"
+            return
+        result, distance = entry
+        if result == INVALID:
+            print "Impossible position"
+            return
+        print "%s, %i plies to mate" % (
+            {DRAW: "Draw", WIN: "Win", LOSS: "Loss"}[result], distance)
+        move = tablebases.get_move(game)
+        if move:
+            print "Best move: %s to %s" % (move[0], move[1])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# std lib imports
+import time
+import argparse
+
+# local imports
+import constants
+import games
+import player
+
+# Moves a player is assumed to still have to make, whatever the game length
+MOVES_TO_GO = 30
+# Share of the increment spent on each move on top of the base allocation
+INCREMENT_SHARE = 0.75
+# Share of the budget after which no new iteration is started, as each one
+# takes longer than all those before it
+SOFT_SHARE = 0.5
+# A move may run over its budget up to this many times while an iteration
+# finishes, but never past this share of the time left
+HARD_FACTOR = 3
+HARD_SHARE = 0.5
+# Seconds kept back for overheads like drawing the board
+SAFETY_MARGIN = 0.05
+# Shortest budget ever handed out, in seconds
+MIN_TIME = 0.01
+
+
+class Clock(object):
+    """
+
+    Chess clock for both players: base seconds each, plus increment seconds
+    added after every move.
+
+    Only one side's clock runs at a time. A side that runs out of time is
+    recorded in flagged once its move is done, as a move can't be cut off
+    while a human is typing it.
+
+    """
+    def __init__(self, base, increment=0.0):
+        if base <= 0 or increment < 0:
+            raise ValueError('Not a valid time control')
+        self.base = base
+        self.increment = increment
+        self.remaining = {constants.WHITE: float(base),
+                          constants.BLACK: float(base)}
+        self.running = None
+        self.started = None
+        self.flagged = None
+
+    def __str__(self):
+        return "  ".join("%s %s" % (constants.COLOR_NAMES[color].title(),
+                                    format_time(self.get_remaining(color)))
+                         for color in (constants.WHITE, constants.BLACK))
+
+    def start(self, color):
+        """
+
+        Start the color's clock for its next move.
+
+        """
+        self.running = color
+        self.started = time.time()
+
+    def stop(self):
+        """
+
+        Stop the running clock, adding the increment unless its time ran out.
+        Returns the seconds the move took.
+
+        """
+        if self.running is None:
+            raise RuntimeError("The clock isn't running!")
+        elapsed = time.time() - self.started
+        color = self.running
+        self.remaining[color] -= elapsed
+        if self.remaining[color] < 0:
+            self.remaining[color] = 0.0
+            if self.flagged is None:
+                self.flagged = color
+        else:
+            self.remaining[color] += self.increment
+        self.running = None
+        self.started = None
+        return elapsed
+
+    def get_remaining(self, color):
+        """
+
+        Seconds the color has left, counting the move in progress.
+
+        """
+        remaining = self.remaining[color]
+        if color == self.running:
+            remaining -= time.time() - self.started
+        return max(remaining, 0.0)
+
+    def allocate(self, color):
+        """
+
+        Time budget for the color's move as (soft, hard) seconds. The search
+        shouldn't start another iteration after the soft limit, and has to
+        stop at the hard one.
+
+        """
+        return allocate(self.get_remaining(color), self.increment)
+
+
+def allocate(remaining, increment=0.0, moves_to_go=None):
+    """
+
+    Time budget as (soft, hard) seconds for a move with remaining seconds
+    left on the clock, and moves_to_go moves to make in them if the time
+    control says so.
+
+    """
+    remaining = max(remaining - SAFETY_MARGIN, 0.0)
+    budget = (remaining / (moves_to_go or MOVES_TO_GO) +
+              increment * INCREMENT_SHARE)
+    hard = min(budget * HARD_FACTOR, remaining * HARD_SHARE)
+    # with an increment, never plan on more than is left now
+    soft = max(min(budget * SOFT_SHARE, hard), MIN_TIME)
+    return soft, max(hard, MIN_TIME)
+
+
+def format_time(seconds):
+    """
+
+    Seconds as minutes:seconds, with tenths under a minute.
+
+    """
+    if seconds < 60:
+        return "0:%04.1f" % seconds
+    minutes, seconds = divmod(int(seconds), 60)
+    return "%i:%02i" % (minutes, seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Play a search player against a simulated human who "
+                    "thinks for a while and then plays the expected reply, "
+                    "with and without pondering, and compare the time spent "
+                    "and depth reached per move.")
+    parser.add_argument("--base", type=float, default=60.0,
+                        help="seconds on each clock")
+    parser.add_argument("--increment", type=float, default=1.0)
+    parser.add_argument("--think", type=float, default=2.0,
+                        help="seconds the human takes per move")
+    parser.add_argument("--moves", type=int, default=10)
+    args = parser.parse_args()
+
+    for ponder in False, True:
+        game = games.Game()
+        clock = Clock(args.base, args.increment)
+        computer = player.SearchComputer(game, constants.BLACK, clock=clock,
+                                         ponder=ponder)
+        depths = []
+        seconds = []
+        try:
+            for _ in xrange(args.moves):
+                clock.start(constants.WHITE)
+                time.sleep(args.think)
+                if computer.ponder_searcher:
+                    expected = computer.ponder_move
+                else:
+                    expected = computer.get_expected_reply()
+                move = (game.get_piece_at(expected[0]), expected[1])
+                clock.stop()
+                game.move_piece_to(move[0], move[1])
+                game.color_to_move = not game.color_to_move
+                game.check_endgame()
+
+                clock.start(constants.BLACK)
+                move = computer.get_move()
+                seconds.append(clock.stop())
+                depths.append(computer.depth_reached)
+                game.move_piece_to(move[0], move[1])
+                game.color_to_move = not game.color_to_move
+                game.check_endgame()
+                computer.ponder()
+        except games.EndGameException as e:
+            print e
+        computer.stop_pondering()
+        number_of_moves = float(max(len(depths), 1))
+        print ("Pondering %s: %i moves, average %.2fs and depth %.1f, %i "
+               "ponder hits, clock %s" % (
+                   "on" if ponder else "off", len(depths),
+                   sum(seconds) / number_of_moves,
+                   sum(depths) / number_of_moves, computer.ponder_hits,
+                   clock))
+
+if __name__ == "__main__":
+    main()
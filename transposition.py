@@ -0,0 +1,124 @@
+# std lib imports
+from array import array
+import ctypes
+import multiprocessing
+
+# local imports
+
+# Bound types for stored scores
+EXACT = 0
+LOWER = 1  # the real score is at least the stored one (beta cutoff)
+UPPER = 2  # the real score is at most the stored one (no move beat alpha)
+
+# Each entry is two unsigned 64-bit words: the key XORed with the data, and
+# the data. A half-written entry from another process then simply fails to
+# match its key. The data word holds, from the lowest bit:
+#   move: from square | to square << 6 | MOVE_FLAG (13 bits)
+#   depth (8 bits), bound (2 bits), search generation (6 bits)
+#   score + SCORE_OFFSET (21 bits)
+#
+# The words have to hold 64 bits. Python 2's array module has no 64-bit
+# type code where 'L' is only 32 bits (Windows and 32-bit builds), so
+# ctypes arrays are used there instead.
+WORD = 'L'
+ARRAY_HOLDS_WORDS = array(WORD).itemsize >= 8
+ENTRY_BYTES = 2 * ctypes.sizeof(ctypes.c_uint64)
+KEY_MASK = (1 << 64) - 1
+MOVE_FLAG = 1 << 12
+SCORE_OFFSET = 1 << 20
+
+
+class TranspositionTable(object):
+    """
+
+    Fixed-size hash table of search results keyed by the position's Zobrist
+    hash, so the search can reuse work across transpositions and iterations.
+
+    Entries are packed into flat arrays sized from the memory budget. Each
+    hash maps to a single slot, and a deeper result is never replaced by a
+    shallower one from the same search (depth-preferred replacement).
+
+    Pass shared=True to keep the table in shared memory, so searches in
+    processes forked after it was made all read and write the same table.
+
+    """
+    def __init__(self, size_mb=16, shared=False):
+        self.size = max(1, int(size_mb * 1024 * 1024) // ENTRY_BYTES)
+        self.shared = shared
+        self.generation = 0
+        self.clear()
+
+    def clear(self):
+        """
+
+        Forget every stored result.
+
+        """
+        if self.shared:
+            self.keys = multiprocessing.RawArray(ctypes.c_uint64, self.size)
+            self.data = multiprocessing.RawArray(ctypes.c_uint64, self.size)
+        elif ARRAY_HOLDS_WORDS:
+            self.keys = array(WORD, [0]) * self.size
+            self.data = array(WORD, [0]) * self.size
+        else:
+            self.keys = (ctypes.c_uint64 * self.size)()
+            self.data = (ctypes.c_uint64 * self.size)()
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def new_search(self):
+        """
+
+        Start a new search. Results from older searches can always be
+        replaced, however deep they were.
+
+        """
+        self.generation = (self.generation + 1) & 63
+
+    def probe(self, key):
+        """
+
+        Stored result for the position as (score, depth, bound, move), where
+        move is a (from_pos, to_pos) tuple or None. None if there's no result.
+
+        """
+        self.probes += 1
+        key &= KEY_MASK
+        index = key % self.size
+        data = self.data[index]
+        if self.keys[index] ^ data != key:
+            return None
+        self.hits += 1
+        move = data & 0x1fff
+        if move:
+            move = ((move & 7, (move >> 3) & 7),
+                    ((move >> 6) & 7, (move >> 9) & 7))
+        else:
+            move = None
+        return (((data >> 29) & 0x1fffff) - SCORE_OFFSET,
+                (data >> 13) & 0xff, (data >> 21) & 3, move)
+
+    def store(self, key, depth, score, bound, move=None):
+        """
+
+        Store a search result, unless it would replace a deeper result from
+        the current search. move is a (from_pos, to_pos) tuple or None.
+
+        """
+        key &= KEY_MASK
+        index = key % self.size
+        old_data = self.data[index]
+        if (self.keys[index] ^ old_data != key and
+           (old_data >> 23) & 63 == self.generation and
+           (old_data >> 13) & 0xff > depth):
+            return
+        self.stores += 1
+        data = (min(depth, 255) << 13 | bound << 21 | self.generation << 23 |
+                (score + SCORE_OFFSET) << 29)
+        if move:
+            from_pos, to_pos = move
+            data |= (MOVE_FLAG | from_pos[0] + 8 * from_pos[1] |
+                     (to_pos[0] + 8 * to_pos[1]) << 6)
+        self.data[index] = data
+        self.keys[index] = key ^ data
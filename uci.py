@@ -0,0 +1,350 @@
+# std lib imports
+import sys
+import time
+import argparse
+import threading
+import traceback
+import multiprocessing
+
+# local imports
+import constants
+import games
+import movetables
+import ordering
+import pieces
+import search
+import timecontrol
+import transposition
+import utility
+
+ENGINE_NAME = "chess"
+ENGINE_AUTHOR = "Hou GuoChen Gary"
+
+# Transposition table size limits offered to the GUI, in megabytes
+HASH_MB = 16
+MAX_HASH_MB = 1024
+
+# Sent as the best move when the side to move has none
+NULL_MOVE = "0000"
+
+
+def format_move(game, from_pos, to_pos):
+    """
+
+    A move in UCI's long algebraic notation, e.g. "e2e4", or "e7e8q" for a
+    pawn reaching the last rank (which always becomes a queen here).
+
+    """
+    move = utility.get_grid_pos(from_pos) + utility.get_grid_pos(to_pos)
+    piece = game.get_piece_at(from_pos)
+    if piece and piece.__class__ == pieces.Pawn and to_pos[1] in (0, 7):
+        move += "q"
+    return move
+
+
+def parse_move(game, text):
+    """
+
+    The (piece, pos) tuple for a move in UCI notation, for the side to move.
+    Raises ValueError if it isn't a legal move. Pawns only ever promote to
+    queens here.
+
+    """
+    if not len(text) in (4, 5) or len(text) == 5 and text[4] != "q":
+        raise ValueError('Not a valid move: %s' % text)
+    from_pos = movetables.POS_FOR_NAME.get(text[:2])
+    to_pos = movetables.POS_FOR_NAME.get(text[2:4])
+    piece = from_pos and game.get_piece_at(from_pos)
+    if (not piece or piece.color != game.color_to_move or
+       not (piece, to_pos) in game.get_valid_moves_for_piece(piece)):
+        raise ValueError('Not a valid move: %s' % text)
+    return piece, to_pos
+
+
+def format_score(score):
+    """
+
+    A search score as UCI reports it: "cp" and centipawns, or "mate" and the
+    number of moves to mate, negative if the engine is the one being mated.
+
+    """
+    if score > search.MATE_BOUND:
+        return "mate %i" % ((search.MATE - score + 1) // 2)
+    if score < -search.MATE_BOUND:
+        return "mate %i" % -((search.MATE + score) // 2)
+    return "cp %i" % score
+
+
+class Engine(object):
+    """
+
+    The engine side of the UCI protocol, reading commands from input_file
+    and writing replies to output_file.
+
+    One game, transposition table and move orderer are kept for as long as
+    the engine runs. A position that continues the last one (as a GUI sends
+    them during a game) is reached by taking back and playing only the moves
+    that differ, so the game's caches stay warm too.
+
+    Searches run in a background thread, so stop and isready are answered
+    while one is going on. Each completed iteration is reported as an info
+    line.
+
+    """
+    def __init__(self, input_file=sys.stdin, output_file=sys.stdout,
+                 hash_mb=HASH_MB, backend=constants.PIECE_LIST):
+        self.input_file = input_file
+        self.output_file = output_file
+        self.backend = backend
+        self.table = transposition.TranspositionTable(hash_mb)
+        self.orderer = ordering.MoveOrderer()
+        self.output_lock = threading.Lock()
+        self.search_thread = None
+        self.stop_flag = multiprocessing.RawValue('b', 0)
+        self.stop_event = threading.Event()
+        self.new_game()
+
+    def send(self, line):
+        """
+
+        Write a line to the GUI straight away.
+
+        """
+        with self.output_lock:
+            self.output_file.write(line + "\n")
+            self.output_file.flush()
+
+    def new_game(self, fen=None):
+        """
+
+        Start again from the starting position, or from fen.
+
+        """
+        if fen:
+            self.game = games.Game.from_fen(fen, self.backend)
+        else:
+            self.game = games.Game(self.backend)
+        self.fen = fen
+        self.moves = []
+        self.records = []
+
+    def set_position(self, fen, moves):
+        """
+
+        Set the game up at fen (None for the starting position) followed by
+        the moves in UCI notation. Moves shared with the current position
+        are kept rather than played again. Raises ValueError on an illegal
+        move, leaving the game at the position before it.
+
+        """
+        if fen != self.fen:
+            self.new_game(fen)
+        kept = 0
+        while (kept < len(self.moves) and kept < len(moves) and
+               self.moves[kept] == moves[kept]):
+            kept += 1
+        game = self.game
+        while len(self.moves) > kept:
+            game.unmake_move(self.records.pop())
+            game.color_to_move = not game.color_to_move
+            self.moves.pop()
+        for move in moves[kept:]:
+            piece, pos = parse_move(game, move)
+            self.records.append(game.make_move(piece, pos))
+            game.color_to_move = not game.color_to_move
+            self.moves.append(move)
+
+    def report(self, searcher):
+        """
+
+        Send an info line for an iteration the searcher has just completed.
+
+        """
+        elapsed = max(time.time() - self.search_started, 0.001)
+        game = self.game
+        pv = search.get_pv(game, self.table)
+        line = []
+        records = []
+        # moves are formatted as they're played, to spot promotions
+        for from_pos, to_pos in pv:
+            line.append(format_move(game, from_pos, to_pos))
+            records.append(game.make_move(game.get_piece_at(from_pos),
+                                          to_pos))
+            game.color_to_move = not game.color_to_move
+        for record in reversed(records):
+            game.unmake_move(record)
+            game.color_to_move = not game.color_to_move
+        self.send("info depth %i score %s nodes %i nps %i time %i pv %s" % (
+            searcher.depth_reached, format_score(searcher.best_score),
+            searcher.nodes, searcher.nodes / elapsed, elapsed * 1000,
+            " ".join(line)))
+
+    def go(self, tokens):
+        """
+
+        Start searching with the limits given by a go command's tokens.
+
+        """
+        options = {}
+        for index, token in enumerate(tokens[:-1]):
+            if token in ("depth", "nodes", "movetime", "wtime", "btime",
+                         "winc", "binc", "movestogo"):
+                try:
+                    options[token] = int(tokens[index + 1])
+                except ValueError:
+                    pass
+
+        max_time = soft_time = None
+        if "movetime" in options:
+            max_time = options["movetime"] / 1000.0
+        else:
+            prefix = "w" if self.game.color_to_move == constants.WHITE else "b"
+            if prefix + "time" in options:
+                soft_time, max_time = timecontrol.allocate(
+                    options[prefix + "time"] / 1000.0,
+                    options.get(prefix + "inc", 0) / 1000.0,
+                    options.get("movestogo"))
+        # With no limits at all, search until told to stop
+        infinite = ("infinite" in tokens or max_time is None and
+                    not "depth" in options and not "nodes" in options)
+
+        self.stop_flag.value = 0
+        self.stop_event.clear()
+        searcher = search.Searcher(self.game,
+                                   max_depth=options.get("depth", 64),
+                                   max_nodes=options.get("nodes"),
+                                   max_time=max_time, soft_time=soft_time,
+                                   table=self.table, orderer=self.orderer,
+                                   stop_flag=self.stop_flag,
+                                   report=self.report)
+        self.search_started = time.time()
+        self.search_thread = threading.Thread(target=self.run_search,
+                                              args=(searcher, infinite))
+        self.search_thread.daemon = True
+        self.search_thread.start()
+
+    def run_search(self, searcher, infinite):
+        """
+
+        Body of the search thread: search, then send the best move. After an
+        infinite search that ends by itself the best move has to wait for
+        stop. A search that fails is reported as an info string, and a
+        bestmove is still sent so the GUI isn't left waiting.
+
+        """
+        try:
+            move = searcher.search()
+        except Exception as e:
+            traceback.print_exc()
+            self.send("info string Search failed: %s" % e)
+            move = None
+        if infinite:
+            self.stop_event.wait()
+        if move:
+            self.send("bestmove " + format_move(self.game, move[0].pos,
+                                                move[1]))
+        else:
+            self.send("bestmove " + NULL_MOVE)
+
+    def stop(self):
+        """
+
+        Stop any search and wait for its best move to be sent.
+
+        """
+        if self.search_thread:
+            self.stop_flag.value = 1
+            self.stop_event.set()
+            self.search_thread.join()
+            self.search_thread = None
+
+    def handle(self, line):
+        """
+
+        Carry out one command. Returns False once it's time to quit.
+
+        """
+        tokens = line.split()
+        if not tokens:
+            return True
+        command = tokens[0]
+
+        if command == "uci":
+            self.send("id name %s" % ENGINE_NAME)
+            self.send("id author %s" % ENGINE_AUTHOR)
+            self.send("option name Hash type spin default %i min 1 max %i" %
+                      (HASH_MB, MAX_HASH_MB))
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.stop()
+            # setoption name Hash value <mb>
+            if (len(tokens) == 5 and tokens[1] == "name" and
+               tokens[2].lower() == "hash" and tokens[3] == "value"):
+                try:
+                    hash_mb = min(max(int(tokens[4]), 1), MAX_HASH_MB)
+                except ValueError:
+                    self.send("info string Not a valid hash size")
+                else:
+                    self.table = transposition.TranspositionTable(hash_mb)
+        elif command == "ucinewgame":
+            self.stop()
+            self.table.clear()
+            self.orderer.clear()
+            self.new_game()
+        elif command == "position":
+            self.stop()
+            if "moves" in tokens:
+                moves = tokens[tokens.index("moves") + 1:]
+                tokens = tokens[:tokens.index("moves")]
+            else:
+                moves = []
+            fen = None
+            if len(tokens) > 2 and tokens[1] == "fen":
+                fen = " ".join(tokens[2:])
+            try:
+                self.set_position(fen, moves)
+            except ValueError as e:
+                self.send("info string %s" % e)
+        elif command == "go":
+            self.stop()
+            self.go(tokens[1:])
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            self.stop()
+            return False
+        elif not command in ("debug", "register", "ponderhit"):
+            self.send("info string Unknown command: %s" % command)
+        return True
+
+    def run(self):
+        """
+
+        Answer commands until quit, or until the input ends.
+
+        """
+        try:
+            while True:
+                line = self.input_file.readline()
+                if not line or not self.handle(line):
+                    break
+        finally:
+            self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run as a UCI engine, reading commands on standard "
+                    "input, for GUIs, tournament managers and test "
+                    "harnesses.")
+    parser.add_argument("--hash-mb", type=int, default=HASH_MB)
+    parser.add_argument("--backend", default=constants.PIECE_LIST,
+                        choices=constants.BACKENDS)
+    args = parser.parse_args()
+
+    Engine(hash_mb=args.hash_mb, backend=args.backend).run()
+
+if __name__ == "__main__":
+    main()
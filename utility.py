@@ -1,6 +1,7 @@
 # std lib imports
 # local imports
 import constants
+import movetables
 
 
 def get_grid_pos(coordinate):
@@ -12,9 +13,7 @@ def get_grid_pos(coordinate):
         H8 => (7, 7)
 
         """
-        column = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
-        row = ['1', '2', '3', '4', '5', '6', '7', '8']
-        return (column[coordinate[0]] + row[coordinate[1]])
+        return movetables.SQUARE_NAMES[coordinate[0] + 8 * coordinate[1]]
 
 
 def get_coords_for_grid_ref(grid_ref):
@@ -24,13 +23,7 @@ def get_coords_for_grid_ref(grid_ref):
          H8 -> (7, 7)
 
     """
-    x_for_file = {"A": 0, "B": 1, "C": 2, "D": 3, "E": 4, "F": 5, "G": 6,
-                  "H": 7}
-    y_for_rank = {"1": 0, "2": 1, "3": 2, "4": 3, "5": 4, "6": 5, "7": 6,
-                  "8": 7}
-    file_letter = grid_ref[0]
-    rank_number = grid_ref[1]
-    return (x_for_file[file_letter], y_for_rank[rank_number])
+    return movetables.POS_FOR_NAME[grid_ref[:2]]
 
 
 def draw_game(game, selected_piece=None):
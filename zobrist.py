@@ -0,0 +1,79 @@
+# std lib imports
+import random
+
+# local imports
+import constants
+import pieces
+
+# ------------------------ Zobrist Keys --------------------------------------#
+
+# A position's hash is the XOR of one random 64-bit key per feature of the
+# position, so a move can update it by XORing the changed features in and
+# out. The keys are fixed so hashes are the same in every process.
+_random = random.Random(20150618)
+
+# Key for each piece class and color on each square (x + 8 * y)
+PIECE_KEYS = dict((piece_class,
+                   {constants.WHITE: [_random.getrandbits(64)
+                                      for square in xrange(64)],
+                    constants.BLACK: [_random.getrandbits(64)
+                                      for square in xrange(64)]})
+                  for piece_class in (pieces.King, pieces.Queen, pieces.Rook,
+                                      pieces.Bishop, pieces.Knight,
+                                      pieces.Pawn))
+
+# Castling rights, one bit each
+WHITE_QUEEN_SIDE = 1
+WHITE_KING_SIDE = 2
+BLACK_QUEEN_SIDE = 4
+BLACK_KING_SIDE = 8
+
+# Key for each combination of castling rights
+CASTLING_KEYS = [0] + [_random.getrandbits(64) for rights in xrange(1, 16)]
+
+# Key for the file of the en passant square
+EN_PASSANT_KEYS = [_random.getrandbits(64) for x in xrange(8)]
+
+# XORed in when black is to move
+SIDE_KEY = _random.getrandbits(64)
+
+
+def get_castling_rights(game):
+    """
+
+    Castling rights implied by which kings and rooks have moved, as a mask of
+    the side constants above.
+
+    """
+    rights = 0
+    sides = [(constants.WHITE, 0, WHITE_QUEEN_SIDE, WHITE_KING_SIDE),
+             (constants.BLACK, 7, BLACK_QUEEN_SIDE, BLACK_KING_SIDE)]
+    for color, y, queen_side, king_side in sides:
+        king = game.get_piece_at((4, y))
+        if (not king or king.__class__ != pieces.King or
+           king.color != color or king.has_moved):
+            continue
+        for x, side in (0, queen_side), (7, king_side):
+            rook = game.get_piece_at((x, y))
+            if (rook and rook.__class__ == pieces.Rook and
+               rook.color == color and not rook.has_moved):
+                rights |= side
+    return rights
+
+
+def get_hash(game):
+    """
+
+    Hash of the game's position worked out from scratch.
+
+    """
+    key = 0
+    for piece in game.get_pieces():
+        key ^= PIECE_KEYS[piece.__class__][piece.color][
+            piece.pos[0] + 8 * piece.pos[1]]
+    key ^= CASTLING_KEYS[get_castling_rights(game)]
+    if game.en_passant_pos:
+        key ^= EN_PASSANT_KEYS[game.en_passant_pos[0]]
+    if game.color_to_move == constants.BLACK:
+        key ^= SIDE_KEY
+    return key